@@ -0,0 +1,87 @@
+import time
+import atexit
+import logging
+import threading
+from datetime import datetime
+
+from auth_db import get_database
+
+# Write-behind login activity. A login only updates an in-memory entry per user; a background
+# thread writes the entries out every FLUSH_INTERVAL seconds as one batched UPDATE through the
+# writer thread, and once more when the process exits. A crash loses at most the last
+# FLUSH_INTERVAL seconds of activity, which is acceptable for last_login and login counts.
+# The users.last_login and users.login_count columns come from the schema of each page that
+# records logins.
+
+FLUSH_INTERVAL = 2.0
+
+logger = logging.getLogger(__name__)
+
+_registry_lock = threading.Lock()
+_logs = {}
+
+
+class ActivityLog:
+    def __init__(self, database):
+        self.database = database
+        self._lock = threading.Lock()
+        # user id -> [last login, logins since the last flush]
+        self._pending = {}
+        self._stats = {'recorded': 0, 'flushes': 0, 'rows_written': 0, 'flush_errors': 0}
+        threading.Thread(target=self._flush_loop, daemon=True, name='login-activity').start()
+        atexit.register(self.flush)
+
+    def record_login(self, user_id):
+        now = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        with self._lock:
+            entry = self._pending.setdefault(user_id, [now, 0])
+            entry[0] = now
+            entry[1] += 1
+            self._stats['recorded'] += 1
+
+    # Write out everything recorded so far in one executemany; entries are put back if the
+    # write fails so the next flush retries them
+    def flush(self):
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        if not pending:
+            return 0
+        rows = [(last_login, count, user_id) for user_id, (last_login, count) in pending.items()]
+        try:
+            self.database.submit(lambda conn: conn.executemany(
+                'UPDATE users SET last_login = ?, login_count = login_count + ? WHERE id = ?', rows
+            )).result()
+        except Exception:
+            with self._lock:
+                for user_id, (last_login, count) in pending.items():
+                    entry = self._pending.setdefault(user_id, [last_login, 0])
+                    entry[1] += count
+            raise
+        with self._lock:
+            self._stats['flushes'] += 1
+            self._stats['rows_written'] += len(rows)
+        return len(rows)
+
+    # A failed flush is logged and counted; its entries are retried next round
+    def _flush_loop(self):
+        while True:
+            time.sleep(FLUSH_INTERVAL)
+            try:
+                self.flush()
+            except Exception:
+                logger.exception("Saving login activity to %s failed", self.database.path)
+                with self._lock:
+                    self._stats['flush_errors'] += 1
+
+    def metrics(self):
+        with self._lock:
+            return {**self._stats, 'pending': len(self._pending)}
+
+
+# One log per database for the whole process, shared by every session
+def get_activity_log(database=None):
+    database = database or get_database()
+    with _registry_lock:
+        if database.path not in _logs:
+            _logs[database.path] = ActivityLog(database)
+        return _logs[database.path]
@@ -0,0 +1,68 @@
+import numpy as np
+
+from retirement_engine import PERCENTILES, plan_flows, roll_forward
+
+# Default capital market assumptions (annual, nominal): expected returns, volatilities and
+# correlation for a two-asset stock/bond portfolio
+ASSETS = ('stocks', 'bonds')
+EXPECTED_RETURNS = np.array([0.08, 0.04])
+VOLATILITIES = np.array([0.17, 0.06])
+CORRELATION = np.array([[1.0, 0.1],
+                        [0.1, 1.0]])
+COVARIANCE = np.outer(VOLATILITIES, VOLATILITIES) * CORRELATION
+
+
+# Stock weight moving linearly from `start_equity` today to `end_equity` at retirement and
+# held there afterwards; returns a (years x assets) weight matrix, one row per projection year
+def glide_path(current_age, retirement_age, n_years, start_equity=0.9, end_equity=0.4):
+    years_to_retirement = retirement_age - current_age
+    progress = np.clip(np.arange(n_years) / max(years_to_retirement, 1), 0, 1)
+    equity = start_equity + (end_equity - start_equity) * progress
+    return np.column_stack((equity, 1 - equity))
+
+
+def constant_mix(n_years, equity):
+    return np.tile([equity, 1 - equity], (n_years, 1))
+
+
+# Correlated annual asset returns, paths x years x assets, via the Cholesky factor of the
+# covariance matrix
+def draw_asset_returns(rng, n_paths, n_years, means=EXPECTED_RETURNS, covariance=COVARIANCE):
+    cholesky = np.linalg.cholesky(covariance)
+    shocks = rng.standard_normal((n_paths, n_years, len(means)))
+    return shocks @ cholesky.T + means
+
+
+# Compare allocation strategies in one engine call. `glide_paths` maps a name to its
+# (years x assets) weights. Portfolios are rebalanced to the target weights every year, so
+# each year's portfolio return is the weighted sum of that year's asset returns; every
+# strategy sees the same market paths.
+def compare_glide_paths(inputs, glide_paths, n_paths=2000, seed=0, means=EXPECTED_RETURNS,
+                        covariance=COVARIANCE, contributions=None):
+    years_to_retirement = max(inputs['retirement_age'] - inputs['current_age'], 0)
+    flows = plan_flows(inputs, contributions)
+    n_years = flows.size
+
+    names = list(glide_paths)
+    weights = np.stack([glide_paths[name] for name in names])
+    asset_returns = draw_asset_returns(np.random.default_rng(seed), n_paths, n_years, means, covariance)
+
+    # (strategies x years x assets) against (paths x years x assets) -> strategies x paths x years
+    portfolio_returns = np.einsum('gya,pya->gpy', weights, asset_returns)
+    growth = np.maximum(1 + portfolio_returns, 0).reshape(len(names) * n_paths, n_years)
+    balances, depleted_at = roll_forward(float(inputs['current_savings']), growth, flows,
+                                         floor_from=years_to_retirement)
+    balances = balances.reshape(len(names), n_paths, n_years + 1)
+    success = (depleted_at < 0).reshape(len(names), n_paths).mean(axis=1)
+
+    ages = list(range(inputs['current_age'], inputs['current_age'] + n_years + 1))
+    results = {}
+    for i, name in enumerate(names):
+        bands = np.percentile(balances[i], PERCENTILES, axis=0)
+        results[name] = {
+            'success_rate': float(success[i]),
+            'ages': ages,
+            'equity_share': weights[i, :, 0].tolist(),
+            'percentiles': {p: band.tolist() for p, band in zip(PERCENTILES, bands)},
+        }
+    return results
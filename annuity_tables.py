@@ -0,0 +1,114 @@
+import os
+import threading
+import numpy as np
+
+# Grids match the calculator sliders: returns 1-15% in 0.5 steps, inflation 0.5-5% in 0.1
+# steps, and whole-year horizons up to MAX_HORIZON
+RETURN_MIN, RETURN_MAX, RETURN_STEP = 1.0, 15.0, 0.5
+INFLATION_MIN, INFLATION_MAX, INFLATION_STEP = 0.5, 5.0, 0.1
+MAX_HORIZON = 80
+
+TABLE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "annuity_cache")
+RATE_TABLE = "rate_factors.npy"
+INFLATION_TABLE = "inflation_factors.npy"
+
+# Planes of the rate table
+GROWTH, FV_ANNUITY, PV_ANNUITY = 0, 1, 2
+
+_lock = threading.Lock()
+_tables = None
+
+
+def _grid(low, high, step):
+    return np.round(np.arange(low, high + step / 2, step), 6)
+
+
+# Closed-form factors for annual rates (in %) and whole-year horizons:
+# growth (1+r)^n, future value of 1/yr paid n times, present value of 1/yr for n years
+def rate_factors(rates, horizons):
+    r = np.asarray(rates, dtype=np.float64)[:, None] / 100
+    n = np.asarray(horizons, dtype=np.float64)[None, :]
+    growth = (1 + r) ** n
+    return np.stack([growth, (growth - 1) / r, (1 - 1 / growth) / r])
+
+
+def build_tables(table_dir=TABLE_DIR):
+    os.makedirs(table_dir, exist_ok=True)
+    horizons = np.arange(MAX_HORIZON + 1)
+    rate_table = rate_factors(_grid(RETURN_MIN, RETURN_MAX, RETURN_STEP), horizons)
+    inflation_table = rate_factors(_grid(INFLATION_MIN, INFLATION_MAX, INFLATION_STEP), horizons)[GROWTH]
+
+    # Write through temporary files so concurrent processes never map a partial table
+    for name, table in ((RATE_TABLE, rate_table), (INFLATION_TABLE, inflation_table)):
+        path = os.path.join(table_dir, name)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "wb") as f:
+            np.save(f, table)
+        os.replace(tmp_path, path)
+
+
+# Memory-map the tables once per process, building them on first use
+def load_tables(table_dir=TABLE_DIR):
+    global _tables
+    with _lock:
+        if _tables is None:
+            rate_path = os.path.join(table_dir, RATE_TABLE)
+            inflation_path = os.path.join(table_dir, INFLATION_TABLE)
+            if not (os.path.exists(rate_path) and os.path.exists(inflation_path)):
+                build_tables(table_dir)
+            _tables = (np.load(rate_path, mmap_mode='r'), np.load(inflation_path, mmap_mode='r'))
+    return _tables
+
+
+# Linear interpolation along the rate axis of a (rates x horizons) plane. Inputs outside the
+# grid fall back to the closed form, so callers never need to check the domain themselves.
+def _lookup(plane, rate, horizon, low, high, step, plane_index):
+    if not (low <= rate <= high) or not (0 <= horizon <= MAX_HORIZON):
+        return float(rate_factors([rate], [horizon])[plane_index, 0, 0])
+    position = (rate - low) / step
+    lo = min(int(np.floor(position + 1e-9)), plane.shape[0] - 1)
+    weight = position - lo
+    if weight < 1e-9:
+        return float(plane[lo, horizon])
+    return float(plane[lo, horizon] * (1 - weight) + plane[lo + 1, horizon] * weight)
+
+
+def return_factor(annual_return, horizon, plane=GROWTH):
+    rate_table, _ = load_tables()
+    return _lookup(rate_table[plane], annual_return, horizon, RETURN_MIN, RETURN_MAX, RETURN_STEP, plane)
+
+
+def inflation_factor(inflation_rate, horizon):
+    _, inflation_table = load_tables()
+    return _lookup(inflation_table, inflation_rate, horizon, INFLATION_MIN, INFLATION_MAX,
+                   INFLATION_STEP, GROWTH)
+
+
+# Headline numbers of calculate_retirement from table lookups and a few multiplications.
+# Savings last through retirement when the nest egg covers the present value of the
+# withdrawals over the retirement duration. A per-year `contributions` schedule is
+# compounded directly, since it does not reduce to a single annuity factor.
+def plan_summary(current_age, retirement_age, life_expectancy, current_savings,
+                 annual_contribution, annual_return, inflation_rate, desired_income,
+                 pension_income, social_security, contributions=None):
+    years_to_retirement = max(retirement_age - current_age, 0)
+    retirement_duration = max(life_expectancy - retirement_age, 0)
+
+    if contributions is None:
+        contributed = annual_contribution * return_factor(annual_return, years_to_retirement, FV_ANNUITY)
+    else:
+        compounding = (1 + annual_return / 100) ** np.arange(len(contributions) - 1, -1, -1)
+        contributed = float(np.dot(contributions, compounding))
+    retirement_savings = current_savings * return_factor(annual_return, years_to_retirement) + contributed
+    shortfall = (desired_income * inflation_factor(inflation_rate, years_to_retirement)
+                 - (pension_income + social_security))
+    required = shortfall * return_factor(annual_return, retirement_duration, PV_ANNUITY)
+
+    return {
+        'years_to_retirement': years_to_retirement,
+        'retirement_duration': retirement_duration,
+        'retirement_savings': retirement_savings,
+        'shortfall': shortfall,
+        'required_savings': max(required, 0.0),
+        'savings_last': shortfall <= 0 or retirement_savings >= required,
+    }
@@ -0,0 +1,504 @@
+import gc
+import os
+import re
+import sys
+import time
+import logging
+import queue
+import sqlite3
+import threading
+from concurrent.futures import Future
+from contextlib import contextmanager
+
+# Shared by the login and registration pages
+DB_PATH = 'capital_compass.db'
+# Connections kept open per database; more can be open at once under load, but only this
+# many are kept for reuse
+POOL_SIZE = 8
+# Prepared statements sqlite3 keeps per connection
+STATEMENT_CACHE_SIZE = 256
+
+# Connection settings, applied to every connection a Database opens; override per database
+# with get_database(path, pragmas={...}). In WAL mode readers work from a snapshot and never
+# wait for a writer, and with synchronous=NORMAL a commit appends to the WAL without an
+# fsync (the WAL is synced at checkpoints), so a crash can lose the last commits but never
+# corrupts the database.
+PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    # ms a connection waits on a lock before raising "database is locked"
+    'busy_timeout': 10000,
+    # bytes of the file memory-mapped for reads
+    'mmap_size': 256 * 2 ** 20,
+    # page cache per connection; negative values are KiB
+    'cache_size': -16 * 1024,
+    # Checkpoints run on the background thread below rather than inside whichever commit
+    # crosses SQLite's 1000-page default
+    'wal_autocheckpoint': 0,
+    # bytes the WAL file is truncated to after a checkpoint
+    'journal_size_limit': 64 * 2 ** 20,
+}
+# Seconds between background WAL checkpoints
+CHECKPOINT_INTERVAL = 5.0
+# WAL size past which the background checkpoint waits for readers and truncates the WAL
+WAL_TRUNCATE_BYTES = 64 * 2 ** 20
+# The writer thread commits queued writes together: a group closes once it holds this many
+# operations or this many seconds after its first one arrived, whichever comes first
+GROUP_COMMIT_SIZE = 100
+GROUP_COMMIT_INTERVAL = 0.005
+
+logger = logging.getLogger(__name__)
+
+_registry_lock = threading.Lock()
+_databases = {}
+
+
+# Connection whose execute() records whether the statement was seen before on this
+# connection, i.e. whether sqlite3's statement cache could serve it. Only the thread holding
+# the connection touches the counters.
+class _TrackedConnection(sqlite3.Connection):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.seen_statements = set()
+        self.statements_prepared = 0
+        self.statement_reuses = 0
+
+    def execute(self, sql, parameters=()):
+        self._track(sql)
+        return super().execute(sql, parameters)
+
+    def executemany(self, sql, parameters):
+        self._track(sql)
+        return super().executemany(sql, parameters)
+
+    def _track(self, sql):
+        if sql in self.seen_statements:
+            self.statement_reuses += 1
+        else:
+            self.statements_prepared += 1
+            if len(self.seen_statements) < STATEMENT_CACHE_SIZE:
+                self.seen_statements.add(sql)
+
+
+# Single writer thread for one database. Callers queue operations and get a Future back; the
+# thread drains the queue in groups and commits each group as one transaction, so a burst of
+# signups costs one commit (and one WAL sync at checkpoint time) per group rather than per
+# user, and writers never contend for the write lock among themselves. Each operation runs
+# inside its own savepoint: one that raises (e.g. an IntegrityError on a duplicate username)
+# is rolled back alone and its Future carries the exception, while the rest of the group
+# still commits. Futures resolve only after their group has committed.
+class WriteQueue:
+    def __init__(self, database):
+        self.database = database
+        self._queue = queue.Queue()
+        self._stats = {'operations': 0, 'groups': 0, 'failed': 0, 'largest_group': 0}
+        self._thread = threading.Thread(target=self._run, daemon=True, name=f'writer:{database.path}')
+        self._thread.start()
+
+    # Queue `operation(conn)`; the Future resolves to its return value or its exception
+    def submit(self, operation):
+        future = Future()
+        self._queue.put((operation, future))
+        return future
+
+    # Queue one statement; the Future resolves to the new row's lastrowid
+    def execute(self, sql, parameters=()):
+        return self.submit(lambda conn: conn.execute(sql, parameters).lastrowid)
+
+    def _next_group(self):
+        first = self._queue.get()
+        if first is None:
+            return None
+        group = [first]
+        deadline = time.perf_counter() + GROUP_COMMIT_INTERVAL
+        while len(group) < GROUP_COMMIT_SIZE:
+            remaining = deadline - time.perf_counter()
+            try:
+                item = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is None:
+                # Finish this group, then stop
+                self._queue.put(None)
+                break
+            group.append(item)
+        return group
+
+    def _run(self):
+        conn = self.database._connect()
+        # Transactions are managed explicitly below
+        conn.isolation_level = None
+        try:
+            while True:
+                group = self._next_group()
+                if group is None:
+                    return
+                self._commit(conn, group)
+        finally:
+            conn.close()
+
+    def _commit(self, conn, group):
+        results = []
+        try:
+            conn.execute('BEGIN IMMEDIATE')
+            for operation, future in group:
+                if not future.set_running_or_notify_cancel():
+                    continue
+                conn.execute('SAVEPOINT operation')
+                try:
+                    results.append((future, operation(conn), None))
+                    conn.execute('RELEASE operation')
+                except Exception as error:
+                    conn.execute('ROLLBACK TO operation')
+                    conn.execute('RELEASE operation')
+                    results.append((future, None, error))
+            conn.execute('COMMIT')
+        except Exception as error:
+            # The group as a whole failed to commit; none of it was written. Operations
+            # cancelled before they ran are left out of the counts.
+            if conn.in_transaction:
+                conn.rollback()
+            failed = 0
+            for operation, future in group:
+                if not future.done():
+                    future.set_exception(error)
+                    failed += 1
+            with self.database._lock:
+                self._stats['groups'] += 1
+                self._stats['failed'] += failed
+            return
+
+        for future, result, error in results:
+            if error is None:
+                future.set_result(result)
+            else:
+                future.set_exception(error)
+        with self.database._lock:
+            self._stats['groups'] += 1
+            self._stats['operations'] += len(results)
+            self._stats['failed'] += sum(error is not None for _, _, error in results)
+            self._stats['largest_group'] = max(self._stats['largest_group'], len(results))
+
+    def metrics(self):
+        with self.database._lock:
+            stats = dict(self._stats)
+        stats['queued'] = self._queue.qsize()
+        stats['average_group'] = stats['operations'] / stats['groups'] if stats['groups'] else 0.0
+        return stats
+
+    # Commit everything already queued, then stop the thread
+    def close(self):
+        self._queue.put(None)
+        self._thread.join()
+
+
+# Process-wide pool of connections to one SQLite file. Streamlit runs every rerun on a fresh
+# script thread, so connections are pooled rather than tied to a thread: a thread checks one
+# out for the duration of a `with db.connection()` block (nested blocks on the same thread
+# share it) and hands it back afterwards.
+class Database:
+    def __init__(self, path, pragmas=None):
+        self.path = path
+        self.pragmas = {**PRAGMAS, **(pragmas or {})}
+        self._lock = threading.Lock()
+        self._pool = []
+        self._open_connections = set()
+        self._local = threading.local()
+        self._schemas = set()
+        self._stats = {
+            'connections_opened': 0, 'connections_closed': 0, 'checkouts': 0, 'reuses': 0,
+            'statements_prepared': 0, 'statement_reuses': 0,
+            'checkpoints': 0, 'checkpoints_busy': 0, 'wal_pages_checkpointed': 0, 'wal_truncations': 0,
+        }
+        self._checkpointer = None
+        self._stop = threading.Event()
+        self._writer = None
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=self.pragmas['busy_timeout'] / 1000,
+                               check_same_thread=False, cached_statements=STATEMENT_CACHE_SIZE,
+                               factory=_TrackedConnection)
+        conn.execute('PRAGMA foreign_keys = ON')
+        for name, value in self.pragmas.items():
+            conn.execute(f'PRAGMA {name} = {value}')
+        return conn
+
+    def _open(self):
+        conn = self._connect()
+        with self._lock:
+            self._open_connections.add(conn)
+        self._start_checkpointer()
+        return conn
+
+    # The checkpoint thread starts with the first pooled connection or the writer thread,
+    # whichever comes first, so a process that only writes still checkpoints
+    def _start_checkpointer(self):
+        with self._lock:
+            start = self._checkpointer is None and self.pragmas['journal_mode'].upper() == 'WAL'
+            if start:
+                self._checkpointer = threading.Thread(target=self._checkpoint_loop, daemon=True,
+                                                      name=f'wal-checkpoint:{self.path}')
+        if start:
+            self._checkpointer.start()
+
+    # Copy committed WAL pages back into the database file every CHECKPOINT_INTERVAL seconds.
+    # PASSIVE checkpoints never wait: pages still needed by an open read snapshot are left for
+    # the next round. They also never reset the WAL while some reader is using it, so under
+    # a steady stream of reads it would only grow; once it passes WAL_TRUNCATE_BYTES a
+    # TRUNCATE checkpoint waits (up to busy_timeout) for the current readers to finish and
+    # starts the WAL over. The thread has its own connection, outside the pool.
+    def _checkpoint_loop(self):
+        conn = self._connect()
+        try:
+            while not self._stop.wait(CHECKPOINT_INTERVAL):
+                self.checkpoint(conn)
+                if self.wal_size() > WAL_TRUNCATE_BYTES:
+                    self.checkpoint(conn, 'TRUNCATE')
+        finally:
+            conn.close()
+
+    def wal_size(self):
+        try:
+            return os.path.getsize(self.path + '-wal')
+        except OSError:
+            return 0
+
+    def checkpoint(self, conn=None, mode='PASSIVE'):
+        if conn is None:
+            with self.connection() as pooled:
+                return self.checkpoint(pooled, mode)
+        try:
+            busy, _, checkpointed = conn.execute(f'PRAGMA wal_checkpoint({mode})').fetchone()
+        except sqlite3.OperationalError:
+            busy, checkpointed = 1, 0
+        with self._lock:
+            self._stats['checkpoints'] += 1
+            self._stats['checkpoints_busy'] += busy
+            self._stats['wal_pages_checkpointed'] += max(checkpointed, 0)
+            self._stats['wal_truncations'] += mode == 'TRUNCATE' and not busy
+        return not busy
+
+    # Check a connection out of the pool. The block commits on success and rolls back on an
+    # exception.
+    @contextmanager
+    def connection(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None:
+            yield conn
+            return
+
+        with self._lock:
+            self._stats['checkouts'] += 1
+            conn = self._pool.pop() if self._pool else None
+            if conn is None:
+                self._stats['connections_opened'] += 1
+            else:
+                self._stats['reuses'] += 1
+        if conn is None:
+            conn = self._open()
+
+        self._local.conn = conn
+        try:
+            with conn:
+                yield conn
+        finally:
+            self._local.conn = None
+            if conn.in_transaction:
+                conn.rollback()
+            with self._lock:
+                keep = len(self._pool) < POOL_SIZE
+                if keep:
+                    self._pool.append(conn)
+                else:
+                    # Keep the statement counts of connections that are closed
+                    self._open_connections.discard(conn)
+                    self._stats['connections_closed'] += 1
+                    self._stats['statements_prepared'] += conn.statements_prepared
+                    self._stats['statement_reuses'] += conn.statement_reuses
+            if not keep:
+                conn.close()
+
+    # The database's group-commit writer, started on first use
+    def writer(self):
+        with self._lock:
+            start = self._writer is None
+            if start:
+                self._writer = WriteQueue(self)
+            writer = self._writer
+        if start:
+            self._start_checkpointer()
+        return writer
+
+    # Queue a write for the writer thread; see WriteQueue.submit and WriteQueue.execute
+    def submit(self, operation):
+        return self.writer().submit(operation)
+
+    def write(self, sql, parameters=()):
+        return self.writer().execute(sql, parameters)
+
+    # Run a schema script once per process; reruns and other pages skip it. An ADD COLUMN for
+    # a column that already exists is skipped, so a script can carry its migrations and any
+    # number of processes can run it against the same file. A unique index that rows already
+    # in the table violate (e.g. usernames differing only in case, which a case-sensitive
+    # UNIQUE column allowed) is created as a plain index instead, with a warning, so the page
+    # still starts; drop it once the duplicates are resolved and the next start makes it unique.
+    def init_schema(self, script):
+        with self._lock:
+            if script in self._schemas:
+                return False
+        with self.connection() as conn:
+            for statement in script.split(';'):
+                if statement.strip():
+                    try:
+                        conn.execute(statement)
+                    except sqlite3.OperationalError as error:
+                        if not str(error).startswith('duplicate column name'):
+                            raise
+                    except sqlite3.IntegrityError as error:
+                        plain, unique = re.subn(r'\bCREATE\s+UNIQUE\s+INDEX\b', 'CREATE INDEX', statement,
+                                                count=1, flags=re.IGNORECASE)
+                        if not unique:
+                            raise
+                        logger.warning("Rows in %s violate a unique index (%s); created it as a plain "
+                                       "index instead", self.path, error)
+                        conn.execute(plain)
+        with self._lock:
+            self._schemas.add(script)
+        return True
+
+    def metrics(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats['pooled'] = len(self._pool)
+            stats['open_connections'] = len(self._open_connections)
+            for conn in self._open_connections:
+                stats['statements_prepared'] += conn.statements_prepared
+                stats['statement_reuses'] += conn.statement_reuses
+        stats['reuse_rate'] = stats['reuses'] / stats['checkouts'] if stats['checkouts'] else 0.0
+        statements = stats['statements_prepared'] + stats['statement_reuses']
+        stats['statement_reuse_rate'] = stats['statement_reuses'] / statements if statements else 0.0
+        return stats
+
+    # Commit queued writes, stop the checkpoint thread, checkpoint what is left and close the
+    # pooled connections
+    def close(self):
+        with self._lock:
+            writer, self._writer = self._writer, None
+        if writer is not None:
+            writer.close()
+        self._stop.set()
+        if self._checkpointer is not None:
+            self._checkpointer.join()
+        self._checkpointer, self._stop = None, threading.Event()
+        with self._lock:
+            pooled, self._pool = self._pool, []
+        if pooled and self.pragmas['journal_mode'].upper() == 'WAL':
+            self.checkpoint(pooled[0], 'TRUNCATE')
+        for conn in pooled:
+            with self._lock:
+                self._open_connections.discard(conn)
+                self._stats['connections_closed'] += 1
+                self._stats['statements_prepared'] += conn.statements_prepared
+                self._stats['statement_reuses'] += conn.statement_reuses
+            conn.close()
+
+
+# Columns named by a UNIQUE constraint failure, e.g. ['email'] for "UNIQUE constraint failed:
+# users.email"; None for any other integrity error
+def unique_violation(error):
+    prefix = 'UNIQUE constraint failed: '
+    message = str(error)
+    if not message.startswith(prefix):
+        return None
+    return [column.split('.')[-1] for column in message[len(prefix):].split(', ')]
+
+
+# Wait for a queued insert and report a UNIQUE constraint failure as a result rather than an
+# exception, so callers insert first and never check with a SELECT beforehand:
+#   {'created': True, 'value': <the operation's result>, 'conflict': None}
+#   {'created': False, 'value': None, 'conflict': 'email'}
+# Other errors propagate.
+def insert_result(future):
+    try:
+        return {'created': True, 'value': future.result(), 'conflict': None}
+    except sqlite3.IntegrityError as error:
+        columns = unique_violation(error)
+        if columns is None:
+            raise
+        return {'created': False, 'value': None, 'conflict': columns[0]}
+
+
+# One Database per file for the whole process; `pragmas` only applies when the call creates it
+def get_database(path=DB_PATH, pragmas=None):
+    with _registry_lock:
+        if path not in _databases:
+            _databases[path] = Database(path, pragmas)
+        return _databases[path]
+
+
+# Readers polling a table while a writer repeatedly holds an exclusive write transaction for
+# `hold` seconds. In WAL mode the readers keep reading the last committed snapshot, so their
+# worst wait stays far below `hold`; in rollback-journal mode ('DELETE') they queue behind
+# every write.
+def concurrency_check(path, journal_mode='WAL', readers=8, seconds=2.0, hold=0.05):
+    database = Database(path, {'journal_mode': journal_mode})
+    database.init_schema('CREATE TABLE IF NOT EXISTS concurrency_check (id INTEGER PRIMARY KEY, value TEXT)')
+    stop = threading.Event()
+    waits, errors, writes = [], [], [0]
+
+    def write():
+        while not stop.is_set():
+            with database.connection() as conn:
+                conn.execute('BEGIN EXCLUSIVE')
+                conn.execute('INSERT INTO concurrency_check (value) VALUES (?)', (str(time.time()),))
+                time.sleep(hold)
+                conn.commit()
+            writes[0] += 1
+
+    def read():
+        while not stop.is_set():
+            start = time.perf_counter()
+            try:
+                with database.connection() as conn:
+                    conn.execute('SELECT COUNT(*) FROM concurrency_check').fetchone()
+            except sqlite3.OperationalError as error:
+                errors.append(str(error))
+            waits.append(time.perf_counter() - start)
+            # Pace the readers like page loads so they measure lock waits, not GIL contention
+            time.sleep(0.001)
+
+    threads = [threading.Thread(target=write)] + [threading.Thread(target=read) for _ in range(readers)]
+    # Collect now, so a garbage-collection pause during the run is not mistaken for a lock wait
+    gc.collect()
+    for thread in threads:
+        thread.start()
+    time.sleep(seconds)
+    stop.set()
+    for thread in threads:
+        thread.join()
+    database.close()
+
+    waits.sort()
+    return {
+        'journal_mode': journal_mode,
+        'writes': writes[0],
+        'reads': len(waits),
+        'errors': len(errors),
+        'p50_wait': waits[len(waits) // 2],
+        'max_wait': waits[-1],
+        'hold': hold,
+    }
+
+
+if __name__ == "__main__":
+    import tempfile
+
+    with tempfile.TemporaryDirectory() as directory:
+        results = [concurrency_check(os.path.join(directory, f'{mode}.db'), mode) for mode in ('WAL', 'DELETE')]
+    for result in results:
+        print(f"{result['journal_mode']:>6}: {result['reads']:7,} reads, {result['writes']:3} writes, "
+              f"{result['errors']} errors, reader wait p50 {result['p50_wait'] * 1000:.2f} ms, "
+              f"max {result['max_wait'] * 1000:.2f} ms (writer holds {result['hold'] * 1000:.0f} ms)")
+    # Readers must never have waited out a writer's transaction
+    wal = results[0]
+    sys.exit(0 if wal['errors'] == 0 and wal['max_wait'] < wal['hold'] / 2 else 1)
@@ -0,0 +1,159 @@
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+import tracemalloc
+import numpy as np
+
+from retirement_engine import (
+    calculate_retirement, project_plans, required_contribution, run_monte_carlo
+)
+from annuity_tables import plan_summary
+
+# Performance regression checks for the retirement engine. Run `python benchmark_engine.py`
+# to compare against the saved baseline, or add --save to record a new one.
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "benchmark_baseline.json")
+# A case regresses when its time or peak memory grows by more than this share of the baseline
+DEFAULT_THRESHOLD = 0.25
+# Measurements below these are too noisy to flag, whatever their ratio
+MIN_SECONDS = 0.001
+MIN_PEAK_BYTES = 64 * 1024
+
+# Calculator defaults
+DEFAULT_INPUTS = {
+    'current_age': 35, 'retirement_age': 65, 'life_expectancy': 85, 'current_savings': 50000,
+    'annual_contribution': 10000, 'annual_return': 7.0, 'inflation_rate': 2.5,
+    'desired_income': 60000, 'pension_income': 0, 'social_security': 15000,
+}
+LONG_HORIZON_INPUTS = {**DEFAULT_INPUTS, 'current_age': 20, 'retirement_age': 70, 'life_expectancy': 110}
+
+
+# Random plans spread over the calculator's input ranges, as project_plans input arrays
+def random_plans(n, seed=0):
+    rng = np.random.default_rng(seed)
+    current_age = rng.integers(20, 71, n)
+    retirement_age = np.maximum(rng.integers(50, 81, n), current_age + 1)
+    return {
+        'current_age': current_age,
+        'retirement_age': retirement_age,
+        'life_expectancy': np.maximum(rng.integers(75, 101, n), retirement_age + 1),
+        'current_savings': rng.integers(0, 1000000, n),
+        'annual_contribution': rng.integers(0, 50000, n),
+        'annual_return': rng.integers(2, 31, n) / 2,
+        'inflation_rate': rng.integers(5, 51, n) / 10,
+        'desired_income': rng.integers(20000, 200000, n),
+        'pension_income': rng.integers(0, 30000, n),
+        'social_security': rng.integers(0, 40000, n),
+    }
+
+
+# name -> setup returning the call to time; setup work (input generation) is not measured
+CASES = {
+    'single_plan': lambda: lambda: calculate_retirement(**DEFAULT_INPUTS),
+    'single_plan_summary': lambda: lambda: plan_summary(**DEFAULT_INPUTS),
+    'batch_1k_plans': lambda: (lambda plans: lambda: project_plans(plans))(random_plans(1000)),
+    'batch_100k_plans': lambda: (lambda plans: lambda: project_plans(plans))(random_plans(100000)),
+    'monte_carlo_1k': lambda: lambda: run_monte_carlo(DEFAULT_INPUTS, n_paths=1000, seed=0),
+    'monte_carlo_10k': lambda: lambda: run_monte_carlo(DEFAULT_INPUTS, n_paths=10000, seed=0),
+    'monte_carlo_100k': lambda: lambda: run_monte_carlo(DEFAULT_INPUTS, n_paths=100000, seed=0),
+    'monte_carlo_100k_float32': lambda: lambda: run_monte_carlo(DEFAULT_INPUTS, n_paths=100000, seed=0,
+                                                                precision='float32'),
+    'monte_carlo_10k_guardrails': lambda: lambda: run_monte_carlo(DEFAULT_INPUTS, n_paths=10000, seed=0,
+                                                                  withdrawal_rule='guardrails'),
+    'long_horizon_plan': lambda: lambda: calculate_retirement(**LONG_HORIZON_INPUTS),
+    'long_horizon_monte_carlo_10k': lambda: lambda: run_monte_carlo(LONG_HORIZON_INPUTS, n_paths=10000, seed=0),
+    'goal_seek_deterministic': lambda: lambda: required_contribution(DEFAULT_INPUTS, volatility=0),
+    'goal_seek_monte_carlo_10k': lambda: lambda: required_contribution(DEFAULT_INPUTS, 0.9, n_paths=10000),
+}
+
+
+# Best wall time over `repeat` runs after a warm-up, then peak traced memory of one more run.
+# Memory is measured separately because tracemalloc slows allocation-heavy code down.
+def measure(call, repeat=5):
+    call()
+    best = np.inf
+    for _ in range(repeat):
+        start = time.perf_counter()
+        call()
+        best = min(best, time.perf_counter() - start)
+
+    tracemalloc.start()
+    try:
+        call()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return {'seconds': best, 'peak_bytes': peak}
+
+
+def run_benchmarks(names=None, repeat=5):
+    results = {}
+    for name, setup in CASES.items():
+        if names and not any(part in name for part in names):
+            continue
+        results[name] = measure(setup(), repeat)
+        print(f"{name:<30} {results[name]['seconds'] * 1000:10.2f} ms {results[name]['peak_bytes'] / 2 ** 20:10.1f} MiB")
+    return {
+        'meta': {
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'machine': platform.machine(),
+            'processor': platform.processor(),
+        },
+        'cases': results,
+    }
+
+
+# Cases whose time or peak memory grew by more than `threshold` against the baseline
+def compare(current, baseline, threshold=DEFAULT_THRESHOLD):
+    regressions = []
+    for name, result in current['cases'].items():
+        reference = baseline['cases'].get(name)
+        if reference is None:
+            continue
+        for metric, floor in (('seconds', MIN_SECONDS), ('peak_bytes', MIN_PEAK_BYTES)):
+            if result[metric] < floor:
+                continue
+            ratio = result[metric] / max(reference[metric], 1e-12)
+            if ratio > 1 + threshold:
+                regressions.append((name, metric, reference[metric], result[metric], ratio))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the retirement engine")
+    parser.add_argument('--save', action='store_true', help="record this run as the baseline")
+    parser.add_argument('--baseline', default=BASELINE_PATH, help="baseline JSON file")
+    parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD,
+                        help="allowed growth over the baseline, as a share (default %(default)s)")
+    parser.add_argument('--repeat', type=int, default=5, help="timed runs per case (best is kept)")
+    parser.add_argument('--only', nargs='*', help="run only cases whose name contains one of these")
+    args = parser.parse_args(argv)
+
+    current = run_benchmarks(args.only, args.repeat)
+
+    if args.save:
+        with open(args.baseline, 'w') as f:
+            json.dump(current, f, indent=2)
+        print(f"Saved baseline to {args.baseline}")
+        return 0
+
+    if not os.path.exists(args.baseline):
+        print(f"No baseline at {args.baseline}; run with --save to record one")
+        return 0
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+
+    regressions = compare(current, baseline, args.threshold)
+    for name, metric, before, after, ratio in regressions:
+        print(f"REGRESSION {name} {metric}: {before:.6g} -> {after:.6g} ({ratio:.2f}x)")
+    if not regressions:
+        print(f"No regressions beyond {args.threshold:.0%} of {args.baseline}")
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
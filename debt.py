@@ -0,0 +1,185 @@
+import numpy as np
+
+from retirement_engine import plan_flows, roll_forward
+
+# Debt-free cash flow beyond this is not modelled (100 years of monthly payments)
+MAX_MONTHS = 1200
+
+# Which debt receives the payments left over once every minimum is met:
+#   avalanche - highest interest rate first
+#   snowball  - smallest balance first
+#   minimums  - none; the leftover is invested instead of paying debt down early
+PAYOFF_ORDERS = ('avalanche', 'snowball', 'minimums')
+# Share of the balance repaid each month by default_minimum, on top of the interest
+MINIMUM_PRINCIPAL_SHARE = 0.01
+
+
+def _monthly_rate(annual_rate):
+    return np.asarray(annual_rate, dtype=np.float64) / 1200
+
+
+# Level monthly payment that retires `principal` over `months` at `annual_rate` (%);
+# vectorized over loans
+def monthly_payment(principal, annual_rate, months):
+    r = _monthly_rate(annual_rate)
+    principal = np.asarray(principal, dtype=np.float64)
+    months = np.asarray(months, dtype=np.float64)
+    safe_r = np.where(r > 0, r, 1.0)
+    return np.where(r > 0, principal * safe_r / -np.expm1(-months * np.log1p(safe_r)), principal / months)
+
+
+# Card-style minimum payment: the month's interest plus 1% of the balance, rounded up to
+# whole dollars, so the debt always shrinks. Used for debts entered without a minimum.
+def default_minimum(balance, annual_rate):
+    return float(np.ceil(balance * (_monthly_rate(annual_rate) + MINIMUM_PRINCIPAL_SHARE)))
+
+
+# Balance left after t monthly payments, in closed form:
+#   B(t) = B(0) (1 + r)^t - payment ((1 + r)^t - 1) / r
+# floored at zero once the loan is repaid. Broadcasts, e.g. loans[:, None] against months.
+def balance_after(principal, annual_rate, payment, t):
+    r = _monthly_rate(annual_rate)
+    growth = (1 + r) ** t
+    safe_r = np.where(r > 0, r, 1.0)
+    annuity = np.where(r > 0, (growth - 1) / safe_r, t)
+    return np.maximum(principal * growth - payment * annuity, 0.0)
+
+
+# Months (fractional) until the loan is repaid; infinite when the payment does not cover the
+# interest
+def months_to_payoff(principal, annual_rate, payment):
+    r = _monthly_rate(annual_rate)
+    principal = np.asarray(principal, dtype=np.float64)
+    payment = np.asarray(payment, dtype=np.float64)
+    covers = payment > principal * r
+    with np.errstate(divide='ignore', invalid='ignore'):
+        n = np.where(r > 0, -np.log1p(-r * principal / payment) / np.log1p(r), principal / payment)
+    return np.where(principal <= 0, 0.0, np.where(covers, n, np.inf))
+
+
+# Payments, interest and principal per month recovered from a balance schedule
+# (debts x months + 1); the payment is whatever brings the balance from one month to the next
+def _schedule(balance, annual_rate):
+    r = _monthly_rate(annual_rate)[:, None]
+    interest = balance[:, :-1] * r
+    payment = balance[:, :-1] + interest - balance[:, 1:]
+    return {
+        'balance': balance,
+        'payment': payment,
+        'interest': interest,
+        'principal': payment - interest,
+    }
+
+
+# Full amortization schedule of one or more loans with a level payment (from `months`, or
+# given directly as `payment`) plus an `extra` monthly prepayment. Every month of every loan
+# comes from the closed form in one array expression.
+def amortization_schedule(principal, annual_rate, months=None, payment=None, extra=0.0):
+    principal = np.atleast_1d(np.asarray(principal, dtype=np.float64))
+    annual_rate = np.broadcast_to(np.asarray(annual_rate, dtype=np.float64), principal.shape)
+    if payment is None:
+        if months is None:
+            raise ValueError("Give either the loan term in months or the monthly payment")
+        payment = monthly_payment(principal, annual_rate, months)
+    payment = np.broadcast_to(np.asarray(payment, dtype=np.float64) + extra, principal.shape)
+
+    payoff = months_to_payoff(principal, annual_rate, payment)
+    if not np.isfinite(payoff).all() or payoff.max() > MAX_MONTHS:
+        raise ValueError("The payment does not repay the loan within the modelled horizon")
+    horizon = int(np.ceil(payoff.max() - 1e-9))
+    balance = balance_after(principal[:, None], annual_rate[:, None], payment[:, None], np.arange(horizon + 1))
+
+    schedule = _schedule(balance, annual_rate)
+    schedule['payoff_month'] = np.ceil(payoff - 1e-9).astype(int)
+    schedule['total_interest'] = schedule['interest'].sum(axis=1)
+    return schedule
+
+
+# Pay several debts from a fixed monthly budget. Every debt gets its minimum payment and the
+# rest of the budget goes to the first unpaid debt in payoff order; when a debt is repaid its
+# payment rolls over to the next one. Payments are constant between payoffs, so the schedule
+# is built from closed-form segments, one per payoff event rather than one per month. Money
+# left over in the month a debt is repaid is not redirected until the following month.
+# `debts` is a list of dicts with 'name', 'balance', 'rate' (annual %) and 'minimum' (monthly).
+def payoff_plan(debts, monthly_budget, order='avalanche'):
+    if order not in PAYOFF_ORDERS:
+        raise ValueError(f"Unknown payoff order {order!r}; expected one of {PAYOFF_ORDERS}")
+    balance = np.array([float(debt['balance']) for debt in debts])
+    rate = np.array([float(debt['rate']) for debt in debts])
+    minimum = np.array([float(debt['minimum']) for debt in debts])
+    if minimum.sum() > monthly_budget + 1e-9:
+        raise ValueError("The monthly budget does not cover the minimum payments")
+
+    if order == 'avalanche':
+        priority = np.lexsort((balance, -rate))
+    else:
+        priority = np.lexsort((-rate, balance))
+
+    segments = [balance[:, None]]
+    month = 0
+    alive = balance > 0
+    while alive.any():
+        payment = np.where(alive, minimum, 0.0)
+        if order != 'minimums':
+            target = priority[alive[priority]][0]
+            payment[target] += monthly_budget - payment.sum()
+
+        payoff = months_to_payoff(balance, rate, payment)[alive]
+        step = int(np.ceil(payoff.min() - 1e-9)) if np.isfinite(payoff.min()) else MAX_MONTHS + 1
+        if month + step > MAX_MONTHS:
+            raise ValueError("The debts are not repaid within the modelled horizon")
+
+        segment = balance_after(balance[:, None], rate[:, None], payment[:, None], np.arange(1, step + 1))
+        segments.append(segment)
+        balance = segment[:, -1]
+        # Round off cents left by floating point so a repaid debt stays repaid
+        balance[balance < 0.005] = 0.0
+        alive = balance > 0
+        month += step
+
+    schedule = _schedule(np.concatenate(segments, axis=1), rate)
+    repaid = schedule['balance'] <= 0
+    schedule['names'] = [debt['name'] for debt in debts]
+    schedule['payoff_month'] = np.where(repaid.any(axis=1), repaid.argmax(axis=1), 0)
+    schedule['total_interest'] = schedule['interest'].sum(axis=1)
+    schedule['months'] = month
+    return schedule
+
+
+# Debt payments summed per projection year, padded or cut to n_years
+def annual_payments(schedule, n_years):
+    monthly = schedule['payment'].sum(axis=0)
+    monthly = np.pad(monthly, (0, max(n_years * 12 - monthly.size, 0)))[:n_years * 12]
+    return monthly.reshape(n_years, 12).sum(axis=1)
+
+
+# Evaluate debt payoff orders jointly with the retirement plan. Until retirement the whole
+# debt budget is set aside each month: what the debts do not take is added to the retirement
+# contributions. Debt still owed after retirement is paid out of savings. All orders are
+# projected in one roll_forward batch, one row per order, at the plan's expected return.
+def compare_payoff_strategies(inputs, debts, monthly_budget, orders=PAYOFF_ORDERS, contributions=None):
+    years_to_retirement = max(inputs['retirement_age'] - inputs['current_age'], 0)
+    base_flows = plan_flows(inputs, contributions)
+    n_years = base_flows.size
+
+    schedules = [payoff_plan(debts, monthly_budget, order) for order in orders]
+    paid = np.stack([annual_payments(schedule, n_years) for schedule in schedules])
+    budget = np.where(np.arange(n_years) < years_to_retirement, monthly_budget * 12, 0.0)
+    flows = base_flows + budget - paid
+
+    growth = np.full((len(orders), n_years), 1 + inputs['annual_return'] / 100)
+    balances, depleted_at = roll_forward(float(inputs['current_savings']), growth, flows,
+                                         floor_from=years_to_retirement)
+
+    results = {}
+    for i, (order, schedule) in enumerate(zip(orders, schedules)):
+        results[order] = {
+            'payoff_month': dict(zip(schedule['names'], schedule['payoff_month'].tolist())),
+            'debt_free_month': schedule['months'],
+            'total_interest': float(schedule['total_interest'].sum()),
+            'debt_balance': schedule['balance'].sum(axis=0)[::12].tolist(),
+            'savings': balances[i].tolist(),
+            'retirement_savings': float(balances[i, years_to_retirement]),
+            'savings_last': bool(depleted_at[i] < 0),
+        }
+    return results
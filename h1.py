@@ -4,6 +4,24 @@ import numpy as np
 import plotly.express as px
 import plotly.graph_objects as go
 from datetime import datetime, date
+from concurrent.futures import Future, ThreadPoolExecutor
+from threading import Event
+from retirement_engine import (
+    SimulationCancelled, calculate_retirement, contribution_schedule, plan_fingerprint, plan_flows,
+    run_monte_carlo
+)
+from annuity_tables import plan_summary
+from tax_accounts import WITHDRAWAL_ORDERS, simulate_accounts
+from social_security import evaluate_claiming_ages
+from allocation import compare_glide_paths, constant_mix, glide_path
+from debt import compare_payoff_strategies, default_minimum
+from withdrawal_rules import WITHDRAWAL_RULES
+from mortality import MAX_PLANNING_AGE, SEXES, survival_curve, survival_weighted_outcomes
+import plan_cache
+from saved_plans import delete_plan, list_plans, load_plan, save_plan
+from retirement_report import (
+    RECOMMENDATIONS_ON_TRACK, RECOMMENDATIONS_SHORTFALL, request_report, report_status
+)
 
 # Set page configuration
 st.set_page_config(
@@ -54,148 +72,415 @@ st.markdown("""
 st.markdown('<h1 class="main-header">💰 Retirement Planning Calculator</h1>', unsafe_allow_html=True)
 st.write("Plan your retirement with this interactive calculator. Adjust the inputs in the sidebar to see how different factors affect your retirement savings.")
 
+# Debts offered in the sidebar: (label, widget key prefix, default interest rate %)
+DEBT_TYPES = (("Mortgage", "mortgage", 6.5), ("Auto Loan", "auto_loan", 7.0), ("Credit Card", "credit_card", 22.0))
+WITHDRAWAL_RULE_LABELS = {
+    None: "Fixed withdrawal",
+    'guardrails': "Guardrails (cut or raise 10% outside ±20% of the initial rate)",
+    'floor_ceiling': "Floor and ceiling (share of balance, 90%-120% of initial spending)",
+}
+PAYOFF_LABELS = {
+    'avalanche': "Avalanche (highest rate first)",
+    'snowball': "Snowball (smallest balance first)",
+    'minimums': "Minimums only, invest the rest",
+}
+
+# Sidebar widgets whose values make up a saved plan; each widget's key is its variable name
+# (debt widgets are keyed by their prefix and field)
+PLAN_WIDGETS = (
+    'current_age', 'retirement_age', 'life_expectancy', 'use_life_table', 'sex',
+    'current_savings', 'annual_contribution', 'salary', 'salary_growth', 'employer_match',
+    'match_cap', 'catch_up', 'annual_return', 'inflation_rate', 'tax_aware', 'pretax_share',
+    'roth_share', 'withdrawal_order', 'desired_income', 'pension_income', 'social_security',
+    'pia', 'has_spouse', 'spouse_pia', 'spouse_age', 'compare_allocations', 'start_equity',
+    'end_equity', 'run_simulation', 'volatility', 'n_paths', 'compact_paths', 'withdrawal_rule', 'plan_debts',
+    'extra_payment', *(f"{prefix}_{field}" for _, prefix, _ in DEBT_TYPES for field in ('balance', 'rate', 'minimum')),
+)
+# Optional sections of a computed plan, None when their option is off; plans saved before a
+# section existed are reopened with it empty
+PLAN_SECTIONS = ('longevity', 'accounts', 'claiming', 'allocations', 'debts', 'simulation')
+
 # Sidebar for user inputs
 with st.sidebar:
     st.header("Personal Information")
     
     # User inputs
-    current_age = st.slider("Current Age", 20, 70, 35)
-    retirement_age = st.slider("Desired Retirement Age", 50, 80, 65)
-    life_expectancy = st.slider("Life Expectancy", 75, 100, 85)
+    current_age = st.slider("Current Age", 20, 70, 35, key="current_age")
+    retirement_age = st.slider("Desired Retirement Age", 50, 80, 65, key="retirement_age")
+    life_expectancy = st.slider("Life Expectancy", 75, 100, 85, key="life_expectancy")
+    use_life_table = st.checkbox("Account for longevity risk (life table)", value=False,
+                                 key="use_life_table",
+                                 help="Weights outcomes by the chance of living to each age instead of a single life expectancy")
+    sex = st.selectbox("Sex (for life table)", SEXES, index=2, disabled=not use_life_table, key="sex")
     
     st.header("Financial Information")
     
-    current_savings = st.number_input("Current Retirement Savings ($)", min_value=0, value=50000, step=1000)
-    annual_contribution = st.number_input("Annual Contribution ($)", min_value=0, value=10000, step=1000)
-    annual_return = st.slider("Expected Annual Return (%)", 1.0, 15.0, 7.0, step=0.5)
-    inflation_rate = st.slider("Expected Inflation Rate (%)", 0.5, 5.0, 2.5, step=0.1)
+    current_savings = st.number_input("Current Retirement Savings ($)", min_value=0, value=50000, step=1000, key="current_savings")
+    annual_contribution = st.number_input("Annual Contribution ($)", min_value=0, value=10000, step=1000, key="annual_contribution")
+    with st.expander("Contribution Schedule"):
+        salary = st.number_input("Annual Salary ($)", min_value=0, value=0, step=5000,
+                                 help="Needed for employer matching", key="salary")
+        salary_growth = st.slider("Salary Growth (%)", 0.0, 10.0, 0.0, step=0.5,
+                                  help="Your contribution grows in line with your salary", key="salary_growth")
+        employer_match = st.slider("Employer Match (% of your contribution)", 0, 200, 0, step=25, key="employer_match")
+        match_cap = st.slider("Match Cap (% of salary)", 0.0, 10.0, 0.0, step=0.5, key="match_cap")
+        catch_up = st.number_input("Catch-up Contribution from Age 50 ($)", min_value=0, value=0, step=500, key="catch_up")
+    annual_return = st.slider("Expected Annual Return (%)", 1.0, 15.0, 7.0, step=0.5, key="annual_return")
+    inflation_rate = st.slider("Expected Inflation Rate (%)", 0.5, 5.0, 2.5, step=0.1, key="inflation_rate")
+    
+    with st.expander("Account Types"):
+        tax_aware = st.checkbox("Tax-aware projection", value=False, key="tax_aware")
+        pretax_share = st.slider("Pre-tax share of savings (%)", 0, 100, 100, step=5, disabled=not tax_aware, key="pretax_share")
+        roth_share = st.slider("Roth share of savings (%)", 0, 100, 0, step=5, disabled=not tax_aware, key="roth_share")
+        roth_share = min(roth_share, 100 - pretax_share)
+        st.caption(f"Taxable account: {100 - pretax_share - roth_share}% of savings and contributions")
+        withdrawal_order = st.selectbox(
+            "Withdrawal Order", list(WITHDRAWAL_ORDERS), disabled=not tax_aware, key="withdrawal_order",
+            format_func=lambda order: " → ".join(kind.title() for kind in WITHDRAWAL_ORDERS[order])
+        )
     
     st.header("Retirement Income")
     
-    desired_income = st.number_input("Desired Annual Retirement Income (Today's $)", min_value=0, value=60000, step=5000)
-    pension_income = st.number_input("Expected Annual Pension Income ($)", min_value=0, value=0, step=1000)
-    social_security = st.number_input("Expected Annual Social Security ($)", min_value=0, value=15000, step=1000)
+    desired_income = st.number_input("Desired Annual Retirement Income (Today's $)", min_value=0, value=60000, step=5000, key="desired_income")
+    pension_income = st.number_input("Expected Annual Pension Income ($)", min_value=0, value=0, step=1000, key="pension_income")
+    social_security = st.number_input("Expected Annual Social Security ($)", min_value=0, value=15000, step=1000, key="social_security")
+    with st.expander("Social Security Claiming Age"):
+        pia = st.number_input("Benefit at Full Retirement Age ($/yr)", min_value=0, value=0, step=1000,
+                              help="Your primary insurance amount; set it to compare claiming ages 62-70", key="pia")
+        has_spouse = st.checkbox("Include spouse", value=False, disabled=pia == 0, key="has_spouse")
+        spouse_pia = st.number_input("Spouse Benefit at Full Retirement Age ($/yr)", min_value=0, value=0,
+                                     step=1000, disabled=not has_spouse, key="spouse_pia")
+        spouse_age = st.slider("Spouse Current Age", 20, 90, 35, disabled=not has_spouse, key="spouse_age")
+    
+    with st.expander("Asset Allocation"):
+        compare_allocations = st.checkbox("Compare allocation strategies", value=False, key="compare_allocations")
+        start_equity = st.slider("Stocks Today (%)", 0, 100, 90, step=5, disabled=not compare_allocations, key="start_equity")
+        end_equity = st.slider("Stocks at Retirement (%)", 0, 100, 40, step=5, disabled=not compare_allocations, key="end_equity")
+    
+    with st.expander("Debt Payoff"):
+        plan_debts = st.checkbox("Plan debt payoff", value=False, key="plan_debts")
+        debts = []
+        for label, prefix, default_rate in DEBT_TYPES:
+            st.markdown(f"**{label}**")
+            balance = st.number_input("Balance ($)", min_value=0, value=0, step=1000, disabled=not plan_debts,
+                                      key=f"{prefix}_balance")
+            rate = st.number_input("Interest Rate (%)", min_value=0.0, max_value=40.0, value=default_rate,
+                                   step=0.25, disabled=not plan_debts, key=f"{prefix}_rate")
+            minimum = st.number_input("Minimum Payment ($/month)", min_value=0, value=0, step=50,
+                                      disabled=not plan_debts, key=f"{prefix}_minimum",
+                                      help="Leave at 0 to use the month's interest plus 1% of the balance")
+            if balance > 0:
+                minimum = minimum or default_minimum(balance, rate)
+                if minimum <= balance * rate / 1200:
+                    st.warning(f"The {label.lower()} minimum does not cover its interest, so it is never "
+                               "repaid on minimum payments alone.")
+                debts.append({'name': label, 'balance': balance, 'rate': rate, 'minimum': minimum})
+        extra_payment = st.number_input("Extra Payment ($/month)", min_value=0, value=0, step=50,
+                                        disabled=not plan_debts, key="extra_payment",
+                                        help="Paid on top of the minimums; redirected to savings once debt-free")
+    
+    st.header("Market Simulation")
+    
+    run_simulation = st.checkbox("Run Monte Carlo simulation", value=False, key="run_simulation")
+    volatility = st.slider("Annual Return Volatility (%)", 5.0, 25.0, 15.0, step=0.5, disabled=not run_simulation, key="volatility")
+    n_paths = st.select_slider("Number of Simulations", options=[1000, 10000, 50000, 100000], value=10000,
+                               disabled=not run_simulation, key="n_paths")
+    withdrawal_rule = st.selectbox("Withdrawal Rule", [None, *WITHDRAWAL_RULES], format_func=WITHDRAWAL_RULE_LABELS.get,
+                                   disabled=not run_simulation, key="withdrawal_rule",
+                                   help="Adjusts each year's withdrawal to how the portfolio has done")
+    compact_paths = st.checkbox("Compact path storage (float32)", value=False, disabled=not run_simulation,
+                                help="Halves simulation memory with negligible effect on the results", key="compact_paths")
     
     # Calculate button
-    calculate = st.button("Calculate Retirement Plan", type="primary")
+    calculate = st.button("Calculate Retirement Plan", type="primary") or st.session_state.pop("recalculate", False)
 
-# Main calculation function
-def calculate_retirement(current_age, retirement_age, life_expectancy, current_savings, 
-                         annual_contribution, annual_return, inflation_rate, desired_income, 
-                         pension_income, social_security):
-    
-    # Calculate years until retirement and retirement duration
-    years_to_retirement = retirement_age - current_age
-    retirement_duration = life_expectancy - retirement_age
-    
-    # Initialize lists for results
-    years = []
-    ages = []
-    savings = []
-    contributions = []
-    growth = []
-    inflation_adjusted_savings = []
-    retirement_income_needed = []
-    
-    # Calculate savings growth until retirement
-    savings_balance = current_savings
-    for year in range(years_to_retirement + 1):
-        age = current_age + year
-        years.append(year)
-        ages.append(age)
-        
-        if year == 0:
-            contributions.append(0)
-            growth.append(0)
+# Report for the plan on screen, if one has been requested
+def current_report(fingerprint):
+    key = st.session_state.get("report_key")
+    return key if key == fingerprint else None
+
+def report_building(key):
+    if not key:
+        return False
+    _, path, error = report_status(key)
+    return path is None and error is None
+
+# Printable report, built in the background. While a build runs the panel re-renders on a
+# timer without rerunning the whole page; starting or finishing a build reruns the page
+# once, to switch the timer on or off.
+def report_panel(fingerprint, inputs, results):
+    polling = report_building(current_report(fingerprint))
+    st.fragment(run_every=0.5 if polling else None)(report_body)(fingerprint, inputs, results, polling)
+
+def report_body(fingerprint, inputs, results, polling):
+    key = current_report(fingerprint)
+    if st.button("Generate PDF Report"):
+        key = request_report(fingerprint, inputs, results)
+        st.session_state.report_key = key
+    if report_building(key) != polling:
+        st.rerun()
+    if not key:
+        return
+    
+    progress, path, error = report_status(key)
+    if error:
+        st.error(f"Report generation failed: {error}")
+    elif path:
+        with open(path, "rb") as f:
+            st.download_button("Download PDF Report", f.read(), file_name="retirement_plan.pdf",
+                               mime="application/pdf")
+    else:
+        st.progress(progress, text="Building report...")
+
+# Shared pool for Monte Carlo runs, so a long simulation never holds the script thread
+@st.cache_resource
+def simulation_executor():
+    return ThreadPoolExecutor(max_workers=2, thread_name_prefix="simulation")
+
+# Stop a simulation that no longer matches the inputs on screen
+def cancel_simulation(plan):
+    job = plan.get('simulation')
+    if job is not None:
+        job['cancel'].set()
+
+# Job for a run that already finished, e.g. one served from a cache or a saved plan
+def finished_simulation(summary):
+    future = Future()
+    future.set_result(summary)
+    return {'future': future, 'cancel': Event(), 'partial': {'summary': summary}}
+
+def start_simulation(key, inputs, simulation, contributions):
+    # A finished run for the same plan is served from the shared cache
+    summary = plan_cache.get(key)
+    if summary is not None:
+        return finished_simulation(summary)
+    
+    cancel = Event()
+    # Latest provisional summary published by the background run
+    partial = {'summary': None}
+    survival = None
+    if simulation['life_table']:
+        # Sampled death ages replace the fixed life expectancy, so project to the end of the table
+        survival = survival_curve(inputs['current_age'], simulation['life_table'])
+        inputs = {**inputs, 'life_expectancy': MAX_PLANNING_AGE}
+    future = simulation_executor().submit(
+        run_monte_carlo, inputs, n_paths=simulation['n_paths'],
+        volatility=simulation['volatility'], precision=simulation['precision'], cancel=cancel,
+        survival=survival, contributions=contributions, withdrawal_rule=simulation['withdrawal_rule'],
+        on_partial=lambda summary: partial.update(summary=summary)
+    )
+    future.add_done_callback(
+        lambda done: plan_cache.put(key, done.result()) if not done.cancelled() and done.exception() is None else None
+    )
+    return {'future': future, 'cancel': cancel, 'partial': partial}
+
+def render_simulation(summary):
+    low, high = summary['success_interval']
+    col1, col2, col3 = st.columns(3)
+    with col1:
+        st.metric("Probability of Success", f"{summary['success_rate']:.1%}")
+    with col2:
+        st.metric("95% Confidence Interval", f"{low:.1%} – {high:.1%}")
+    if 'expected_unfunded_years' in summary:
+        with col3:
+            st.metric("Expected Unfunded Years", f"{summary['expected_unfunded_years']:.1f}")
+    
+    bands = summary['percentiles']
+    fig = go.Figure()
+    fig.add_trace(go.Scatter(x=summary['ages'], y=bands[95], mode='lines', line=dict(width=0), showlegend=False))
+    fig.add_trace(go.Scatter(x=summary['ages'], y=bands[5], mode='lines', line=dict(width=0), fill='tonexty',
+                             name='5th-95th Percentile'))
+    fig.add_trace(go.Scatter(x=summary['ages'], y=bands[75], mode='lines', line=dict(width=0), showlegend=False))
+    fig.add_trace(go.Scatter(x=summary['ages'], y=bands[25], mode='lines', line=dict(width=0), fill='tonexty',
+                             name='25th-75th Percentile'))
+    fig.add_trace(go.Scatter(x=summary['ages'], y=bands[50], mode='lines', name='Median', line=dict(width=3)))
+    fig.update_layout(
+        title=f"Simulated Savings Balance ({summary['n_paths']:,} paths)",
+        xaxis_title='Age',
+        yaxis_title='Amount ($)',
+        hovermode='x unified',
+        height=500
+    )
+    st.plotly_chart(fig, use_container_width=True)
+
+# Target-date glide path against holding either end of it constant, in one engine call
+def allocation_strategies(inputs, contributions):
+    n_years = plan_flows(inputs, contributions).size
+    glide_paths = {
+        f"Glide path {start_equity}% → {end_equity}% stocks": glide_path(
+            inputs['current_age'], inputs['retirement_age'], n_years, start_equity / 100, end_equity / 100),
+        f"Constant {start_equity}% stocks": constant_mix(n_years, start_equity / 100),
+        f"Constant {end_equity}% stocks": constant_mix(n_years, end_equity / 100),
+    }
+    return compare_glide_paths(inputs, glide_paths, contributions=contributions)
+
+def simulation_running(job):
+    return not job['future'].done()
+
+# Monte Carlo results: shows provisional numbers as soon as the first chunk lands and
+# re-renders on a timer until the final summary is in, then reruns the page once to stop
+def simulation_panel(job):
+    polling = simulation_running(job)
+    st.fragment(run_every=0.2 if polling else None)(simulation_body)(job, polling)
+
+def simulation_body(job, polling):
+    if simulation_running(job) != polling:
+        st.rerun()
+    future = job['future']
+    summary = job['partial']['summary']
+    if future.done():
+        try:
+            summary = future.result()
+        except SimulationCancelled:
+            st.info("Simulation was cancelled because the inputs changed.")
+            return
+    
+    if summary is None:
+        st.info("Running Monte Carlo simulation...")
+    else:
+        if not summary['complete']:
+            st.progress(summary['n_paths'] / summary['target_paths'],
+                        text=f"Provisional results from {summary['n_paths']:,} of "
+                             f"{summary['target_paths']:,} simulations")
+        render_simulation(summary)
+
+inputs = {
+    'current_age': current_age, 'retirement_age': retirement_age,
+    'life_expectancy': life_expectancy, 'current_savings': current_savings,
+    'annual_contribution': annual_contribution, 'annual_return': annual_return,
+    'inflation_rate': inflation_rate, 'desired_income': desired_income,
+    'pension_income': pension_income, 'social_security': social_security,
+}
+account_split = {'pretax': pretax_share / 100, 'roth': roth_share / 100,
+                 'taxable': (100 - pretax_share - roth_share) / 100}
+claiming = {'pia': pia, 'spouse_pia': spouse_pia if has_spouse else None,
+            'spouse_age': spouse_age if has_spouse else None}
+allocation = {'compare_allocations': compare_allocations, 'start_equity': start_equity,
+              'end_equity': end_equity}
+taxes = {'tax_aware': tax_aware, 'split': account_split, 'order': withdrawal_order}
+schedule = {'salary': salary, 'salary_growth': salary_growth, 'employer_match': employer_match,
+            'match_cap': match_cap, 'catch_up': catch_up}
+simulation = {'run_simulation': run_simulation, 'volatility': volatility, 'n_paths': n_paths,
+              'precision': 'float32' if compact_paths else 'float64',
+              'life_table': sex if use_life_table else None, 'withdrawal_rule': withdrawal_rule}
+debt_plan = {'plan_debts': plan_debts, 'debts': debts, 'extra_payment': extra_payment}
+# The deterministic sections and the Monte Carlo run are cached under separate keys, so a
+# change to the simulation settings alone still finds the projection in the cache
+projection_params = {**inputs, **schedule, **taxes, **claiming, **allocation, **debt_plan,
+                     'use_life_table': use_life_table, 'sex': sex}
+fingerprint = plan_fingerprint({**projection_params, **simulation})
+projection_key = plan_fingerprint(projection_params)
+simulation_key = f"{plan_fingerprint({**inputs, **schedule, **simulation})}:monte_carlo"
+contributions = contribution_schedule(current_age, retirement_age, annual_contribution, **schedule)
+
+# Payoff orders compared jointly with the retirement plan, on a monthly budget of the
+# minimum payments plus the extra payment
+def debt_strategies(inputs, contributions):
+    budget = sum(debt['minimum'] for debt in debts) + extra_payment
+    try:
+        return compare_payoff_strategies(inputs, debts, budget, contributions=contributions)
+    except ValueError as e:
+        return {'error': str(e)}
+
+# Computed plans live in session state and are only thrown away when the inputs change
+plan = st.session_state.get("plan")
+inputs_changed = plan is not None and plan['fingerprint'] != fingerprint
+if inputs_changed:
+    cancel_simulation(plan)
+    del st.session_state["plan"]
+    plan = None
+
+# Everything except the Monte Carlo run, which streams its own partial results
+def compute_plan():
+    return {
+        'results': calculate_retirement(**inputs, contributions=contributions),
+        'longevity': survival_weighted_outcomes(inputs, sex, contributions) if use_life_table else None,
+        'accounts': simulate_accounts(
+            inputs, {kind: current_savings * share for kind, share in account_split.items()},
+            contributions=contributions, contribution_split=account_split, order=withdrawal_order
+        ) if tax_aware else None,
+        'claiming': evaluate_claiming_ages(
+            inputs, **claiming, sex=sex, contributions=contributions
+        ) if pia > 0 else None,
+        'allocations': allocation_strategies(inputs, contributions) if compare_allocations else None,
+        'debts': debt_strategies(inputs, contributions) if plan_debts and debts else None,
+    }
+
+if calculate and plan is None:
+    # Identical plans computed by any user or process are answered from the shared cache
+    plan = {
+        'fingerprint': fingerprint,
+        **plan_cache.cached(projection_key, compute_plan),
+        'simulation': start_simulation(simulation_key, inputs, simulation, contributions)
+                      if run_simulation else None,
+    }
+    st.session_state.plan = plan
+
+# A reopened plan that was saved before its simulation finished runs it again
+if plan is not None and run_simulation and plan['simulation'] is None:
+    plan['simulation'] = start_simulation(simulation_key, inputs, simulation, contributions)
+
+# Saved plans for a signed-in user (see login4.py). Reopening restores the inputs and the
+# saved outputs, so nothing is recomputed unless the plan predates the current engine.
+# Inputs and sections added since a plan was saved take their defaults.
+def open_saved_plan(user_id, plan_id):
+    saved = load_plan(user_id, plan_id)
+    if saved is None:
+        return
+    current = st.session_state.pop("plan", None)
+    if current is not None:
+        cancel_simulation(current)
+    for key in PLAN_WIDGETS:
+        if key in saved['inputs']:
+            st.session_state[key] = saved['inputs'][key]
         else:
-            # Calculate investment growth
-            investment_growth = savings_balance * (annual_return / 100)
-            growth.append(investment_growth)
-            
-            # Add contribution at the beginning of the year
-            savings_balance += annual_contribution
-            contributions.append(annual_contribution)
-            
-            # Add investment growth
-            savings_balance += investment_growth
-        
-        savings.append(savings_balance)
-        
-        # Calculate inflation-adjusted savings
-        inflation_adjusted = savings_balance / ((1 + inflation_rate/100) ** year)
-        inflation_adjusted_savings.append(inflation_adjusted)
-        
-        # Calculate retirement income needed in future dollars
-        future_income_needed = desired_income * ((1 + inflation_rate/100) ** year)
-        retirement_income_needed.append(future_income_needed)
-    
-    # Calculate retirement phase
-    retirement_savings = savings_balance
-    annual_retirement_income = pension_income + social_security
-    shortfall = retirement_income_needed[-1] - annual_retirement_income
-    
-    # Calculate if savings will last through retirement
-    savings_last = True
-    retirement_years = []
-    retirement_ages = []
-    retirement_savings_balance = []
-    retirement_withdrawals = []
-    
-    for year in range(retirement_duration + 1):
-        retirement_year = year
-        age = retirement_age + year
-        retirement_years.append(retirement_year)
-        retirement_ages.append(age)
+            st.session_state.pop(key, None)
+    
+    outputs = saved['outputs']
+    if outputs is None:
+        st.session_state.recalculate = True
+        return
+    outputs = {**dict.fromkeys(PLAN_SECTIONS), **outputs}
+    summary = outputs.pop('simulation')
+    st.session_state.plan = {'fingerprint': saved['fingerprint'], **outputs,
+                             'simulation': finished_simulation(summary) if summary else None}
+
+# Everything needed to reopen a plan; an unfinished simulation is left out and rerun on reopening
+def plan_outputs(plan):
+    outputs = {key: value for key, value in plan.items() if key not in ('fingerprint', 'simulation')}
+    job = plan['simulation']
+    done = job is not None and job['future'].done() and not job['cancel'].is_set()
+    outputs['simulation'] = job['future'].result() if done else None
+    return outputs
+
+user_id = st.session_state.get("user_id") if st.session_state.get("logged_in") else None
+if user_id is not None:
+    with st.sidebar:
+        st.header("Saved Plans")
         
-        if year == 0:
-            balance = retirement_savings
-            withdrawal = 0
-        else:
-            # Calculate investment growth
-            investment_growth = balance * (annual_return / 100)
-            
-            # Withdraw shortfall amount
-            withdrawal = shortfall
-            balance -= withdrawal
-            balance += investment_growth
-            
-            # Check if savings are depleted
-            if balance < 0:
-                balance = 0
-                savings_last = False
+        plan_name = st.text_input("Plan Name", value="My Plan")
+        if st.button("Save Plan", disabled=plan is None or not plan_name.strip()):
+            save_plan(user_id, plan_name.strip(), fingerprint,
+                      {key: st.session_state[key] for key in PLAN_WIDGETS}, plan_outputs(plan))
+            st.success(f"Saved \"{plan_name.strip()}\"")
         
-        retirement_savings_balance.append(balance)
-        retirement_withdrawals.append(withdrawal)
-    
-    # Create results dictionary
-    results = {
-        'years': years,
-        'ages': ages,
-        'savings': savings,
-        'contributions': contributions,
-        'growth': growth,
-        'inflation_adjusted_savings': inflation_adjusted_savings,
-        'retirement_income_needed': retirement_income_needed,
-        'retirement_years': retirement_years,
-        'retirement_ages': retirement_ages,
-        'retirement_savings_balance': retirement_savings_balance,
-        'retirement_withdrawals': retirement_withdrawals,
-        'retirement_savings': retirement_savings,
-        'shortfall': shortfall,
-        'savings_last': savings_last,
-        'retirement_duration': retirement_duration
-    }
-    
-    return results
+        saved_plans = {saved['id']: saved for saved in list_plans(user_id)}
+        if saved_plans:
+            plan_id = st.selectbox(
+                "Your Plans", list(saved_plans),
+                format_func=lambda plan_id: f"{saved_plans[plan_id]['name']} · "
+                                            f"{datetime.fromtimestamp(saved_plans[plan_id]['updated_at']):%b %d, %Y}"
+                                            + ("" if saved_plans[plan_id]['current'] else " (will recalculate)")
+            )
+            col1, col2 = st.columns(2)
+            with col1:
+                st.button("Open Plan", on_click=open_saved_plan, args=(user_id, plan_id))
+            with col2:
+                st.button("Delete Plan", on_click=delete_plan, args=(user_id, plan_id))
 
-# Display results if calculate button is clicked
-if calculate:
-    # Calculate retirement plan
-    results = calculate_retirement(
-        current_age, retirement_age, life_expectancy, current_savings,
-        annual_contribution, annual_return, inflation_rate, desired_income,
-        pension_income, social_security
-    )
+# Display results for the current plan
+if plan is not None:
+    results = plan['results']
     
     # Display summary
     st.markdown('<div class="highlight">', unsafe_allow_html=True)
@@ -216,10 +501,22 @@ if calculate:
         st.metric("Savings Status", status)
         st.metric("Monthly Shortfall in Retirement", f"${results['shortfall']/12:,.0f}")
     
+    longevity = plan['longevity']
+    if longevity is not None:
+        col1, col2, col3 = st.columns(3)
+        with col1:
+            st.metric("Probability of Outliving Savings", f"{longevity['probability_of_ruin']:.1%}")
+        with col2:
+            st.metric("Expected Unfunded Years", f"{longevity['expected_unfunded_years']:.1f}")
+        with col3:
+            st.metric("Chance of Living Past Life Expectancy", f"{longevity['probability_outlive_expectancy']:.0%}")
+    
     st.markdown('</div>', unsafe_allow_html=True)
     
     # Create tabs for different visualizations
-    tab1, tab2, tab3 = st.tabs(["Savings Growth", "Retirement Projection", "Detailed Analysis"])
+    tab1, tab2, tab3, tab4, tab5, tab6, tab7, tab8 = st.tabs(["Savings Growth", "Retirement Projection",
+                                                              "Detailed Analysis", "Monte Carlo", "Tax-Aware Accounts",
+                                                              "Social Security", "Asset Allocation", "Debt Payoff"])
     
     with tab1:
         # Create savings growth chart
@@ -307,26 +604,170 @@ if calculate:
             df_post['Annual Withdrawal'] = df_post['Annual Withdrawal'].apply(lambda x: f"${x:,.0f}")
             st.dataframe(df_post.set_index('Age'), use_container_width=True)
     
+    with tab4:
+        st.subheader("Monte Carlo Simulation")
+        
+        if plan['simulation'] is not None:
+            simulation_panel(plan['simulation'])
+        else:
+            st.write("Enable the Monte Carlo simulation in the sidebar to see a range of market outcomes.")
+    
+    with tab5:
+        st.subheader("Taxable, Pre-Tax and Roth Accounts")
+        
+        accounts = plan['accounts']
+        if accounts is not None:
+            depleted_at = int(accounts['depleted_at'][0])
+            col1, col2 = st.columns(2)
+            with col1:
+                st.metric("Lifetime Income Tax", f"${accounts['lifetime_taxes']:,.0f}")
+            with col2:
+                st.metric("After-Tax Savings Status",
+                          "✅ Sufficient" if depleted_at < 0 else f"❌ Runs out at age {current_age + depleted_at}")
+            
+            fig = go.Figure()
+            for kind, balance in accounts['balances'].items():
+                fig.add_trace(go.Scatter(x=accounts['ages'], y=balance[0], mode='lines', name=kind.title(),
+                                         stackgroup='accounts'))
+            fig.update_layout(
+                title='Account Balances',
+                xaxis_title='Age',
+                yaxis_title='Amount ($)',
+                hovermode='x unified',
+                height=500
+            )
+            st.plotly_chart(fig, use_container_width=True)
+        else:
+            st.write("Enable the tax-aware projection in the sidebar to split savings across account types.")
+    
+    with tab6:
+        st.subheader("Social Security Claiming Age")
+        
+        claiming_results = plan['claiming']
+        if claiming_results is not None:
+            best_success = claiming_results['best_by_success']
+            best_income = claiming_results['best_by_income']
+            
+            def describe(scenario):
+                if scenario['spouse_claim_age'] is None:
+                    return f"Age {scenario['claim_age']}"
+                return f"Ages {scenario['claim_age']} / {scenario['spouse_claim_age']}"
+            
+            col1, col2 = st.columns(2)
+            with col1:
+                st.metric("Best for Plan Success", describe(best_success),
+                          f"{best_success['success_rate']:.1%} success")
+            with col2:
+                st.metric("Best for Lifetime Income", describe(best_income),
+                          f"${best_income['lifetime_income']:,.0f} expected")
+            
+            df_claiming = pd.DataFrame(claiming_results['scenarios']).rename(columns={
+                'claim_age': 'Claiming Age', 'spouse_claim_age': 'Spouse Claiming Age',
+                'success_rate': 'Success Probability', 'lifetime_income': 'Lifetime Real Benefits'
+            })
+            if claiming['spouse_pia'] is None:
+                df_claiming = df_claiming.drop(columns='Spouse Claiming Age')
+            df_claiming['Success Probability'] = df_claiming['Success Probability'].apply(lambda x: f"{x:.1%}")
+            df_claiming['Lifetime Real Benefits'] = df_claiming['Lifetime Real Benefits'].apply(lambda x: f"${x:,.0f}")
+            st.dataframe(df_claiming, use_container_width=True, hide_index=True)
+        else:
+            st.write("Enter your benefit at full retirement age in the sidebar to compare claiming ages.")
+    
+    with tab7:
+        st.subheader("Asset Allocation Strategies")
+        
+        allocations = plan['allocations']
+        if allocations is not None:
+            columns = st.columns(len(allocations))
+            for column, (name, outcome) in zip(columns, allocations.items()):
+                with column:
+                    st.metric(name, f"{outcome['success_rate']:.1%}", "probability of success", delta_color="off")
+            
+            fig = go.Figure()
+            for name, outcome in allocations.items():
+                fig.add_trace(go.Scatter(x=outcome['ages'], y=outcome['percentiles'][50], mode='lines',
+                                         name=name, line=dict(width=3)))
+            fig.update_layout(
+                title='Median Savings Balance by Strategy',
+                xaxis_title='Age',
+                yaxis_title='Amount ($)',
+                hovermode='x unified',
+                height=500
+            )
+            st.plotly_chart(fig, use_container_width=True)
+        else:
+            st.write("Enable the allocation comparison in the sidebar to compare stock/bond glide paths.")
+    
+    with tab8:
+        st.subheader("Debt Payoff Strategies")
+        
+        strategies = plan['debts']
+        if strategies is None:
+            st.write("Enter your debts under Debt Payoff in the sidebar to compare payoff strategies.")
+        elif 'error' in strategies:
+            st.warning(strategies['error'])
+        else:
+            columns = st.columns(len(strategies))
+            for column, (order, outcome) in zip(columns, strategies.items()):
+                years, months = divmod(outcome['debt_free_month'], 12)
+                with column:
+                    st.markdown(f"**{PAYOFF_LABELS[order]}**")
+                    st.metric("Debt-Free In", f"{years} yr {months} mo")
+                    st.metric("Total Interest", f"${outcome['total_interest']:,.0f}")
+                    st.metric("Savings at Retirement", f"${outcome['retirement_savings']:,.0f}")
+            
+            fig = go.Figure()
+            for order, outcome in strategies.items():
+                debt_ages = current_age + np.arange(len(outcome['debt_balance']))
+                fig.add_trace(go.Scatter(x=debt_ages, y=outcome['debt_balance'], mode='lines',
+                                         name=f"Debt – {PAYOFF_LABELS[order]}", line=dict(dash='dot')))
+                fig.add_trace(go.Scatter(x=current_age + np.arange(len(outcome['savings'])), y=outcome['savings'],
+                                         mode='lines', name=f"Savings – {PAYOFF_LABELS[order]}", line=dict(width=3)))
+            fig.update_layout(
+                title='Debt Balance and Retirement Savings by Strategy',
+                xaxis_title='Age',
+                yaxis_title='Amount ($)',
+                hovermode='x unified',
+                height=500
+            )
+            st.plotly_chart(fig, use_container_width=True)
+            
+            payoff = pd.DataFrame({PAYOFF_LABELS[order]: outcome['payoff_month']
+                                   for order, outcome in strategies.items()})
+            st.write("Months until each debt is repaid")
+            st.dataframe(payoff, use_container_width=True)
+    
     # Recommendations section
     st.markdown("---")
     st.markdown('<h2 class="sub-header">Recommendations</h2>', unsafe_allow_html=True)
     
     if results['savings_last']:
-        st.success("""
-        - Your current plan appears to be on track for retirement
-        - Continue with your current savings strategy
-        - Consider periodically reviewing your plan as your circumstances change
-        """)
+        st.success("\n".join(f"- {item}" for item in RECOMMENDATIONS_ON_TRACK))
     else:
-        st.warning("""
-        - **Increase your savings rate**: Try to save more each year
-        - **Consider working longer**: Delaying retirement by a few years can significantly improve your financial security
-        - **Adjust your retirement expectations**: You may need to reduce your desired retirement income
-        - **Review your investment strategy**: Ensure your portfolio is appropriately allocated for your age and risk tolerance
-        - **Consider additional income sources**: Part-time work during retirement could help bridge the gap
-        """)
+        st.warning("\n".join(f"- {item}" for item in RECOMMENDATIONS_SHORTFALL))
+    
+    # Printable report
+    st.markdown("---")
+    st.markdown('<h2 class="sub-header">Printable Report</h2>', unsafe_allow_html=True)
+    report_panel(plan['fingerprint'], inputs, results)
     
 else:
+    if inputs_changed:
+        st.warning("Your inputs have changed. Click 'Calculate Retirement Plan' to update your results.")
+    
+    # Instant estimate answered from the precomputed annuity tables; only a schedule that
+    # varies from year to year needs compounding term by term
+    flat = bool(np.all(contributions == annual_contribution))
+    estimate = plan_summary(**inputs, contributions=None if flat else contributions)
+    st.markdown('<h2 class="sub-header">Quick Estimate</h2>', unsafe_allow_html=True)
+    col1, col2, col3 = st.columns(3)
+    with col1:
+        st.metric("Projected Retirement Savings", f"${estimate['retirement_savings']:,.0f}")
+    with col2:
+        st.metric("Savings Needed at Retirement", f"${estimate['required_savings']:,.0f}")
+    with col3:
+        st.metric("Savings Status", "✅ Sufficient" if estimate['savings_last'] else "❌ Insufficient")
+    
     # Show instructions before calculation
     st.info("""
     ### How to Use This Calculator
@@ -3,6 +3,7 @@ import re
 import pandas as pd
 import time
 from datetime import datetime
+from user_index import get_user_index
 
 # Page configuration
 st.set_page_config(
@@ -88,60 +89,75 @@ with st.expander("Why Create an Account?", expanded=True):
     </div>
     """, unsafe_allow_html=True)
 
-# Registration form
-with st.form("registration_form"):
+# Runs when the username or email field changes: looks the new value up once per edit, and
+# the result is shown under the field on this and later reruns
+def check_availability(column):
+    value = st.session_state[column]
+    st.session_state[f"{column}_taken"] = bool(value) and get_user_index().taken(column, value)
+
+# Registration form. Username and email sit outside the st.form so each is checked as soon
+# as it is entered; the other fields are submitted together.
+with st.container(border=True):
     st.write("### Create Your Account")
     
     # User inputs
-    username = st.text_input("Username", placeholder="Choose a unique username")
-    email = st.text_input("Email Address", placeholder="Your email address")
-    password = st.text_input("Password", type="password", placeholder="Create a strong password")
-    confirm_password = st.text_input("Confirm Password", type="password", placeholder="Re-enter your password")
-    agree_terms = st.checkbox("I agree to the Terms of Service and Privacy Policy")
-    
-    # Password strength indicator
-    if password:
-        strength = 0
-        feedback = []
+    username = st.text_input("Username", placeholder="Choose a unique username", key="username",
+                             on_change=check_availability, args=("username",))
+    if st.session_state.get("username_taken"):
+        st.markdown('<div class="error-message">Username already taken</div>', unsafe_allow_html=True)
+        st.caption("Available: " + ", ".join(get_user_index().suggest(username)))
+    email = st.text_input("Email Address", placeholder="Your email address", key="email",
+                          on_change=check_availability, args=("email",))
+    if st.session_state.get("email_taken"):
+        st.markdown('<div class="error-message">Email already taken</div>', unsafe_allow_html=True)
+    with st.form("registration_form", border=False):
+        password = st.text_input("Password", type="password", placeholder="Create a strong password")
+        confirm_password = st.text_input("Confirm Password", type="password", placeholder="Re-enter your password")
+        agree_terms = st.checkbox("I agree to the Terms of Service and Privacy Policy")
         
-        # Check password criteria
-        if len(password) >= 8:
-            strength += 1
-        else:
-            feedback.append("❌ At least 8 characters")
-            
-        if re.search(r"[A-Z]", password):
-            strength += 1
-        else:
-            feedback.append("❌ At least one uppercase letter")
+        # Password strength indicator
+        if password:
+            strength = 0
+            feedback = []
             
-        if re.search(r"[a-z]", password):
-            strength += 1
-        else:
-            feedback.append("❌ At least one lowercase letter")
+            # Check password criteria
+            if len(password) >= 8:
+                strength += 1
+            else:
+                feedback.append("❌ At least 8 characters")
+                
+            if re.search(r"[A-Z]", password):
+                strength += 1
+            else:
+                feedback.append("❌ At least one uppercase letter")
+                
+            if re.search(r"[a-z]", password):
+                strength += 1
+            else:
+                feedback.append("❌ At least one lowercase letter")
+                
+            if re.search(r"[0-9]", password):
+                strength += 1
+            else:
+                feedback.append("❌ At least one number")
+                
+            if re.search(r"[!@#$%^&*(),.?\":{}|<>]", password):
+                strength += 1
+            else:
+                feedback.append("❌ At least one special character")
             
-        if re.search(r"[0-9]", password):
-            strength += 1
-        else:
-            feedback.append("❌ At least one number")
+            # Display strength bar and feedback
+            st.markdown("**Password Strength**")
+            st.progress(strength/5)
             
-        if re.search(r"[!@#$%^&*(),.?\":{}|<>]", password):
-            strength += 1
-        else:
-            feedback.append("❌ At least one special character")
+            if strength < 5:
+                for item in feedback:
+                    st.markdown(f'<div class="password-feedback">{item}</div>', unsafe_allow_html=True)
+            else:
+                st.markdown('<div class="password-feedback">✅ Strong password!</div>', unsafe_allow_html=True)
         
-        # Display strength bar and feedback
-        st.markdown("**Password Strength**")
-        st.progress(strength/5)
-        
-        if strength < 5:
-            for item in feedback:
-                st.markdown(f'<div class="password-feedback">{item}</div>', unsafe_allow_html=True)
-        else:
-            st.markdown('<div class="password-feedback">✅ Strong password!</div>', unsafe_allow_html=True)
-    
-    # Submit button
-    submitted = st.form_submit_button("Create Account", use_container_width=True)
+        # Submit button
+        submitted = st.form_submit_button("Create Account", use_container_width=True)
 
 # Form validation and processing
 if submitted:
@@ -152,11 +168,15 @@ if submitted:
         errors.append("Username is required")
     elif len(username) < 3:
         errors.append("Username must be at least 3 characters")
+    elif get_user_index().taken('username', username):
+        errors.append("Username already taken")
         
     if not email:
         errors.append("Email is required")
     elif not re.match(r"[^@]+@[^@]+\.[^@]+", email):
         errors.append("Please enter a valid email address")
+    elif get_user_index().taken('email', email):
+        errors.append("Email already taken")
         
     if not password:
         errors.append("Password is required")
@@ -1,8 +1,10 @@
 import streamlit as st
 import re
-import sqlite3
-import hashlib
+import time
 from datetime import datetime
+from auth_db import get_database, insert_result
+from passwords import PasswordServiceBusy, hash_password
+from user_index import get_user_index, record_user
 
 # Page configuration
 st.set_page_config(
@@ -69,40 +71,32 @@ st.markdown("""
 </style>
 """, unsafe_allow_html=True)
 
-# Database setup
+# Database setup; the schema is applied once per process and connections come from the
+# shared pool in auth_db
 def init_database():
-    conn = sqlite3.connect('capital_compass.db')
-    c = conn.cursor()
-    c.execute('''
+    get_database().init_schema('''
         CREATE TABLE IF NOT EXISTS users (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
             username TEXT UNIQUE NOT NULL,
             email TEXT UNIQUE NOT NULL,
             password_hash TEXT NOT NULL,
             created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-        )
+        );
+        -- Names differing only in case are the same name, as user_index treats them
+        CREATE UNIQUE INDEX IF NOT EXISTS idx_users_username_nocase ON users(username COLLATE NOCASE);
+        CREATE UNIQUE INDEX IF NOT EXISTS idx_users_email_nocase ON users(email COLLATE NOCASE)
     ''')
-    conn.commit()
-    return conn
 
-# Password hashing function
-def hash_password(password):
-    return hashlib.sha256(password.encode()).hexdigest()
-
-# Check if username or email already exists
-def user_exists(conn, username, email):
-    c = conn.cursor()
-    c.execute('SELECT * FROM users WHERE username = ? OR email = ?', (username, email))
-    return c.fetchone() is not None
-
-# Save user to database
-def save_user(conn, username, email, password):
+# Save user to database in one INSERT. The UNIQUE constraints on username and email reject a
+# taken one, so there is no separate check beforehand; see insert_result for the result.
+def save_user(username, email, password):
     password_hash = hash_password(password)
-    c = conn.cursor()
-    c.execute('INSERT INTO users (username, email, password_hash) VALUES (?, ?, ?)',
-              (username, email, password_hash))
-    conn.commit()
-    return c.lastrowid
+    # Committed by the database's writer thread together with any other signups queued now
+    result = insert_result(get_database().write('INSERT INTO users (username, email, password_hash) VALUES (?, ?, ?)',
+                                                (username, email, password_hash)))
+    if result['created']:
+        record_user(username=username, email=email)
+    return result
 
 # App header
 st.markdown('<h1 class="main-header">Capital Compass</h1>', unsafe_allow_html=True)
@@ -124,62 +118,77 @@ with st.expander("Why Create an Account?", expanded=True):
     """, unsafe_allow_html=True)
 
 # Initialize database
-conn = init_database()
+init_database()
+
+# Runs when the username or email field changes: looks the new value up once per edit, and
+# the result is shown under the field on this and later reruns
+def check_availability(column):
+    value = st.session_state[column]
+    st.session_state[f"{column}_taken"] = bool(value) and get_user_index().taken(column, value)
 
-# Registration form
-with st.form("registration_form"):
+# Registration form. Username and email sit outside the st.form so each is checked as soon
+# as it is entered; the other fields are submitted together.
+with st.container(border=True):
     st.write("### Create Your Account")
     
     # User inputs
-    username = st.text_input("Username", placeholder="Choose a unique username")
-    email = st.text_input("Email Address", placeholder="Your email address")
-    password = st.text_input("Password", type="password", placeholder="Create a strong password")
-    confirm_password = st.text_input("Confirm Password", type="password", placeholder="Re-enter your password")
-    agree_terms = st.checkbox("I agree to the Terms of Service and Privacy Policy")
-    
-    # Password strength indicator
-    if password:
-        strength = 0
-        feedback = []
+    username = st.text_input("Username", placeholder="Choose a unique username", key="username",
+                             on_change=check_availability, args=("username",))
+    if st.session_state.get("username_taken"):
+        st.markdown('<div class="error-message">Username already taken</div>', unsafe_allow_html=True)
+        st.caption("Available: " + ", ".join(get_user_index().suggest(username)))
+    email = st.text_input("Email Address", placeholder="Your email address", key="email",
+                          on_change=check_availability, args=("email",))
+    if st.session_state.get("email_taken"):
+        st.markdown('<div class="error-message">Email already taken</div>', unsafe_allow_html=True)
+    with st.form("registration_form", border=False):
+        password = st.text_input("Password", type="password", placeholder="Create a strong password")
+        confirm_password = st.text_input("Confirm Password", type="password", placeholder="Re-enter your password")
+        agree_terms = st.checkbox("I agree to the Terms of Service and Privacy Policy")
         
-        # Check password criteria
-        if len(password) >= 8:
-            strength += 1
-        else:
-            feedback.append("❌ At least 8 characters")
-            
-        if re.search(r"[A-Z]", password):
-            strength += 1
-        else:
-            feedback.append("❌ At least one uppercase letter")
+        # Password strength indicator
+        if password:
+            strength = 0
+            feedback = []
             
-        if re.search(r"[a-z]", password):
-            strength += 1
-        else:
-            feedback.append("❌ At least one lowercase letter")
+            # Check password criteria
+            if len(password) >= 8:
+                strength += 1
+            else:
+                feedback.append("❌ At least 8 characters")
+                
+            if re.search(r"[A-Z]", password):
+                strength += 1
+            else:
+                feedback.append("❌ At least one uppercase letter")
+                
+            if re.search(r"[a-z]", password):
+                strength += 1
+            else:
+                feedback.append("❌ At least one lowercase letter")
+                
+            if re.search(r"[0-9]", password):
+                strength += 1
+            else:
+                feedback.append("❌ At least one number")
+                
+            if re.search(r"[!@#$%^&*(),.?\":{}|<>]", password):
+                strength += 1
+            else:
+                feedback.append("❌ At least one special character")
             
-        if re.search(r"[0-9]", password):
-            strength += 1
-        else:
-            feedback.append("❌ At least one number")
+            # Display strength bar and feedback
+            st.markdown("**Password Strength**")
+            st.progress(strength/5)
             
-        if re.search(r"[!@#$%^&*(),.?\":{}|<>]", password):
-            strength += 1
-        else:
-            feedback.append("❌ At least one special character")
-        
-        # Display strength bar and feedback
-        st.markdown("**Password Strength**")
-        st.progress(strength/5)
+            if strength < 5:
+                for item in feedback:
+                    st.markdown(f'<div class="password-feedback">{item}</div>', unsafe_allow_html=True)
+            else:
+                st.markdown('<div class="password-feedback">✅ Strong password!</div>', unsafe_allow_html=True)
         
-        if strength < 5:
-            for item in feedback:
-                st.markdown(f'<div class="password-feedback">{item}</div>', unsafe_allow_html=True)
-        else:
-            st.markdown('<div class="password-feedback">✅ Strong password!</div>', unsafe_allow_html=True)
-    
-    # Submit button
-    submitted = st.form_submit_button("Create Account", use_container_width=True)
+        # Submit button
+        submitted = st.form_submit_button("Create Account", use_container_width=True)
 
 # Form validation and processing
 if submitted:
@@ -190,11 +199,15 @@ if submitted:
         errors.append("Username is required")
     elif len(username) < 3:
         errors.append("Username must be at least 3 characters")
+    elif get_user_index().taken('username', username):
+        errors.append("Username already taken")
         
     if not email:
         errors.append("Email is required")
     elif not re.match(r"[^@]+@[^@]+\.[^@]+", email):
         errors.append("Please enter a valid email address")
+    elif get_user_index().taken('email', email):
+        errors.append("Email already taken")
         
     if not password:
         errors.append("Password is required")
@@ -204,10 +217,6 @@ if submitted:
     if not agree_terms:
         errors.append("You must agree to the Terms of Service and Privacy Policy")
     
-    # Check if user already exists
-    if user_exists(conn, username, email):
-        errors.append("Username or email already exists")
-    
     # Display errors or success
     if errors:
         for error in errors:
@@ -227,24 +236,27 @@ if submitted:
         
         # Save user to database
         try:
-            user_id = save_user(conn, username, email, password)
-            st.markdown('<div class="success-message">✅ Account created successfully!</div>', unsafe_allow_html=True)
-            
-            # Display user info
-            st.write("### Welcome to Capital Compass!")
-            st.write(f"**Username:** {username}")
-            st.write(f"**Email:** {email}")
-            st.write("**Account Created:**", datetime.now().strftime("%Y-%m-%d %H:%M"))
-            st.write(f"**User ID:** {user_id}")
-            
-            st.info("A verification email has been sent to your email address. Please verify to access all features.")
+            result = save_user(username, email, password)
+            if result['created']:
+                user_id = result['value']
+                st.markdown('<div class="success-message">✅ Account created successfully!</div>', unsafe_allow_html=True)
+                
+                # Display user info
+                st.write("### Welcome to Capital Compass!")
+                st.write(f"**Username:** {username}")
+                st.write(f"**Email:** {email}")
+                st.write("**Account Created:**", datetime.now().strftime("%Y-%m-%d %H:%M"))
+                st.write(f"**User ID:** {user_id}")
+                
+                st.info("A verification email has been sent to your email address. Please verify to access all features.")
+            else:
+                st.markdown(f'<div class="error-message">{result["conflict"].capitalize()} already exists</div>', unsafe_allow_html=True)
             
+        except PasswordServiceBusy as e:
+            st.error(str(e))
         except Exception as e:
             st.markdown(f'<div class="error-message">Error creating account: {str(e)}</div>', unsafe_allow_html=True)
 
-# Close database connection
-conn.close()
-
 # Footer
 st.markdown("---")
 st.markdown(
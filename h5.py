@@ -1,9 +1,11 @@
 import streamlit as st
 import re
-import sqlite3
 import hashlib
 import time
 from datetime import datetime
+from auth_db import get_database, insert_result
+from passwords import PasswordServiceBusy, hash_password
+from user_index import get_user_index, record_user
 
 # Page configuration
 st.set_page_config(
@@ -77,13 +79,11 @@ st.markdown("""
 </style>
 """, unsafe_allow_html=True)
 
-# Database setup with multiple tables
+# Database setup with multiple tables; the schema is applied once per process and
+# connections come from the shared pool in auth_db
 def init_database():
-    conn = sqlite3.connect('capital_compass.db')
-    c = conn.cursor()
-    
-    # Users table
-    c.execute('''
+    get_database().init_schema('''
+        -- Users table
         CREATE TABLE IF NOT EXISTS users (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
             username TEXT UNIQUE NOT NULL,
@@ -91,13 +91,17 @@ def init_database():
             password_hash TEXT NOT NULL,
             created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
             last_login TIMESTAMP,
+            login_count INTEGER NOT NULL DEFAULT 0,
             is_verified INTEGER DEFAULT 0,
             verification_token TEXT
-        )
-    ''')
-    
-    # User profiles table
-    c.execute('''
+        );
+        -- Names differing only in case are the same name, as user_index treats them
+        CREATE UNIQUE INDEX IF NOT EXISTS idx_users_username_nocase ON users(username COLLATE NOCASE);
+        CREATE UNIQUE INDEX IF NOT EXISTS idx_users_email_nocase ON users(email COLLATE NOCASE);
+        -- Added to tables created before login counts were kept
+        ALTER TABLE users ADD COLUMN login_count INTEGER NOT NULL DEFAULT 0;
+
+        -- User profiles table
         CREATE TABLE IF NOT EXISTS user_profiles (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
             user_id INTEGER UNIQUE NOT NULL,
@@ -111,11 +115,9 @@ def init_database():
             created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
             updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
             FOREIGN KEY (user_id) REFERENCES users (id) ON DELETE CASCADE
-        )
-    ''')
-    
-    # Accounts table
-    c.execute('''
+        );
+
+        -- Accounts table
         CREATE TABLE IF NOT EXISTS accounts (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
             user_id INTEGER NOT NULL,
@@ -126,11 +128,9 @@ def init_database():
             created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
             is_active INTEGER DEFAULT 1,
             FOREIGN KEY (user_id) REFERENCES users (id) ON DELETE CASCADE
-        )
-    ''')
-    
-    # Transactions table
-    c.execute('''
+        );
+
+        -- Transactions table
         CREATE TABLE IF NOT EXISTS transactions (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
             account_id INTEGER NOT NULL,
@@ -141,11 +141,9 @@ def init_database():
             transaction_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
             status TEXT DEFAULT 'completed',
             FOREIGN KEY (account_id) REFERENCES accounts (id) ON DELETE CASCADE
-        )
-    ''')
-    
-    # Investments table
-    c.execute('''
+        );
+
+        -- Investments table
         CREATE TABLE IF NOT EXISTS investments (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
             user_id INTEGER NOT NULL,
@@ -157,61 +155,53 @@ def init_database():
             purchase_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
             sector TEXT,
             FOREIGN KEY (user_id) REFERENCES users (id) ON DELETE CASCADE
-        )
-    ''')
-    
-    # Create indexes for better performance
-    c.execute('CREATE INDEX IF NOT EXISTS idx_users_email ON users(email)')
-    c.execute('CREATE INDEX IF NOT EXISTS idx_users_username ON users(username)')
-    c.execute('CREATE INDEX IF NOT EXISTS idx_transactions_account_id ON transactions(account_id)')
-    c.execute('CREATE INDEX IF NOT EXISTS idx_transactions_date ON transactions(transaction_date)')
-    c.execute('CREATE INDEX IF NOT EXISTS idx_investments_user_id ON investments(user_id)')
-    
-    conn.commit()
-    return conn
-
-# Password hashing function
-def hash_password(password):
-    salt = "capital_compass_salt_2023"  # In production, use a unique salt per user
-    return hashlib.sha256((password + salt).encode()).hexdigest()
+        );
 
-# Check if username or email already exists
-def user_exists(conn, username, email):
-    c = conn.cursor()
-    c.execute('SELECT * FROM users WHERE username = ? OR email = ?', (username, email))
-    return c.fetchone() is not None
+        -- Create indexes for better performance
+        CREATE INDEX IF NOT EXISTS idx_users_email ON users(email);
+        CREATE INDEX IF NOT EXISTS idx_users_username ON users(username);
+        CREATE INDEX IF NOT EXISTS idx_transactions_account_id ON transactions(account_id);
+        CREATE INDEX IF NOT EXISTS idx_transactions_date ON transactions(transaction_date);
+        CREATE INDEX IF NOT EXISTS idx_investments_user_id ON investments(user_id);
+    ''')
 
-# Save user to database
-def save_user(conn, username, email, password):
+# Save user to database without checking for a taken username or email first: the UNIQUE
+# constraints reject one and insert_result reports which column conflicted
+def save_user(username, email, password):
     password_hash = hash_password(password)
-    c = conn.cursor()
     
     # Generate a verification token
     verification_token = hashlib.sha256(f"{username}{email}{datetime.now()}".encode()).hexdigest()
     
-    c.execute('INSERT INTO users (username, email, password_hash, verification_token) VALUES (?, ?, ?, ?)',
-              (username, email, password_hash, verification_token))
-    
-    user_id = c.lastrowid
-    
-    # Create a default account for the user
-    account_number = f"CC{user_id:08d}"
-    c.execute('INSERT INTO accounts (user_id, account_type, account_number) VALUES (?, ?, ?)',
-              (user_id, 'checking', account_number))
+    # The user and their default account are one operation for the writer thread, so they
+    # commit together (in a group with any other signups queued now)
+    def create(conn):
+        c = conn.execute('INSERT INTO users (username, email, password_hash, verification_token) VALUES (?, ?, ?, ?)',
+                         (username, email, password_hash, verification_token))
+        
+        user_id = c.lastrowid
+        
+        # Create a default account for the user
+        account_number = f"CC{user_id:08d}"
+        conn.execute('INSERT INTO accounts (user_id, account_type, account_number) VALUES (?, ?, ?)',
+                     (user_id, 'checking', account_number))
+        return user_id, account_number
     
-    conn.commit()
-    return user_id, account_number
+    result = insert_result(get_database().submit(create))
+    if result['created']:
+        record_user(username=username, email=email)
+    return result
 
 # Display database info
-def display_database_info(conn):
-    c = conn.cursor()
-    
-    # Get table counts
-    c.execute("SELECT COUNT(*) FROM users")
-    user_count = c.fetchone()[0]
-    
-    c.execute("SELECT COUNT(*) FROM accounts")
-    account_count = c.fetchone()[0]
+def display_database_info():
+    database = get_database()
+    with database.connection() as conn:
+        # Get table counts
+        user_count = conn.execute("SELECT COUNT(*) FROM users").fetchone()[0]
+        account_count = conn.execute("SELECT COUNT(*) FROM accounts").fetchone()[0]
+        recent_users = conn.execute(
+            "SELECT id, username, email, created_at FROM users ORDER BY created_at DESC LIMIT 5"
+        ).fetchall() if user_count > 0 else []
     
     st.markdown('<div class="database-section">', unsafe_allow_html=True)
     st.write("### Database Information")
@@ -220,12 +210,13 @@ def display_database_info(conn):
     
     if user_count > 0:
         st.write("### Recent Registrations")
-        c.execute("SELECT id, username, email, created_at FROM users ORDER BY created_at DESC LIMIT 5")
-        recent_users = c.fetchall()
-        
         for user in recent_users:
             st.write(f"User #{user[0]}: {user[1]} ({user[2]}) - {user[3]}")
     
+    metrics = database.metrics()
+    st.caption(f"Connections: {metrics['open_connections']} open, {metrics['reuse_rate']:.0%} of checkouts reused; "
+               f"{metrics['statement_reuse_rate']:.0%} of statements served from the statement cache")
+    
     st.markdown('</div>', unsafe_allow_html=True)
 
 # App header
@@ -233,7 +224,7 @@ st.markdown('<h1 class="main-header">Capital Compass</h1>', unsafe_allow_html=Tr
 st.markdown('<h2 class="sub-header">Navigate Your Financial Future</h2>', unsafe_allow_html=True)
 
 # Initialize database
-conn = init_database()
+init_database()
 
 # Information section
 with st.expander("Why Create an Account?", expanded=True):
@@ -250,68 +241,83 @@ with st.expander("Why Create an Account?", expanded=True):
     </div>
     """, unsafe_allow_html=True)
 
-# Registration form
-with st.form("registration_form"):
+# Runs when the username or email field changes: looks the new value up once per edit, and
+# the result is shown under the field on this and later reruns
+def check_availability(column):
+    value = st.session_state[column]
+    st.session_state[f"{column}_taken"] = bool(value) and get_user_index().taken(column, value)
+
+# Registration form. Username and email sit outside the st.form so each is checked as soon
+# as it is entered; the other fields are submitted together.
+with st.container(border=True):
     st.write("### Create Your Account")
     
     # User inputs
     col1, col2 = st.columns(2)
     with col1:
-        username = st.text_input("Username", placeholder="Choose a unique username")
+        username = st.text_input("Username", placeholder="Choose a unique username", key="username",
+                                 on_change=check_availability, args=("username",))
+        if st.session_state.get("username_taken"):
+            st.markdown('<div class="error-message">Username already taken</div>', unsafe_allow_html=True)
+            st.caption("Available: " + ", ".join(get_user_index().suggest(username)))
     with col2:
-        email = st.text_input("Email Address", placeholder="Your email address")
-    
-    col3, col4 = st.columns(2)
-    with col3:
-        password = st.text_input("Password", type="password", placeholder="Create a strong password")
-    with col4:
-        confirm_password = st.text_input("Confirm Password", type="password", placeholder="Re-enter your password")
+        email = st.text_input("Email Address", placeholder="Your email address", key="email",
+                              on_change=check_availability, args=("email",))
+        if st.session_state.get("email_taken"):
+            st.markdown('<div class="error-message">Email already taken</div>', unsafe_allow_html=True)
     
-    agree_terms = st.checkbox("I agree to the Terms of Service and Privacy Policy")
-    
-    # Password strength indicator
-    if password:
-        strength = 0
-        feedback = []
+    with st.form("registration_form", border=False):
+        col3, col4 = st.columns(2)
+        with col3:
+            password = st.text_input("Password", type="password", placeholder="Create a strong password")
+        with col4:
+            confirm_password = st.text_input("Confirm Password", type="password", placeholder="Re-enter your password")
         
-        # Check password criteria
-        if len(password) >= 8:
-            strength += 1
-        else:
-            feedback.append("❌ At least 8 characters")
-            
-        if re.search(r"[A-Z]", password):
-            strength += 1
-        else:
-            feedback.append("❌ At least one uppercase letter")
+        agree_terms = st.checkbox("I agree to the Terms of Service and Privacy Policy")
+        
+        # Password strength indicator
+        if password:
+            strength = 0
+            feedback = []
             
-        if re.search(r"[a-z]", password):
-            strength += 1
-        else:
-            feedback.append("❌ At least one lowercase letter")
+            # Check password criteria
+            if len(password) >= 8:
+                strength += 1
+            else:
+                feedback.append("❌ At least 8 characters")
+                
+            if re.search(r"[A-Z]", password):
+                strength += 1
+            else:
+                feedback.append("❌ At least one uppercase letter")
+                
+            if re.search(r"[a-z]", password):
+                strength += 1
+            else:
+                feedback.append("❌ At least one lowercase letter")
+                
+            if re.search(r"[0-9]", password):
+                strength += 1
+            else:
+                feedback.append("❌ At least one number")
+                
+            if re.search(r"[!@#$%^&*(),.?\":{}|<>]", password):
+                strength += 1
+            else:
+                feedback.append("❌ At least one special character")
             
-        if re.search(r"[0-9]", password):
-            strength += 1
-        else:
-            feedback.append("❌ At least one number")
+            # Display strength bar and feedback
+            st.markdown("**Password Strength**")
+            st.progress(strength/5)
             
-        if re.search(r"[!@#$%^&*(),.?\":{}|<>]", password):
-            strength += 1
-        else:
-            feedback.append("❌ At least one special character")
+            if strength < 5:
+                for item in feedback:
+                    st.markdown(f'<div class="password-feedback">{item}</div>', unsafe_allow_html=True)
+            else:
+                st.markdown('<div class="password-feedback">✅ Strong password!</div>', unsafe_allow_html=True)
         
-        # Display strength bar and feedback
-        st.markdown("**Password Strength**")
-        st.progress(strength/5)
-        
-        if strength < 5:
-            for item in feedback:
-                st.markdown(f'<div class="password-feedback">{item}</div>', unsafe_allow_html=True)
-        else:
-            st.markdown('<div class="password-feedback">✅ Strong password!</div>', unsafe_allow_html=True)
-    
-    # Submit button
-    submitted = st.form_submit_button("Create Account", use_container_width=True)
+        # Submit button
+        submitted = st.form_submit_button("Create Account", use_container_width=True)
 
 # Form validation and processing
 if submitted:
@@ -322,6 +328,8 @@ if submitted:
         errors.append("Username is required")
     elif len(username) < 3:
         errors.append("Username must be at least 3 characters")
+    elif get_user_index().taken('username', username):
+        errors.append("Username already taken")
     elif not re.match(r"^[a-zA-Z0-9_]+$", username):
         errors.append("Username can only contain letters, numbers, and underscores")
         
@@ -329,6 +337,8 @@ if submitted:
         errors.append("Email is required")
     elif not re.match(r"[^@]+@[^@]+\.[^@]+", email):
         errors.append("Please enter a valid email address")
+    elif get_user_index().taken('email', email):
+        errors.append("Email already taken")
         
     if not password:
         errors.append("Password is required")
@@ -340,10 +350,6 @@ if submitted:
     if not agree_terms:
         errors.append("You must agree to the Terms of Service and Privacy Policy")
     
-    # Check if user already exists
-    if user_exists(conn, username, email):
-        errors.append("Username or email already exists")
-    
     # Display errors or success
     if errors:
         for error in errors:
@@ -363,27 +369,30 @@ if submitted:
         
         # Save user to database
         try:
-            user_id, account_number = save_user(conn, username, email, password)
-            st.markdown('<div class="success-message">✅ Account created successfully!</div>', unsafe_allow_html=True)
-            
-            # Display user info
-            st.write("### Welcome to Capital Compass!")
-            st.write(f"**User ID:** {user_id}")
-            st.write(f"**Username:** {username}")
-            st.write(f"**Email:** {email}")
-            st.write(f"**Account Number:** {account_number}")
-            st.write("**Account Created:**", datetime.now().strftime("%Y-%m-%d %H:%M"))
-            
-            st.info("A verification email has been sent to your email address. Please verify to access all features.")
+            result = save_user(username, email, password)
+            if result['created']:
+                user_id, account_number = result['value']
+                st.markdown('<div class="success-message">✅ Account created successfully!</div>', unsafe_allow_html=True)
+                
+                # Display user info
+                st.write("### Welcome to Capital Compass!")
+                st.write(f"**User ID:** {user_id}")
+                st.write(f"**Username:** {username}")
+                st.write(f"**Email:** {email}")
+                st.write(f"**Account Number:** {account_number}")
+                st.write("**Account Created:**", datetime.now().strftime("%Y-%m-%d %H:%M"))
+                
+                st.info("A verification email has been sent to your email address. Please verify to access all features.")
+            else:
+                st.markdown(f'<div class="error-message">{result["conflict"].capitalize()} already exists</div>', unsafe_allow_html=True)
             
+        except PasswordServiceBusy as e:
+            st.error(str(e))
         except Exception as e:
             st.markdown(f'<div class="error-message">Error creating account: {str(e)}</div>', unsafe_allow_html=True)
 
 # Display database information
-display_database_info(conn)
-
-# Close database connection
-conn.close()
+display_database_info()
 
 # Footer
 st.markdown("---")
@@ -1,10 +1,10 @@
 import streamlit as st
 import re
-import hashlib
 import time
 from datetime import datetime
 import gspread
 from google.oauth2.service_account import Credentials
+from passwords import PasswordServiceBusy, hash_password
 
 # Page configuration
 st.set_page_config(
@@ -99,11 +99,6 @@ def init_google_sheets():
     
     return worksheet
 
-# Password hashing function
-def hash_password(password):
-    salt = "capital_compass_salt_2023"
-    return hashlib.sha256((password + salt).encode()).hexdigest()
-
 # Check if username or email already exists in Google Sheets
 def user_exists(worksheet, username, email):
     all_records = worksheet.get_all_records()
@@ -277,6 +272,8 @@ if submitted:
             else:
                 st.markdown('<div class="error-message">Error creating account. Please try again.</div>', unsafe_allow_html=True)
             
+        except PasswordServiceBusy as e:
+            st.error(str(e))
         except Exception as e:
             st.markdown(f'<div class="error-message">Error creating account: {str(e)}</div>', unsafe_allow_html=True)
 
@@ -1,10 +1,11 @@
 import streamlit as st
 import re
-import sqlite3
-import hashlib
 import time
 from datetime import datetime
 import os
+from auth_db import get_database, insert_result
+from passwords import PasswordServiceBusy, hash_password
+from user_index import get_user_index, record_user
 
 # Page configuration
 st.set_page_config(
@@ -89,11 +90,8 @@ def init_database():
     # Create directory if it doesn't exist
     os.makedirs(os.path.dirname(db_path), exist_ok=True)
     
-    conn = sqlite3.connect(db_path)
-    c = conn.cursor()
-    
-    # Users table
-    c.execute('''
+    get_database(db_path).init_schema('''
+        -- Users table
         CREATE TABLE IF NOT EXISTS users (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
             username TEXT UNIQUE NOT NULL,
@@ -101,13 +99,17 @@ def init_database():
             password_hash TEXT NOT NULL,
             created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
             last_login TIMESTAMP,
+            login_count INTEGER NOT NULL DEFAULT 0,
             is_verified INTEGER DEFAULT 0,
             account_status TEXT DEFAULT 'active'
-        )
-    ''')
-    
-    # User profiles table
-    c.execute('''
+        );
+        -- Names differing only in case are the same name, as user_index treats them
+        CREATE UNIQUE INDEX IF NOT EXISTS idx_users_username_nocase ON users(username COLLATE NOCASE);
+        CREATE UNIQUE INDEX IF NOT EXISTS idx_users_email_nocase ON users(email COLLATE NOCASE);
+        -- Added to tables created before login counts were kept
+        ALTER TABLE users ADD COLUMN login_count INTEGER NOT NULL DEFAULT 0;
+        
+        -- User profiles table
         CREATE TABLE IF NOT EXISTS user_profiles (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
             user_id INTEGER UNIQUE NOT NULL,
@@ -121,42 +123,24 @@ def init_database():
             created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
             updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
             FOREIGN KEY (user_id) REFERENCES users (id) ON DELETE CASCADE
-        )
+        );
+        
+        -- Create indexes
+        CREATE INDEX IF NOT EXISTS idx_users_email ON users(email);
+        CREATE INDEX IF NOT EXISTS idx_users_username ON users(username)
     ''')
-    
-    # Create indexes
-    c.execute('CREATE INDEX IF NOT EXISTS idx_users_email ON users(email)')
-    c.execute('CREATE INDEX IF NOT EXISTS idx_users_username ON users(username)')
-    
-    conn.commit()
-    return conn, db_path
-
-# Password hashing function
-def hash_password(password):
-    salt = "capital_compass_salt_2023"
-    return hashlib.sha256((password + salt).encode()).hexdigest()
+    return db_path
 
-# Check if username or email already exists
-def user_exists(conn, username, email):
-    c = conn.cursor()
-    c.execute('SELECT * FROM users WHERE username = ? OR email = ?', (username, email))
-    return c.fetchone() is not None
-
-# Save user to database
-def save_user(conn, username, email, password):
+# Save user to database in one INSERT. The UNIQUE constraints on username and email reject a
+# taken one, so there is no separate check beforehand; see insert_result for the result.
+def save_user(db_path, username, email, password):
     password_hash = hash_password(password)
-    c = conn.cursor()
-    
-    try:
-        c.execute('INSERT INTO users (username, email, password_hash) VALUES (?, ?, ?)',
-                  (username, email, password_hash))
-        user_id = c.lastrowid
-        conn.commit()
-        return user_id, True
-    except sqlite3.IntegrityError:
-        return None, False
-    except Exception as e:
-        return None, False
+    # Committed by the database's writer thread together with any other signups queued now
+    result = insert_result(get_database(db_path).write('INSERT INTO users (username, email, password_hash) VALUES (?, ?, ?)',
+                                                       (username, email, password_hash)))
+    if result['created']:
+        record_user(get_database(db_path), username=username, email=email)
+    return result
 
 # App header
 st.markdown('<h1 class="main-header">Capital Compass</h1>', unsafe_allow_html=True)
@@ -164,12 +148,11 @@ st.markdown('<h2 class="sub-header">Navigate Your Financial Future</h2>', unsafe
 
 # Initialize database
 try:
-    conn, db_path = init_database()
+    db_path = init_database()
     db_connected = True
 except Exception as e:
     st.error(f"Database connection error: {str(e)}")
     db_connected = False
-    conn = None
     db_path = "Not available"
 
 # Information section
@@ -188,79 +171,94 @@ with st.expander("Why Create an Account?", expanded=True):
     </div>
     """, unsafe_allow_html=True)
 
-# Registration form
-with st.form("registration_form"):
+# Runs when the username or email field changes: looks the new value up once per edit, and
+# the result is shown under the field on this and later reruns
+def check_availability(column):
+    value = st.session_state[column]
+    st.session_state[f"{column}_taken"] = db_connected and bool(value) and get_user_index(get_database(db_path)).taken(column, value)
+
+# Registration form. Username and email sit outside the st.form so each is checked as soon
+# as it is entered; the other fields are submitted together.
+with st.container(border=True):
     st.write("### Create Your Account")
     
     # User inputs
     col1, col2 = st.columns(2)
     with col1:
-        username = st.text_input("Username", placeholder="Choose a unique username (min. 3 chars)")
+        username = st.text_input("Username", placeholder="Choose a unique username (min. 3 chars)", key="username",
+                                 on_change=check_availability, args=("username",))
+        if st.session_state.get("username_taken"):
+            st.markdown('<div class="error-message">Username already taken</div>', unsafe_allow_html=True)
+            st.caption("Available: " + ", ".join(get_user_index(get_database(db_path)).suggest(username)))
     with col2:
-        email = st.text_input("Email Address", placeholder="Your active email address")
-    
-    col3, col4 = st.columns(2)
-    with col3:
-        password = st.text_input("Password", type="password", placeholder="Create a strong password")
-    with col4:
-        confirm_password = st.text_input("Confirm Password", type="password", placeholder="Re-enter your password")
+        email = st.text_input("Email Address", placeholder="Your active email address", key="email",
+                              on_change=check_availability, args=("email",))
+        if st.session_state.get("email_taken"):
+            st.markdown('<div class="error-message">Email already taken</div>', unsafe_allow_html=True)
     
-    # Additional optional fields
-    with st.expander("Additional Information (Optional)"):
-        col5, col6 = st.columns(2)
-        with col5:
-            first_name = st.text_input("First Name")
-        with col6:
-            last_name = st.text_input("Last Name")
+    with st.form("registration_form", border=False):
+        col3, col4 = st.columns(2)
+        with col3:
+            password = st.text_input("Password", type="password", placeholder="Create a strong password")
+        with col4:
+            confirm_password = st.text_input("Confirm Password", type="password", placeholder="Re-enter your password")
         
-        country = st.selectbox("Country", ["USA", "Canada", "UK", "Australia", "Germany", "Other"])
-    
-    agree_terms = st.checkbox("I agree to the Terms of Service and Privacy Policy", value=False)
-    newsletter = st.checkbox("Subscribe to investment insights newsletter", value=True)
-    
-    # Password strength indicator
-    if password:
-        strength = 0
-        feedback = []
-        
-        # Check password criteria
-        if len(password) >= 8:
-            strength += 1
-        else:
-            feedback.append("❌ At least 8 characters")
+        # Additional optional fields
+        with st.expander("Additional Information (Optional)"):
+            col5, col6 = st.columns(2)
+            with col5:
+                first_name = st.text_input("First Name")
+            with col6:
+                last_name = st.text_input("Last Name")
             
-        if re.search(r"[A-Z]", password):
-            strength += 1
-        else:
-            feedback.append("❌ At least one uppercase letter")
+            country = st.selectbox("Country", ["USA", "Canada", "UK", "Australia", "Germany", "Other"])
+        
+        agree_terms = st.checkbox("I agree to the Terms of Service and Privacy Policy", value=False)
+        newsletter = st.checkbox("Subscribe to investment insights newsletter", value=True)
+        
+        # Password strength indicator
+        if password:
+            strength = 0
+            feedback = []
             
-        if re.search(r"[a-z]", password):
-            strength += 1
-        else:
-            feedback.append("❌ At least one lowercase letter")
+            # Check password criteria
+            if len(password) >= 8:
+                strength += 1
+            else:
+                feedback.append("❌ At least 8 characters")
+                
+            if re.search(r"[A-Z]", password):
+                strength += 1
+            else:
+                feedback.append("❌ At least one uppercase letter")
+                
+            if re.search(r"[a-z]", password):
+                strength += 1
+            else:
+                feedback.append("❌ At least one lowercase letter")
+                
+            if re.search(r"[0-9]", password):
+                strength += 1
+            else:
+                feedback.append("❌ At least one number")
+                
+            if re.search(r"[!@#$%^&*(),.?\":{}|<>]", password):
+                strength += 1
+            else:
+                feedback.append("❌ At least one special character")
             
-        if re.search(r"[0-9]", password):
-            strength += 1
-        else:
-            feedback.append("❌ At least one number")
+            # Display strength bar and feedback
+            st.markdown("**Password Strength**")
+            st.progress(strength/5)
             
-        if re.search(r"[!@#$%^&*(),.?\":{}|<>]", password):
-            strength += 1
-        else:
-            feedback.append("❌ At least one special character")
-        
-        # Display strength bar and feedback
-        st.markdown("**Password Strength**")
-        st.progress(strength/5)
+            if strength < 5:
+                for item in feedback:
+                    st.markdown(f'<div class="password-feedback">{item}</div>', unsafe_allow_html=True)
+            else:
+                st.markdown('<div class="password-feedback">✅ Strong password!</div>', unsafe_allow_html=True)
         
-        if strength < 5:
-            for item in feedback:
-                st.markdown(f'<div class="password-feedback">{item}</div>', unsafe_allow_html=True)
-        else:
-            st.markdown('<div class="password-feedback">✅ Strong password!</div>', unsafe_allow_html=True)
-    
-    # Submit button
-    submitted = st.form_submit_button("Create Account", use_container_width=True)
+        # Submit button
+        submitted = st.form_submit_button("Create Account", use_container_width=True)
 
 # Form validation and processing
 if submitted:
@@ -277,11 +275,15 @@ if submitted:
         errors.append("Username must be at least 3 characters")
     elif not re.match(r"^[a-zA-Z0-9_]+$", username):
         errors.append("Username can only contain letters, numbers, and underscores")
+    elif db_connected and get_user_index(get_database(db_path)).taken('username', username):
+        errors.append("Username already taken")
         
     if not email:
         errors.append("Email is required")
     elif not re.match(r"[^@]+@[^@]+\.[^@]+", email):
         errors.append("Please enter a valid email address")
+    elif db_connected and get_user_index(get_database(db_path)).taken('email', email):
+        errors.append("Email already taken")
         
     if not password:
         errors.append("Password is required")
@@ -293,10 +295,6 @@ if submitted:
     if not agree_terms:
         errors.append("You must agree to the Terms of Service and Privacy Policy")
     
-    # Check if user already exists
-    if db_connected and user_exists(conn, username, email):
-        errors.append("Username or email already exists")
-    
     # Display errors or success
     if errors:
         for error in errors:
@@ -316,8 +314,9 @@ if submitted:
         
         # Save user to database
         try:
-            user_id, success = save_user(conn, username, email, password)
-            if success:
+            result = save_user(db_path, username, email, password)
+            if result['created']:
+                user_id = result['value']
                 st.markdown('<div class="success-message">✅ Account created successfully!</div>', unsafe_allow_html=True)
                 
                 # Display success information
@@ -333,8 +332,10 @@ if submitted:
                 st.success("Your account data has been securely stored in our database.")
                 
             else:
-                st.markdown('<div class="error-message">Error creating account. Please try again.</div>', unsafe_allow_html=True)
+                st.markdown(f'<div class="error-message">{result["conflict"].capitalize()} already exists</div>', unsafe_allow_html=True)
             
+        except PasswordServiceBusy as e:
+            st.error(str(e))
         except Exception as e:
             st.markdown(f'<div class="error-message">Error creating account: {str(e)}</div>', unsafe_allow_html=True)
 
@@ -366,7 +367,3 @@ st.markdown(
     "</div>", 
     unsafe_allow_html=True
 )
-
-# Close database connection
-if conn:
-    conn.close()
@@ -1,8 +1,9 @@
 import streamlit as st
 import re
-import hashlib
-import sqlite3
 from datetime import datetime
+from auth_db import get_database, insert_result
+from passwords import PasswordServiceBusy, hash_password
+from user_index import get_user_index, record_user
 
 # Page configuration
 st.set_page_config(
@@ -65,24 +66,18 @@ def apply_dark_theme():
 
 apply_dark_theme()
 
-# Database setup
+# Database setup; the schema is applied once per process rather than on every rerun
 def init_db():
-    conn = sqlite3.connect('capital_compass.db')
-    c = conn.cursor()
-    c.execute('''
+    get_database().init_schema('''
         CREATE TABLE IF NOT EXISTS users (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
             username TEXT UNIQUE NOT NULL,
             password_hash TEXT NOT NULL,
             created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-        )
+        );
+        -- Names differing only in case are the same name, as user_index treats them
+        CREATE UNIQUE INDEX IF NOT EXISTS idx_users_username_nocase ON users(username COLLATE NOCASE)
     ''')
-    conn.commit()
-    conn.close()
-
-# Password hashing
-def hash_password(password):
-    return hashlib.sha256(password.encode()).hexdigest()
 
 # Password validation
 def validate_password(password):
@@ -100,21 +95,14 @@ def validate_password(password):
 
 # User registration
 def register_user(username, password):
-    conn = sqlite3.connect('capital_compass.db')
-    c = conn.cursor()
-    
-    # Check if username already exists
-    c.execute("SELECT * FROM users WHERE username = ?", (username,))
-    if c.fetchone():
-        conn.close()
-        return "Username already exists"
-    
-    # Hash password and store user
+    # Hash password and store user in one INSERT; the UNIQUE constraint on username rejects
+    # a taken name, so there is no separate check beforehand
     password_hash = hash_password(password)
-    c.execute("INSERT INTO users (username, password_hash) VALUES (?, ?)", 
-              (username, password_hash))
-    conn.commit()
-    conn.close()
+    result = insert_result(get_database().write("INSERT INTO users (username, password_hash) VALUES (?, ?)",
+                                                (username, password_hash)))
+    if not result['created']:
+        return "Username already exists. Available: " + ", ".join(get_user_index().suggest(username))
+    record_user(username=username)
     return None
 
 # Main application
@@ -163,7 +151,10 @@ def main():
                     st.error(password_error, icon="🚨")
                 else:
                     # Register user
-                    error = register_user(username, password)
+                    try:
+                        error = register_user(username, password)
+                    except PasswordServiceBusy as e:
+                        error = str(e)
                     if error:
                         st.error(error, icon="🚨")
                     else:
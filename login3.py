@@ -1,9 +1,12 @@
 import streamlit as st
 import re
-import hashlib
-import sqlite3
 from datetime import datetime
 import base64
+from auth_db import get_database, insert_result
+from passwords import PasswordServiceBusy, hash_password, verify_password
+from rate_limit import get_rate_limiter
+from user_index import get_user_index, record_user
+from activity import get_activity_log
 
 # Page configuration
 st.set_page_config(
@@ -144,24 +147,21 @@ def set_bg_image():
 
 set_bg_image()
 
-# Database setup
+# Database setup; the schema is applied once per process rather than on every rerun
 def init_db():
-    conn = sqlite3.connect('capital_compass.db')
-    c = conn.cursor()
-    c.execute('''
+    get_database().init_schema('''
         CREATE TABLE IF NOT EXISTS users (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
             username TEXT UNIQUE NOT NULL,
             password_hash TEXT NOT NULL,
             created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-        )
+        );
+        -- Names differing only in case are the same name, as user_index treats them
+        CREATE UNIQUE INDEX IF NOT EXISTS idx_users_username_nocase ON users(username COLLATE NOCASE);
+        -- Login activity kept by activity.py, added to tables created before it
+        ALTER TABLE users ADD COLUMN last_login TIMESTAMP;
+        ALTER TABLE users ADD COLUMN login_count INTEGER NOT NULL DEFAULT 0
     ''')
-    conn.commit()
-    conn.close()
-
-# Password hashing
-def hash_password(password):
-    return hashlib.sha256(password.encode()).hexdigest()
 
 # Password validation
 def validate_password(password):
@@ -179,34 +179,37 @@ def validate_password(password):
 
 # User registration
 def register_user(username, password):
-    conn = sqlite3.connect('capital_compass.db')
-    c = conn.cursor()
-    
-    # Check if username already exists
-    c.execute("SELECT * FROM users WHERE username = ?", (username,))
-    if c.fetchone():
-        conn.close()
-        return "Username already exists"
-    
-    # Hash password and store user
+    # Hash password and store user in one INSERT; the UNIQUE constraint on username rejects
+    # a taken name, so there is no separate check beforehand
     password_hash = hash_password(password)
-    c.execute("INSERT INTO users (username, password_hash) VALUES (?, ?)", 
-              (username, password_hash))
-    conn.commit()
-    conn.close()
+    result = insert_result(get_database().write("INSERT INTO users (username, password_hash) VALUES (?, ?)",
+                                                (username, password_hash)))
+    if not result['created']:
+        return "Username already exists. Available: " + ", ".join(get_user_index().suggest(username))
+    record_user(username=username)
     return None
 
 # User authentication
 def authenticate_user(username, password):
-    conn = sqlite3.connect('capital_compass.db')
-    c = conn.cursor()
+    # Throttled attempts are turned away before the database lookup and the password hash
+    limiter = get_rate_limiter()
+    allowed, message = limiter.check(username, st.context.ip_address)
+    if not allowed:
+        return False, message
     
     # Get user by username
-    c.execute("SELECT * FROM users WHERE username = ?", (username,))
-    user = c.fetchone()
-    conn.close()
+    with get_database().connection() as conn:
+        user = conn.execute("SELECT * FROM users WHERE username = ?", (username,)).fetchone()
+    
+    # A legacy or outdated hash is replaced after a successful login; the writer thread stores it
+    matches, rehash = verify_password(password, user[2] if user else None)
+    if matches and rehash:
+        get_database().write("UPDATE users SET password_hash = ? WHERE id = ?", (rehash, user[0]))
+    limiter.record(username, matches)
     
-    if user and user[2] == hash_password(password):
+    if matches:
+        # Buffered in memory and written out in batches, so it adds nothing to the login
+        get_activity_log().record_login(user[0])
         return True, "Login successful!"
     else:
         return False, "Invalid username or password"
@@ -300,7 +303,10 @@ def main():
                         st.error(password_error, icon="🚨")
                     else:
                         # Register user
-                        error = register_user(username, password)
+                        try:
+                            error = register_user(username, password)
+                        except PasswordServiceBusy as e:
+                            error = str(e)
                         if error:
                             st.error(error, icon="🚨")
                         else:
@@ -338,7 +344,10 @@ def main():
                     st.error("Password is required", icon="🚨")
                 else:
                     # Authenticate user
-                    success, message = authenticate_user(username, password)
+                    try:
+                        success, message = authenticate_user(username, password)
+                    except PasswordServiceBusy as e:
+                        success, message = False, str(e)
                     if success:
                         st.success(message, icon="✅")
                         # Store login state in session
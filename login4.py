@@ -1,8 +1,15 @@
 import streamlit as st
 import re
-import hashlib
-import sqlite3
 from datetime import datetime
+from auth_db import get_database, insert_result
+from passwords import PasswordServiceBusy, hash_password, verify_password
+from rate_limit import get_rate_limiter
+from user_index import get_user_index, record_user
+from activity import get_activity_log
+from sessions import SESSION_LIFETIME, get_session_store
+
+# "Remember me" cookie holding the session token (see sessions.py)
+SESSION_COOKIE = "capital_compass_session"
 
 # Page configuration
 st.set_page_config(
@@ -162,24 +169,21 @@ def set_bg_image():
 
 set_bg_image()
 
-# Database setup
+# Database setup; the schema is applied once per process rather than on every rerun
 def init_db():
-    conn = sqlite3.connect('capital_compass.db')
-    c = conn.cursor()
-    c.execute('''
+    get_database().init_schema('''
         CREATE TABLE IF NOT EXISTS users (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
             username TEXT UNIQUE NOT NULL,
             password_hash TEXT NOT NULL,
             created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-        )
+        );
+        -- Names differing only in case are the same name, as user_index treats them
+        CREATE UNIQUE INDEX IF NOT EXISTS idx_users_username_nocase ON users(username COLLATE NOCASE);
+        -- Login activity kept by activity.py, added to tables created before it
+        ALTER TABLE users ADD COLUMN last_login TIMESTAMP;
+        ALTER TABLE users ADD COLUMN login_count INTEGER NOT NULL DEFAULT 0
     ''')
-    conn.commit()
-    conn.close()
-
-# Password hashing
-def hash_password(password):
-    return hashlib.sha256(password.encode()).hexdigest()
 
 # Password validation
 def validate_password(password):
@@ -197,43 +201,89 @@ def validate_password(password):
 
 # User registration
 def register_user(username, password):
-    conn = sqlite3.connect('capital_compass.db')
-    c = conn.cursor()
-    
-    # Check if username already exists
-    c.execute("SELECT * FROM users WHERE username = ?", (username,))
-    if c.fetchone():
-        conn.close()
-        return "Username already exists"
-    
-    # Hash password and store user
+    # Hash password and store user in one INSERT; the UNIQUE constraint on username rejects
+    # a taken name, so there is no separate check beforehand
     password_hash = hash_password(password)
-    c.execute("INSERT INTO users (username, password_hash) VALUES (?, ?)", 
-              (username, password_hash))
-    conn.commit()
-    conn.close()
+    result = insert_result(get_database().write("INSERT INTO users (username, password_hash) VALUES (?, ?)",
+                                                (username, password_hash)))
+    if not result['created']:
+        return "Username already exists. Available: " + ", ".join(get_user_index().suggest(username))
+    record_user(username=username)
     return None
 
 # User authentication
 def authenticate_user(username, password):
-    conn = sqlite3.connect('capital_compass.db')
-    c = conn.cursor()
+    # Throttled attempts are turned away before the database lookup and the password hash
+    limiter = get_rate_limiter()
+    allowed, message = limiter.check(username, st.context.ip_address)
+    if not allowed:
+        return False, message, None
     
     # Get user by username
-    c.execute("SELECT * FROM users WHERE username = ?", (username,))
-    user = c.fetchone()
-    conn.close()
+    with get_database().connection() as conn:
+        user = conn.execute("SELECT * FROM users WHERE username = ?", (username,)).fetchone()
+    
+    # A legacy or outdated hash is replaced after a successful login; the writer thread stores it
+    matches, rehash = verify_password(password, user[2] if user else None)
+    if matches and rehash:
+        get_database().write("UPDATE users SET password_hash = ? WHERE id = ?", (rehash, user[0]))
+    limiter.record(username, matches)
     
-    if user and user[2] == hash_password(password):
-        return True, "Login successful!"
+    if matches:
+        # Buffered in memory and written out in batches, so it adds nothing to the login
+        get_activity_log().record_login(user[0])
+        return True, "Login successful!", user[0]
     else:
-        return False, "Invalid username or password"
+        return False, "Invalid username or password", None
+
+# Streamlit can read the request's cookies but cannot send headers, so the cookie is written
+# by a script in the page. That means it cannot be HttpOnly; SameSite=Strict keeps it off
+# cross-site requests, and rotating the token daily limits what a copied one is worth.
+def set_session_cookie(token, max_age=SESSION_LIFETIME):
+    st.html(
+        f"<script>document.cookie = '{SESSION_COOKIE}={token}; Max-Age={max_age}; Path=/; SameSite=Strict'"
+        " + (location.protocol === 'https:' ? '; Secure' : '');</script>",
+        unsafe_allow_javascript=True
+    )
+
+# Revoke the remembered session, if any, and forget the login
+def logout():
+    token = st.session_state.pop("session_token", None)
+    if token:
+        get_session_store().revoke(token)
+        st.session_state.clear_session_cookie = True
+    for key in ("logged_in", "username", "user_id"):
+        st.session_state.pop(key, None)
 
 # Main application
 def main():
     # Initialize database
     init_db()
     
+    # "Remember me": the session cookie signs the user back in without a password check,
+    # checked once per browser session and usually from the session cache. A token due for
+    # rotation is replaced; the cookie is only cleared on logout, so a stale or contested
+    # token never signs another tab out.
+    if st.session_state.pop("clear_session_cookie", False):
+        set_session_cookie("", max_age=0)
+    token = st.context.cookies.get(SESSION_COOKIE)
+    if token and not st.session_state.get("logged_in") and not st.session_state.get("session_checked"):
+        st.session_state.session_checked = True
+        session, new_token = get_session_store().refresh(token)
+        if session:
+            st.session_state.logged_in = True
+            st.session_state.username = session['username']
+            st.session_state.user_id = session['user_id']
+            st.session_state.session_token = new_token or token
+            if new_token:
+                set_session_cookie(new_token)
+            get_activity_log().record_login(session['user_id'])
+            st.success(f"Welcome back, {session['username']}!", icon="✅")
+    
+    if st.session_state.get("logged_in"):
+        st.write(f"Signed in as **{st.session_state.username}**")
+        st.button("Log out", key="logout_btn", on_click=logout)
+    
     # Header section
     st.markdown('<div class="header">', unsafe_allow_html=True)
     st.markdown('<div class="compass-icon">🧭</div>', unsafe_allow_html=True)
@@ -318,7 +368,10 @@ def main():
                         st.error(password_error, icon="🚨")
                     else:
                         # Register user
-                        error = register_user(username, password)
+                        try:
+                            error = register_user(username, password)
+                        except PasswordServiceBusy as e:
+                            error = str(e)
                         if error:
                             st.error(error, icon="🚨")
                         else:
@@ -356,12 +409,19 @@ def main():
                     st.error("Password is required", icon="🚨")
                 else:
                     # Authenticate user
-                    success, message = authenticate_user(username, password)
+                    try:
+                        success, message, user_id = authenticate_user(username, password)
+                    except PasswordServiceBusy as e:
+                        success, message, user_id = False, str(e), None
                     if success:
                         st.success(message, icon="✅")
-                        # Store login state in session
+                        # Store login state in session; user_id links saved plans to the account
                         st.session_state.logged_in = True
                         st.session_state.username = username
+                        st.session_state.user_id = user_id
+                        if remember_me:
+                            st.session_state.session_token = get_session_store().create(user_id, username)
+                            set_session_cookie(st.session_state.session_token)
                     else:
                         st.error(message, icon="🚨")
         
@@ -0,0 +1,62 @@
+import os
+import numpy as np
+
+from retirement_engine import calculate_retirement
+
+# Bundled period life table (q_x by age and sex) and the oldest age we plan for
+LIFE_TABLE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "life_table.csv")
+MAX_PLANNING_AGE = 110
+SEXES = ('male', 'female', 'unisex')
+
+_life_table = None
+
+
+# Mortality rates indexed by age for each sex, loaded once per process; unisex is the simple
+# average of the two
+def load_life_table():
+    global _life_table
+    if _life_table is None:
+        # Drop the comment block and the header row before parsing
+        with open(LIFE_TABLE_PATH) as f:
+            rows = [line for line in f if not line.startswith('#')][1:]
+        data = np.loadtxt(rows, delimiter=',')
+        table = {'male': data[:, 1], 'female': data[:, 2]}
+        table['unisex'] = (table['male'] + table['female']) / 2
+        _life_table = table
+    return _life_table
+
+
+# survival[t] = probability of being alive t years from now, for t = 0 .. max_age - current_age + 1
+def survival_curve(current_age, sex='unisex', max_age=MAX_PLANNING_AGE):
+    if sex not in SEXES:
+        raise ValueError(f"Unknown sex {sex!r}; expected one of {SEXES}")
+    q = load_life_table()[sex][current_age:max_age + 1]
+    return np.concatenate(([1.0], np.cumprod(1 - q)))
+
+
+# Deterministic plan weighted by survival instead of a single life expectancy. The plan is
+# projected to MAX_PLANNING_AGE and each year without savings counts in proportion to the
+# chance of being alive to see it.
+def survival_weighted_outcomes(inputs, sex='unisex', contributions=None):
+    current_age = inputs['current_age']
+    results = calculate_retirement(**{**inputs, 'life_expectancy': MAX_PLANNING_AGE},
+                                   contributions=contributions)
+    survival = survival_curve(current_age, sex)[:MAX_PLANNING_AGE - current_age + 1]
+
+    ages = np.arange(current_age, MAX_PLANNING_AGE + 1)
+    depletion_age = results['depletion_age']
+    unfunded = ages >= depletion_age if depletion_age is not None else np.zeros(ages.size, dtype=bool)
+    first_unfunded = unfunded & (ages == depletion_age)
+
+    # Curtate lifetime in whole years; the median is the first age with survival below one half
+    below_half = np.flatnonzero(survival < 0.5)
+    median_age = current_age + int(below_half[0]) - 1 if below_half.size else MAX_PLANNING_AGE
+
+    return {
+        'depletion_age': depletion_age,
+        'probability_of_ruin': float((survival * first_unfunded).sum()),
+        'expected_unfunded_years': float((survival * unfunded).sum()),
+        'probability_outlive_expectancy': float(survival[min(inputs['life_expectancy'] - current_age + 1,
+                                                             survival.size - 1)]),
+        'median_death_age': median_age,
+    }
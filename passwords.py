@@ -0,0 +1,151 @@
+import os
+import hmac
+import time
+import base64
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+# Password hashing shared by the login and registration pages. Hashes use scrypt, a
+# memory-hard KDF, with a random salt per password, stored as
+#   scrypt$<log2 n>$<r>$<p>$<salt>$<hash>
+# so every hash carries the parameters it was made with. hash_password and verify_password
+# block the calling script thread until its hash is done; hashlib.scrypt releases the GIL, so
+# other sessions' script threads keep running meanwhile. Hashes run on the pool below, which
+# bounds how many run at once and so the memory they use between them.
+
+# Seconds one hash should take on this machine; the cost is calibrated to it on first use
+TARGET_SECONDS = 0.1
+# Bounds on the calibrated cost: n = 2 ** log_n, using 128 * r * n bytes of memory per hash
+MIN_LOG_N = 14
+MAX_LOG_N = 17
+BLOCK_SIZE = 8
+# Memory all HASH_WORKERS hashes may use at once; it caps log_n below MAX_LOG_N when needed
+# (64 MiB per hash, log_n 16, with the defaults)
+MAX_HASH_MEMORY = 256 * 2 ** 20
+PARALLELISM = 1
+SALT_BYTES = 16
+KEY_BYTES = 32
+# Hashes computed at once; further requests queue for a worker
+HASH_WORKERS = 4
+# Requests allowed to wait for a worker before new ones are turned away
+MAX_PENDING = 64
+
+# Formats written before this module, all unsalted or with one salt shared by every user:
+# plain SHA-256 (login*.py, h4.py) and SHA-256 over the password plus a fixed salt (h5.py,
+# h6.py, h8.py). They are still accepted, and verify_password asks for a rehash when one
+# matches.
+LEGACY_SALT = "capital_compass_salt_2023"
+LEGACY_SCHEMES = (
+    lambda password: hashlib.sha256(password.encode()).hexdigest(),
+    lambda password: hashlib.sha256((password + LEGACY_SALT).encode()).hexdigest(),
+)
+
+
+class PasswordServiceBusy(RuntimeError):
+    pass
+
+
+_pool = ThreadPoolExecutor(max_workers=HASH_WORKERS, thread_name_prefix='password-hash')
+_pending = threading.BoundedSemaphore(HASH_WORKERS + MAX_PENDING)
+
+
+def _encode(data):
+    return base64.b64encode(data).decode('ascii')
+
+
+def _scrypt(password, salt, log_n, r, p):
+    n = 2 ** log_n
+    return hashlib.scrypt(password.encode(), salt=salt, n=n, r=r, p=p,
+                          maxmem=256 * r * n * p, dklen=KEY_BYTES)
+
+
+# The largest log2 n (within bounds and the memory budget) whose hash takes no longer than
+# `target` seconds, extrapolated from timing the smallest cost; scrypt's time is linear in n
+def calibrate(target=TARGET_SECONDS):
+    salt = os.urandom(SALT_BYTES)
+    _scrypt('calibration', salt, MIN_LOG_N, BLOCK_SIZE, PARALLELISM)
+    start = time.perf_counter()
+    _scrypt('calibration', salt, MIN_LOG_N, BLOCK_SIZE, PARALLELISM)
+    elapsed = time.perf_counter() - start
+    max_log_n = MAX_LOG_N
+    while max_log_n > MIN_LOG_N and HASH_WORKERS * 128 * BLOCK_SIZE * 2 ** max_log_n * PARALLELISM > MAX_HASH_MEMORY:
+        max_log_n -= 1
+    log_n = MIN_LOG_N
+    while log_n < max_log_n and elapsed * 2 ** (log_n + 1 - MIN_LOG_N) <= target:
+        log_n += 1
+    return {'log_n': log_n, 'r': BLOCK_SIZE, 'p': PARALLELISM, 'seconds': elapsed * 2 ** (log_n - MIN_LOG_N)}
+
+
+_parameters = None
+_parameters_lock = threading.Lock()
+
+
+# Parameters new hashes are made with, calibrated once per process by the first hash
+def parameters():
+    global _parameters
+    with _parameters_lock:
+        if _parameters is None:
+            _parameters = calibrate()
+        return _parameters
+
+
+def _make_hash(password):
+    params = parameters()
+    salt = os.urandom(SALT_BYTES)
+    key = _scrypt(password, salt, params['log_n'], params['r'], params['p'])
+    return f"scrypt${params['log_n']}${params['r']}${params['p']}${_encode(salt)}${_encode(key)}"
+
+
+# (matches, rehash): whether `password` matches `stored`, and a fresh hash to store in its
+# place when `stored` is a legacy format or was made with a lower cost than today's. A
+# missing `stored` (unknown user) still costs one hash, so it takes as long as a wrong password.
+def _check(password, stored):
+    if stored is None:
+        _make_hash(password)
+        return False, None
+    if not stored.startswith('scrypt$'):
+        matches = any(hmac.compare_digest(scheme(password), stored) for scheme in LEGACY_SCHEMES)
+        return matches, _make_hash(password) if matches else None
+    try:
+        _, log_n, r, p, salt, key = stored.split('$')
+        log_n, r, p = int(log_n), int(r), int(p)
+        salt, key = base64.b64decode(salt), base64.b64decode(key)
+    except ValueError:
+        return False, None
+    matches = hmac.compare_digest(_scrypt(password, salt, log_n, r, p), key)
+    params = parameters()
+    outdated = (log_n, r, p) < (params['log_n'], params['r'], params['p'])
+    return matches, _make_hash(password) if matches and outdated else None
+
+
+def _submit(function, *args):
+    if not _pending.acquire(timeout=TARGET_SECONDS * 10):
+        raise PasswordServiceBusy("Too many sign-ins are being processed right now. Please try again shortly.")
+    future = _pool.submit(function, *args)
+    future.add_done_callback(lambda _: _pending.release())
+    return future
+
+
+# Futures for use off the calling thread; hash_password and verify_password wait on them
+def hash_password_async(password):
+    return _submit(_make_hash, password)
+
+
+def verify_password_async(password, stored):
+    return _submit(_check, password, stored)
+
+
+def hash_password(password):
+    return hash_password_async(password).result()
+
+
+def verify_password(password, stored):
+    return verify_password_async(password, stored).result()
+
+
+if __name__ == "__main__":
+    params = parameters()
+    print(f"scrypt n=2^{params['log_n']} r={params['r']} p={params['p']}: "
+          f"{params['seconds'] * 1000:.0f} ms per hash (target {TARGET_SECONDS * 1000:.0f} ms), "
+          f"{128 * params['r'] * 2 ** params['log_n'] * params['p'] / 2 ** 20:.0f} MiB")
@@ -0,0 +1,108 @@
+import os
+import time
+import zlib
+import pickle
+import threading
+
+from auth_db import get_database
+from retirement_engine import ENGINE_VERSION
+
+# Shared, content-addressed store of computed plans. Every Streamlit process opens the same
+# file through the pooled WAL database from auth_db, so hits survive restarts, are shared
+# between workers, and readers never wait on a writer. Writes go through the database's
+# writer thread.
+CACHE_DB_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "plan_cache.db")
+MAX_CACHE_BYTES = 256 * 1024 * 1024
+# Evict down to this share of the limit, so a full cache does not evict on every write
+EVICT_TO = 0.9
+# Hits are only read; their last_used times are collected in memory and written in one batch
+# at most every TOUCH_INTERVAL seconds, which is plenty of precision for LRU eviction
+TOUCH_INTERVAL = 30.0
+
+CACHE_SCHEMA = '''
+    CREATE TABLE IF NOT EXISTS plan_cache (
+        key TEXT PRIMARY KEY,
+        engine_version TEXT NOT NULL,
+        payload BLOB NOT NULL,
+        size INTEGER NOT NULL,
+        created_at REAL NOT NULL,
+        last_used REAL NOT NULL
+    );
+    CREATE INDEX IF NOT EXISTS idx_plan_cache_last_used ON plan_cache(last_used)
+'''
+
+_touch_lock = threading.Lock()
+# key -> time of its latest hit not yet written
+_touched = {}
+_last_touch_write = 0.0
+
+
+def _database():
+    database = get_database(CACHE_DB_PATH)
+    database.init_schema(CACHE_SCHEMA)
+    return database
+
+
+# Record a hit; once TOUCH_INTERVAL has passed since the last batch, queue the hits collected
+# so far as one write
+def _touch(key):
+    global _touched, _last_touch_write
+    now = time.time()
+    with _touch_lock:
+        _touched[key] = now
+        if now - _last_touch_write < TOUCH_INTERVAL:
+            return
+        touched, _touched, _last_touch_write = _touched, {}, now
+    rows = [(used, key) for key, used in touched.items()]
+    _database().submit(lambda conn: conn.executemany('UPDATE plan_cache SET last_used = ? WHERE key = ?', rows))
+
+
+# Cached value for a key, or None. Entries from another engine version never match; they
+# simply age out.
+def get(key):
+    with _database().connection() as conn:
+        row = conn.execute('SELECT payload FROM plan_cache WHERE key = ? AND engine_version = ?',
+                           (key, ENGINE_VERSION)).fetchone()
+    if row is None:
+        return None
+    _touch(key)
+    return pickle.loads(zlib.decompress(row[0]))
+
+
+# Store a value, evicting least-recently-used entries once the cache is over its size limit.
+# The insert and the eviction commit together, so readers see either the old or new state.
+# Returns the write's Future; nobody needs to wait for it.
+def put(key, value):
+    payload = zlib.compress(pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL))
+    now = time.time()
+
+    def store(conn):
+        conn.execute('INSERT OR REPLACE INTO plan_cache (key, engine_version, payload, size, created_at, last_used) '
+                     'VALUES (?, ?, ?, ?, ?, ?)', (key, ENGINE_VERSION, payload, len(payload), now, now))
+        total = conn.execute('SELECT COALESCE(SUM(size), 0) FROM plan_cache').fetchone()[0]
+        if total > MAX_CACHE_BYTES:
+            _evict(conn, total - int(MAX_CACHE_BYTES * EVICT_TO))
+
+    return _database().submit(store)
+
+
+def _evict(conn, excess):
+    freed = 0
+    victims = []
+    cursor = conn.execute('SELECT key, size FROM plan_cache ORDER BY last_used')
+    for key, size in cursor:
+        if freed >= excess:
+            break
+        victims.append((key,))
+        freed += size
+    cursor.close()
+    conn.executemany('DELETE FROM plan_cache WHERE key = ?', victims)
+
+
+# Look a plan up in the shared cache and compute (and store) it only on a miss
+def cached(key, compute):
+    value = get(key)
+    if value is None:
+        value = compute()
+        put(key, value)
+    return value
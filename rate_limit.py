@@ -0,0 +1,239 @@
+import time
+import logging
+import threading
+from collections import OrderedDict
+
+from auth_db import get_database
+
+# Login throttling for authenticate_user. Every attempt takes a token from two buckets, one
+# for the username and one for the client (its IP address); an attempt finding either bucket
+# empty is rejected before the users table is read or a password hashed. Buckets refill at a
+# steady rate up to their burst size. A client without a known address (Streamlit reports
+# none on localhost and behind some proxies) only has the username bucket, rather than
+# sharing one bucket with every other such client. Separately, a username is locked for
+# LOCKOUT_SECONDS after MAX_FAILURES wrong passwords with no more than LOCKOUT_SECONDS
+# between them; a count left alone that long is forgotten.
+#
+# Buckets and failure counts are checked in memory and kept in SQLite, so a restart does not
+# hand an attacker a fresh allowance. Every PERSIST_INTERVAL seconds the buckets and counts
+# changed since the last save are upserted, rows that have refilled or expired are deleted,
+# and lockouts set by other processes on the same database are picked up. Several processes
+# can share the tables, since each only writes the keys it changed. A lockout is written
+# through as soon as it is set. No login waits on a write.
+
+# (tokens per second, burst) per bucket kind
+USERNAME_LIMIT = (5 / 60, 5)
+CLIENT_LIMIT = (30 / 60, 20)
+MAX_FAILURES = 10
+LOCKOUT_SECONDS = 15 * 60
+# Buckets and failure counts kept in memory; the least recently used are dropped first, and
+# by then they have usually refilled or expired anyway
+MAX_BUCKETS = 100000
+MAX_LOCKOUTS = 100000
+PERSIST_INTERVAL = 10.0
+# Seconds after which any bucket has refilled, so its row can go
+REFILL_SECONDS = max(burst / rate for rate, burst in (USERNAME_LIMIT, CLIENT_LIMIT))
+
+THROTTLE_SCHEMA = '''
+    CREATE TABLE IF NOT EXISTS login_buckets (
+        key TEXT PRIMARY KEY,
+        tokens REAL NOT NULL,
+        updated_at REAL NOT NULL
+    );
+    CREATE TABLE IF NOT EXISTS login_lockouts (
+        username TEXT PRIMARY KEY,
+        failures INTEGER NOT NULL,
+        locked_until REAL,
+        last_failure REAL NOT NULL
+    )
+'''
+UPSERT_BUCKET = '''
+    INSERT INTO login_buckets (key, tokens, updated_at) VALUES (?, ?, ?)
+    ON CONFLICT (key) DO UPDATE SET tokens = excluded.tokens, updated_at = excluded.updated_at
+'''
+UPSERT_LOCKOUT = '''
+    INSERT INTO login_lockouts (username, failures, locked_until, last_failure) VALUES (?, ?, ?, ?)
+    ON CONFLICT (username) DO UPDATE SET failures = excluded.failures, locked_until = excluded.locked_until,
+        last_failure = excluded.last_failure
+'''
+
+logger = logging.getLogger(__name__)
+
+_registry_lock = threading.Lock()
+_limiters = {}
+
+
+class RateLimiter:
+    def __init__(self, database):
+        self.database = database
+        self.limits = {'user': USERNAME_LIMIT, 'client': CLIENT_LIMIT}
+        self._lock = threading.Lock()
+        # key -> [tokens, updated_at], in least recently used order
+        self._buckets = OrderedDict()
+        # username -> [consecutive failures, locked until, last failure], least recently
+        # failed first
+        self._lockouts = OrderedDict()
+        # Keys changed since the last save, and whether any failure count has expired since
+        self._dirty_buckets = set()
+        self._dirty_lockouts = set()
+        self._expired = False
+        self._stats = {'allowed': 0, 'throttled': 0, 'locked_out': 0, 'persist_errors': 0}
+        self._load()
+        threading.Thread(target=self._persist_loop, daemon=True, name='login-throttle').start()
+
+    def _load(self):
+        self.database.init_schema(THROTTLE_SCHEMA)
+        with self.database.connection() as conn:
+            for key, tokens, updated_at in conn.execute('SELECT key, tokens, updated_at FROM login_buckets'):
+                self._buckets[key] = [tokens, updated_at]
+            for username, failures, locked_until, last_failure in conn.execute(
+                    'SELECT username, failures, locked_until, last_failure FROM login_lockouts ORDER BY last_failure'):
+                self._lockouts[username] = [failures, locked_until or 0.0, last_failure]
+
+    # Adopt lockouts other processes have saved since this one loaded
+    def _load_lockouts(self, now):
+        with self.database.connection() as conn:
+            rows = conn.execute('''
+                SELECT username, failures, locked_until, last_failure FROM login_lockouts WHERE locked_until > ?
+            ''', (now,)).fetchall()
+        with self._lock:
+            for username, failures, locked_until, last_failure in rows:
+                entry = self._lockouts.get(username)
+                if entry is None or entry[1] < locked_until:
+                    self._lockouts[username] = [failures, locked_until, last_failure]
+
+    # (tokens, burst) of a bucket at `now`, after refilling since its last update
+    def _refill(self, key, bucket, now):
+        rate, burst = self.limits[key.split(':', 1)[0]]
+        if bucket is None:
+            return burst, burst
+        return min(burst, bucket[0] + (now - bucket[1]) * rate), burst
+
+    # (allowed, message). An allowed attempt uses up a token from each bucket; a rejected one
+    # uses none. `client` is None when the address is unknown.
+    def check(self, username, client):
+        now = time.time()
+        username = username.strip().lower()
+        keys = (f'user:{username}',) + ((f'client:{client}',) if client else ())
+        with self._lock:
+            lockout = self._lockouts.get(username)
+            if lockout and lockout[1] > now:
+                self._stats['locked_out'] += 1
+                minutes = int((lockout[1] - now) // 60) + 1
+                return False, f"Too many failed attempts. Try again in {minutes} minute{'s' if minutes > 1 else ''}."
+
+            tokens = [self._refill(key, self._buckets.get(key), now)[0] for key in keys]
+            if min(tokens) < 1:
+                self._stats['throttled'] += 1
+                return False, "Too many login attempts. Please wait a moment and try again."
+
+            for key, left in zip(keys, tokens):
+                self._buckets[key] = [left - 1, now]
+                self._buckets.move_to_end(key)
+                self._dirty_buckets.add(key)
+            while len(self._buckets) > MAX_BUCKETS:
+                self._buckets.popitem(last=False)
+            self._stats['allowed'] += 1
+        return True, None
+
+    # Count a wrong password towards the lockout, or clear the count after a correct one
+    def record(self, username, success):
+        username = username.strip().lower()
+        now = time.time()
+        with self._lock:
+            if success:
+                if self._lockouts.pop(username, None) is not None:
+                    self._dirty_lockouts.add(username)
+                return
+            failures, locked_until, last_failure = self._lockouts.pop(username, [0, 0.0, now])
+            if now - last_failure > LOCKOUT_SECONDS:
+                failures = 0
+            failures += 1
+            locked = failures >= MAX_FAILURES
+            if locked:
+                failures, locked_until = 0, now + LOCKOUT_SECONDS
+            self._lockouts[username] = [failures, locked_until, now]
+            while len(self._lockouts) > MAX_LOCKOUTS:
+                self._lockouts.popitem(last=False)
+            # The periodic save writes it too, in case the write below fails
+            self._dirty_lockouts.add(username)
+        if locked:
+            # Saved straight away, so other processes see the lockout at their next save
+            self.database.write(UPSERT_LOCKOUT, (username, failures, locked_until, now))
+
+    # Forget failure counts that are neither locking a username nor recent enough to count
+    def _expire(self, now):
+        while self._lockouts:
+            username, (_, _, last_failure) = next(iter(self._lockouts.items()))
+            if last_failure + LOCKOUT_SECONDS > now:
+                break
+            del self._lockouts[username]
+            self._expired = True
+
+    # Save what changed since the last save: upsert changed buckets and failure counts, delete
+    # the counts cleared by a successful login, and delete every row (this process's or
+    # another's) that has refilled or expired. Returns the write's Future, or None when
+    # nothing changed.
+    def persist(self):
+        now = time.time()
+        with self._lock:
+            self._expire(now)
+            if not (self._dirty_buckets or self._dirty_lockouts or self._expired):
+                return None
+            dirty_buckets, self._dirty_buckets = self._dirty_buckets, set()
+            dirty_lockouts, self._dirty_lockouts = self._dirty_lockouts, set()
+            self._expired = False
+            buckets = [(key, *self._buckets[key]) for key in dirty_buckets if key in self._buckets]
+            lockouts = [(username, *self._lockouts[username]) for username in dirty_lockouts
+                        if username in self._lockouts]
+            cleared = [(username,) for username in dirty_lockouts if username not in self._lockouts]
+
+        def save(conn):
+            conn.executemany(UPSERT_BUCKET, buckets)
+            conn.executemany(UPSERT_LOCKOUT, lockouts)
+            conn.executemany('DELETE FROM login_lockouts WHERE username = ?', cleared)
+            conn.execute('DELETE FROM login_buckets WHERE updated_at <= ?', (now - REFILL_SECONDS,))
+            conn.execute('''
+                DELETE FROM login_lockouts WHERE last_failure <= ? AND COALESCE(locked_until, 0) <= ?
+            ''', (now - LOCKOUT_SECONDS, now))
+            return len(buckets) + len(lockouts) + len(cleared)
+
+        future = self.database.submit(save)
+        # Put the keys back if the save fails, so the next round writes them again
+        future.add_done_callback(lambda done: self._requeue(done, dirty_buckets, dirty_lockouts))
+        return future
+
+    def _requeue(self, done, dirty_buckets, dirty_lockouts):
+        if done.cancelled() or done.exception() is not None:
+            with self._lock:
+                self._dirty_buckets |= dirty_buckets
+                self._dirty_lockouts |= dirty_lockouts
+                self._expired = True
+
+    # A failed save is logged and counted, and its keys are saved again next round
+    def _persist_loop(self):
+        while True:
+            time.sleep(PERSIST_INTERVAL)
+            try:
+                future = self.persist()
+                if future is not None:
+                    future.result()
+                self._load_lockouts(time.time())
+            except Exception:
+                logger.exception("Saving login throttle state to %s failed", self.database.path)
+                with self._lock:
+                    self._stats['persist_errors'] += 1
+
+    def metrics(self):
+        with self._lock:
+            return {**self._stats, 'buckets': len(self._buckets), 'failure_counts': len(self._lockouts),
+                    'locked_out_users': sum(until > time.time() for _, until, _ in self._lockouts.values())}
+
+
+# One limiter per database for the whole process, shared by every session
+def get_rate_limiter(database=None):
+    database = database or get_database()
+    with _registry_lock:
+        if database.path not in _limiters:
+            _limiters[database.path] = RateLimiter(database)
+        return _limiters[database.path]
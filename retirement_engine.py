@@ -0,0 +1,397 @@
+import json
+import time
+import hashlib
+import numpy as np
+
+from withdrawal_rules import drawdown
+
+# Bump whenever a change alters computed plans, here or in the modules built on the engine
+# (withdrawal rules, annuity tables, tax accounts, Social Security, allocation, debt,
+# mortality) and their data tables, so cached and saved plans are recomputed
+ENGINE_VERSION = "2"
+
+PERCENTILES = (5, 25, 50, 75, 95)
+DEFAULT_VOLATILITY = 15.0
+DEFAULT_CHUNK_SIZE = 2048
+# Small enough that the first provisional answer is ready within ~200 ms
+DEFAULT_FIRST_CHUNK = 512
+
+# Storage precision for simulated paths; float32 halves path memory, which is plenty for
+# percentile and success-rate outputs (see precision_report)
+PRECISIONS = {'float64': np.float64, 'float32': np.float32}
+
+
+class SimulationCancelled(Exception):
+    pass
+
+
+# Numbers are compared as rounded floats so 7 and 7.0 (or 0.1 + 0.2 and 0.3) hash alike
+def _normalise(value):
+    if isinstance(value, bool) or value is None:
+        return value
+    if isinstance(value, (int, float, np.number)):
+        return round(float(value), 9)
+    if isinstance(value, dict):
+        return {str(key): _normalise(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple, np.ndarray)):
+        return [_normalise(item) for item in value]
+    return value
+
+
+# Stable hash of the normalised plan parameters (plus engine version) used to key caches and
+# session state
+def plan_fingerprint(params):
+    payload = json.dumps({'engine': ENGINE_VERSION, 'params': _normalise(params)}, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode()).hexdigest()[:24]
+
+
+# Roll balances forward one year at a time, vectorized across paths:
+#   b[t + 1] = b[t] * growth[t] + flows[t]
+# From year index `floor_from` on, balances are floored at zero. Returns the balances and,
+# per path, the balance index at which savings first ran out (-1 if they never did).
+def roll_forward(start, growth, flows, floor_from=None, out=None):
+    growth = np.atleast_2d(growth)
+    n_paths, n_years = growth.shape
+    flows = np.broadcast_to(flows, (n_paths, n_years))
+    if out is None:
+        out = np.empty((n_paths, n_years + 1), dtype=growth.dtype)
+    out[:, 0] = start
+    depleted_at = np.full(n_paths, -1)
+
+    for t in range(n_years):
+        balance = out[:, t + 1]
+        np.multiply(out[:, t], growth[:, t], out=balance)
+        balance += flows[:, t]
+        if floor_from is not None and t >= floor_from:
+            depleted_at[(balance < 0) & (depleted_at < 0)] = t + 1
+            np.maximum(balance, 0, out=balance)
+
+    return out, depleted_at
+
+
+# Annual growth factors (1 + return) for n paths, drawn from a normal distribution and
+# floored at zero. Draws are always made in float64 so every precision sees the same samples.
+def draw_growth(rng, annual_return, volatility, n_paths, n_years, dtype=np.float64):
+    draws = rng.normal(annual_return / 100, volatility / 100, (n_paths, n_years))
+    return np.maximum(1 + draws, 0).astype(dtype, copy=False)
+
+
+# Curtate future lifetimes (whole years survived) sampled by inverse CDF from a survival
+# curve, where survival[t] is the probability of being alive t years from now. Lifetimes
+# past the end of the curve are capped at its last index.
+def sample_lifetimes(rng, survival, n):
+    death_cdf = 1 - np.asarray(survival[1:])
+    lifetimes = np.searchsorted(death_cdf, rng.random(n), side='right')
+    return np.minimum(lifetimes, len(survival) - 2)
+
+
+# Per-year contributions for the accumulation phase, built with array operations. Index t is
+# the year that ends at age current_age + t + 1.
+#   - the employee contribution grows with salary at `salary_growth` % a year
+#   - `catch_up` is added to the employee contribution from `catch_up_age` on
+#   - `overrides` maps an age to the employee contribution for that year
+#   - the employer adds `employer_match` % of the employee contribution, capped at
+#     `match_cap` % of salary
+def contribution_schedule(current_age, retirement_age, annual_contribution, salary=0.0,
+                          salary_growth=0.0, employer_match=0.0, match_cap=0.0,
+                          catch_up=0.0, catch_up_age=50, overrides=None):
+    n_years = max(retirement_age - current_age, 0)
+    ages = current_age + 1 + np.arange(n_years)
+    salary_index = (1 + salary_growth / 100) ** np.arange(n_years)
+
+    employee = annual_contribution * salary_index + np.where(ages >= catch_up_age, catch_up, 0.0)
+    if overrides:
+        override_years = np.array([int(age) for age in overrides]) - current_age - 1
+        amounts = np.array([float(amount) for amount in overrides.values()])
+        in_range = (override_years >= 0) & (override_years < n_years)
+        employee[override_years[in_range]] = amounts[in_range]
+
+    match = np.minimum(employee * employer_match / 100, salary * salary_index * match_cap / 100)
+    return employee + match
+
+
+# Retirement-year income gap: desired income inflated to the retirement date less fixed income
+def retirement_shortfall(desired_income, inflation_rate, years_to_retirement,
+                         pension_income, social_security):
+    income_needed = desired_income * (1 + inflation_rate / 100) ** years_to_retirement
+    return income_needed - (pension_income + social_security)
+
+
+# Lifetime cash flows of a plan: contributions until retirement, then the shortfall withdrawn
+# each year until life expectancy. A retirement age past life expectancy (or before the
+# current age) leaves that phase empty rather than negative.
+def plan_flows(inputs, contributions=None):
+    years_to_retirement = max(inputs['retirement_age'] - inputs['current_age'], 0)
+    retirement_duration = max(inputs['life_expectancy'] - inputs['retirement_age'], 0)
+    shortfall = retirement_shortfall(inputs['desired_income'], inputs['inflation_rate'],
+                                     years_to_retirement, inputs['pension_income'],
+                                     inputs['social_security'])
+    if contributions is None:
+        contributions = np.full(years_to_retirement, float(inputs['annual_contribution']))
+    return np.concatenate((contributions, np.full(retirement_duration, -shortfall)))
+
+
+# Deterministic projection used by the calculator page. `contributions` is an optional
+# per-year schedule (see contribution_schedule) replacing the flat annual contribution.
+def calculate_retirement(current_age, retirement_age, life_expectancy, current_savings,
+                         annual_contribution, annual_return, inflation_rate, desired_income,
+                         pension_income, social_security, contributions=None):
+
+    # Calculate years until retirement and retirement duration; either is empty rather than
+    # negative when the ages are out of order (e.g. retiring after life expectancy)
+    years_to_retirement = max(retirement_age - current_age, 0)
+    retirement_duration = max(life_expectancy - retirement_age, 0)
+    rate = annual_return / 100
+
+    # Savings growth until retirement
+    years = np.arange(years_to_retirement + 1)
+    if contributions is None:
+        contributions = np.full(years_to_retirement, float(annual_contribution))
+    savings, _ = roll_forward(float(current_savings), np.full((1, years_to_retirement), 1 + rate),
+                              contributions)
+    savings = savings[0]
+    growth = np.concatenate(([0.0], savings[:-1] * rate))
+    contributions = np.concatenate(([0.0], contributions))
+
+    inflation_index = (1 + inflation_rate / 100) ** years
+    inflation_adjusted_savings = savings / inflation_index
+    retirement_income_needed = desired_income * inflation_index
+
+    # Retirement phase: withdraw the shortfall each year until savings run out
+    retirement_savings = float(savings[-1])
+    shortfall = retirement_shortfall(desired_income, inflation_rate, years_to_retirement,
+                                     pension_income, social_security)
+    balance, depleted_at = roll_forward(retirement_savings, np.full((1, retirement_duration), 1 + rate),
+                                        -shortfall, floor_from=0)
+    retirement_years = np.arange(retirement_duration + 1)
+    withdrawals = np.where(retirement_years == 0, 0, shortfall)
+
+    return {
+        'years': years.tolist(),
+        'ages': (current_age + years).tolist(),
+        'savings': savings.tolist(),
+        'contributions': contributions.tolist(),
+        'growth': growth.tolist(),
+        'inflation_adjusted_savings': inflation_adjusted_savings.tolist(),
+        'retirement_income_needed': retirement_income_needed.tolist(),
+        'retirement_years': retirement_years.tolist(),
+        'retirement_ages': (retirement_age + retirement_years).tolist(),
+        'retirement_savings_balance': balance[0].tolist(),
+        'retirement_withdrawals': withdrawals.tolist(),
+        'retirement_savings': retirement_savings,
+        'shortfall': shortfall,
+        'savings_last': bool(depleted_at[0] < 0),
+        'depletion_age': retirement_age + int(depleted_at[0]) if depleted_at[0] >= 0 else None,
+        'retirement_duration': retirement_duration
+    }
+
+
+# Deterministic projection of many plans in one roll_forward batch. `plans` maps each
+# calculate_retirement input to an array with one entry per plan. Horizons differ between
+# plans, so flows are padded with zeros to the longest one; balances are not floored, and a
+# plan's savings run out at its first negative retirement-year balance. Returns retirement
+# savings, whether savings last and the depletion age (-1 if savings last) per plan.
+def project_plans(plans):
+    current_age = np.asarray(plans['current_age'])
+    years_to_retirement = np.maximum(np.asarray(plans['retirement_age']) - current_age, 0)
+    end = np.maximum(np.asarray(plans['life_expectancy']) - current_age, years_to_retirement)
+    n_plans, n_years = current_age.size, int(end.max())
+    shortfall = retirement_shortfall(np.asarray(plans['desired_income'], dtype=np.float64),
+                                     np.asarray(plans['inflation_rate']), years_to_retirement,
+                                     np.asarray(plans['pension_income']), np.asarray(plans['social_security']))
+
+    t = np.arange(n_years)
+    saving = t < years_to_retirement[:, None]
+    retired = ~saving & (t < end[:, None])
+    flows = np.where(saving, np.asarray(plans['annual_contribution'], dtype=np.float64)[:, None],
+                     np.where(retired, -shortfall[:, None], 0.0))
+    growth = np.broadcast_to((1 + np.asarray(plans['annual_return']) / 100)[:, None], (n_plans, n_years))
+    balances, _ = roll_forward(np.asarray(plans['current_savings'], dtype=np.float64), growth, flows)
+
+    negative = retired & (balances[:, 1:] < 0)
+    savings_last = ~negative.any(axis=1)
+    return {
+        'retirement_savings': balances[np.arange(n_plans), years_to_retirement],
+        'savings_last': savings_last,
+        'depletion_age': np.where(savings_last, -1, current_age + negative.argmax(axis=1) + 1),
+    }
+
+
+# Goal seek: the flat annual contribution the plan needs, solved in closed form rather than
+# by trial and error. Balances are linear in the contribution c:
+#   b[t](c) = b[t](0) + c * u[t]
+# where u is what contributions of 1 a year build up on the same path. A path's savings last
+# when every retirement-year balance stays non-negative, which gives each path its own
+# required contribution; the amount that makes `target_success` of the paths succeed is a
+# quantile of those. With zero volatility this is the deterministic plan's answer.
+def required_contribution(inputs, target_success=0.9, n_paths=10000, volatility=DEFAULT_VOLATILITY, seed=0):
+    years_to_retirement = max(inputs['retirement_age'] - inputs['current_age'], 0)
+    flows = plan_flows({**inputs, 'annual_contribution': 0.0})
+    n_years = flows.size
+    if volatility:
+        growth = draw_growth(np.random.default_rng(seed), inputs['annual_return'], volatility, n_paths, n_years)
+    else:
+        growth = np.full((1, n_years), 1 + inputs['annual_return'] / 100)
+
+    base, _ = roll_forward(float(inputs['current_savings']), growth, flows)
+    unit, _ = roll_forward(0.0, growth, (np.arange(n_years) < years_to_retirement).astype(np.float64))
+    base, unit = base[:, years_to_retirement + 1:], unit[:, years_to_retirement + 1:]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        needed = np.where(unit > 0, -base / unit, np.where(base < 0, np.inf, 0.0))
+    per_path = np.maximum(needed.max(axis=1, initial=0.0), 0.0)
+    return float(np.quantile(per_path, target_success, method='higher'))
+
+
+# Wilson score interval for a success proportion (95% by default)
+def wilson_interval(successes, n, z=1.96):
+    if n == 0:
+        return 0.0, 1.0
+    p = successes / n
+    denom = 1 + z ** 2 / n
+    centre = (p + z ** 2 / (2 * n)) / denom
+    half = z * np.sqrt(p * (1 - p) / n + z ** 2 / (4 * n ** 2)) / denom
+    return float(max(centre - half, 0.0)), float(min(centre + half, 1.0))
+
+
+# Number of set flags in a packed bitset (padding bits are always zero)
+def count_bits(bits):
+    return int(np.unpackbits(bits).sum())
+
+
+# Percentile bands and success rate over the completed paths
+def summarize_paths(balances, n_depleted, ages, target_paths=None, unfunded_years=None):
+    n = int(balances.shape[0])
+    successes = n - int(n_depleted)
+    bands = np.percentile(balances, PERCENTILES, axis=0)
+    summary = {
+        'n_paths': n,
+        'target_paths': n if target_paths is None else target_paths,
+        'complete': target_paths is None or n >= target_paths,
+        'success_rate': successes / n,
+        'success_interval': wilson_interval(successes, n),
+        'ages': list(ages),
+        'percentiles': {p: band.tolist() for p, band in zip(PERCENTILES, bands)},
+    }
+    if unfunded_years is not None:
+        summary['expected_unfunded_years'] = float(unfunded_years[:n].mean())
+    return summary
+
+
+# Monte Carlo projection over the whole lifetime with normally distributed annual returns.
+# Paths are generated in chunks; `cancel` (a threading.Event) is checked between chunks so a
+# superseded run stops promptly, and `on_chunk(done, n_paths)` reports progress.
+# `on_partial(summary)` receives provisional summaries of the completed paths: after the
+# small first chunk and then each time the path count doubles, so the percentile work stays
+# proportional to the total run, followed by the final summary.
+# `precision` picks the path storage dtype from PRECISIONS; per-path failure flags are packed
+# into a bitset as each chunk completes, carrying up to 7 flags over to the next chunk so
+# chunk sizes need not be multiples of 8.
+# With a `survival` curve (see mortality.survival_curve) each path also gets a sampled death
+# age: a path only fails if savings run out while the person is still alive, and the summary
+# reports the expected number of unfunded years. The projection should then run to the end
+# of the curve rather than to a point-estimate life expectancy.
+# `contributions` is an optional per-year schedule replacing the flat annual contribution.
+# `withdrawal_rule` (see withdrawal_rules.WITHDRAWAL_RULES) replaces the fixed retirement
+# withdrawal with a path-dependent rule starting from the same first-year amount.
+def run_monte_carlo(inputs, n_paths=10000, volatility=DEFAULT_VOLATILITY, seed=None,
+                    chunk_size=DEFAULT_CHUNK_SIZE, cancel=None, on_chunk=None,
+                    first_chunk=DEFAULT_FIRST_CHUNK, on_partial=None, precision='float64',
+                    survival=None, contributions=None, withdrawal_rule=None):
+    if precision not in PRECISIONS:
+        raise ValueError(f"Unknown precision {precision!r}; expected one of {sorted(PRECISIONS)}")
+    dtype = PRECISIONS[precision]
+
+    years_to_retirement = max(inputs['retirement_age'] - inputs['current_age'], 0)
+    flows = plan_flows(inputs, contributions).astype(dtype)
+    n_years = flows.size
+    shortfall = retirement_shortfall(inputs['desired_income'], inputs['inflation_rate'],
+                                     years_to_retirement, inputs['pension_income'],
+                                     inputs['social_security'])
+
+    rng = np.random.default_rng(seed)
+    balances = np.empty((n_paths, n_years + 1), dtype=dtype)
+    depleted_bits = np.zeros((n_paths + 7) // 8, dtype=np.uint8)
+    # Flags of the last chunk that did not fill a whole byte, and the next byte to write
+    carry, next_byte = np.zeros(0, dtype=bool), 0
+    n_depleted = 0
+    unfunded_years = np.zeros(n_paths, dtype=np.int16) if survival is not None else None
+
+    ages = range(inputs['current_age'], inputs['current_age'] + n_years + 1)
+    next_publish = first_chunk
+
+    done = 0
+    while done < n_paths:
+        if cancel is not None and cancel.is_set():
+            raise SimulationCancelled(f"cancelled after {done} of {n_paths} paths")
+        n = min(first_chunk if done == 0 else chunk_size, n_paths - done)
+        growth = draw_growth(rng, inputs['annual_return'], volatility, n, n_years, dtype)
+        block = balances[done:done + n]
+        if withdrawal_rule is None:
+            _, depleted_at = roll_forward(float(inputs['current_savings']), growth, flows,
+                                          floor_from=years_to_retirement, out=block)
+        else:
+            roll_forward(float(inputs['current_savings']), growth[:, :years_to_retirement],
+                         flows[:years_to_retirement], out=block[:, :years_to_retirement + 1])
+            _, _, depleted_at = drawdown(block[:, years_to_retirement], growth[:, years_to_retirement:],
+                                         shortfall, inputs['inflation_rate'], withdrawal_rule,
+                                         out=block[:, years_to_retirement:])
+            depleted_at = np.where(depleted_at >= 0, depleted_at + years_to_retirement, -1)
+        depleted = depleted_at >= 0
+        if survival is not None:
+            # Per-path mortality mask: only count depletion that happens while still alive
+            lifetimes = sample_lifetimes(rng, survival, n)
+            depleted &= depleted_at <= lifetimes
+            unfunded_years[done:done + n] = np.where(depleted, lifetimes - depleted_at + 1, 0)
+        flags = np.concatenate([carry, depleted])
+        whole = flags.size // 8
+        depleted_bits[next_byte:next_byte + whole] = np.packbits(flags[:whole * 8])
+        carry, next_byte = flags[whole * 8:], next_byte + whole
+        n_depleted += int(depleted.sum())
+        done += n
+        if on_chunk is not None:
+            on_chunk(done, n_paths)
+        if on_partial is not None and next_publish <= done < n_paths:
+            on_partial(summarize_paths(balances[:done], n_depleted, ages, n_paths,
+                                       unfunded_years=unfunded_years))
+            next_publish = done * 2
+
+    if carry.size:
+        depleted_bits[next_byte] = np.packbits(carry)[0]
+    summary = summarize_paths(balances, count_bits(depleted_bits), ages, unfunded_years=unfunded_years)
+    summary['precision'] = precision
+    summary['path_bytes'] = int(balances.nbytes + depleted_bits.nbytes)
+    if on_partial is not None:
+        on_partial(summary)
+    return summary
+
+
+# Accuracy of float32 path storage against the float64 reference on identical samples
+def precision_report(inputs, n_paths=10000, volatility=DEFAULT_VOLATILITY, seed=0):
+    runs = {}
+    for precision in ('float64', 'float32'):
+        start = time.perf_counter()
+        runs[precision] = run_monte_carlo(inputs, n_paths=n_paths, volatility=volatility,
+                                          seed=seed, precision=precision)
+        runs[precision]['seconds'] = time.perf_counter() - start
+
+    reference, compact = runs['float64'], runs['float32']
+    abs_error, rel_error = 0.0, 0.0
+    for p in PERCENTILES:
+        ref_band = np.asarray(reference['percentiles'][p])
+        diff = np.abs(np.asarray(compact['percentiles'][p]) - ref_band)
+        abs_error = max(abs_error, float(diff.max()))
+        scale = np.maximum(np.abs(ref_band), 1.0)
+        rel_error = max(rel_error, float((diff / scale).max()))
+
+    return {
+        'n_paths': n_paths,
+        'success_rate_float64': reference['success_rate'],
+        'success_rate_float32': compact['success_rate'],
+        'success_rate_diff': abs(compact['success_rate'] - reference['success_rate']),
+        'max_percentile_abs_error': abs_error,
+        'max_percentile_rel_error': rel_error,
+        'path_bytes_float64': reference['path_bytes'],
+        'path_bytes_float32': compact['path_bytes'],
+        'seconds_float64': reference['seconds'],
+        'seconds_float32': compact['seconds'],
+    }
@@ -0,0 +1,186 @@
+import os
+import threading
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+
+import matplotlib
+matplotlib.use("Agg")
+import matplotlib.image as mpimg
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.backends.backend_pdf import PdfPages
+
+# Report storage and worker settings
+REPORT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "report_cache")
+REPORT_WORKERS = 2
+CHART_DPI = 150
+
+# Recommendation text shared by the calculator page and the printable report
+RECOMMENDATIONS_ON_TRACK = [
+    "Your current plan appears to be on track for retirement",
+    "Continue with your current savings strategy",
+    "Consider periodically reviewing your plan as your circumstances change",
+]
+RECOMMENDATIONS_SHORTFALL = [
+    "**Increase your savings rate**: Try to save more each year",
+    "**Consider working longer**: Delaying retirement by a few years can significantly improve your financial security",
+    "**Adjust your retirement expectations**: You may need to reduce your desired retirement income",
+    "**Review your investment strategy**: Ensure your portfolio is appropriately allocated for your age and risk tolerance",
+    "**Consider additional income sources**: Part-time work during retirement could help bridge the gap",
+]
+
+# One process-wide pool, so report builds never run on the Streamlit script thread
+_executor = ThreadPoolExecutor(max_workers=REPORT_WORKERS, thread_name_prefix="report")
+_lock = threading.Lock()
+_jobs = {}
+_progress = {}
+
+
+def report_path(key):
+    return os.path.join(REPORT_DIR, f"{key}.pdf")
+
+
+def chart_path(key, name):
+    return os.path.join(REPORT_DIR, f"{key}_{name}.png")
+
+
+# Write a file through a temporary name so readers never see a partial report
+def _atomic_save(path, save):
+    tmp_path = f"{path}.{threading.get_ident()}.tmp"
+    save(tmp_path)
+    os.replace(tmp_path, path)
+
+
+# Rasterise a line chart once per plan; later builds reuse the PNG on disk
+def _render_chart(key, name, title, x, series):
+    path = chart_path(key, name)
+    if os.path.exists(path):
+        return path
+
+    fig = Figure(figsize=(8, 4))
+    FigureCanvasAgg(fig)
+    ax = fig.add_subplot(111)
+    for label, values in series:
+        ax.plot(x, values, linewidth=2, label=label)
+    ax.set_title(title)
+    ax.set_xlabel("Age")
+    ax.set_ylabel("Amount ($)")
+    ax.yaxis.set_major_formatter(lambda v, _: f"${v:,.0f}")
+    ax.grid(alpha=0.3)
+    ax.legend()
+    fig.tight_layout()
+
+    _atomic_save(path, lambda p: fig.savefig(p, format="png", dpi=CHART_DPI))
+    return path
+
+
+def _summary_lines(inputs, results):
+    status = "Sufficient" if results['savings_last'] else "Insufficient"
+    return [
+        f"Current age: {inputs['current_age']}    Retirement age: {inputs['retirement_age']}    "
+        f"Life expectancy: {inputs['life_expectancy']}",
+        f"Current savings: ${inputs['current_savings']:,.0f}    "
+        f"Annual contribution: ${inputs['annual_contribution']:,.0f}",
+        f"Expected return: {inputs['annual_return']:.1f}%    Inflation: {inputs['inflation_rate']:.1f}%",
+        "",
+        f"Years until retirement: {inputs['retirement_age'] - inputs['current_age']}",
+        f"Projected retirement savings: ${results['retirement_savings']:,.0f}",
+        f"Annual shortfall in retirement: ${results['shortfall']:,.0f}",
+        f"Monthly shortfall in retirement: ${results['shortfall'] / 12:,.0f}",
+        f"Retirement duration: {results['retirement_duration']} years",
+        f"Savings status: {status}",
+    ]
+
+
+def _text_page(pdf, title, lines):
+    fig = Figure(figsize=(8.5, 11))
+    FigureCanvasAgg(fig)
+    fig.text(0.08, 0.94, title, fontsize=18, weight="bold")
+    y = 0.89
+    for line in lines:
+        fig.text(0.08, y, line, fontsize=10, wrap=True)
+        y -= 0.03
+    pdf.savefig(fig)
+
+
+def _chart_page(pdf, title, paths):
+    fig = Figure(figsize=(8.5, 11))
+    FigureCanvasAgg(fig)
+    fig.text(0.08, 0.94, title, fontsize=18, weight="bold")
+    for i, path in enumerate(paths):
+        ax = fig.add_axes([0.06, 0.5 - i * 0.44, 0.88, 0.4])
+        ax.imshow(mpimg.imread(path))
+        ax.axis("off")
+    pdf.savefig(fig)
+
+
+def _set_progress(key, value):
+    with _lock:
+        _progress[key] = value
+
+
+# Build the PDF for one plan, reporting progress between the expensive steps
+def _build_report(key, inputs, results):
+    os.makedirs(REPORT_DIR, exist_ok=True)
+    _set_progress(key, 0.1)
+
+    savings_chart = _render_chart(
+        key, "savings", "Retirement Savings Growth", results['ages'],
+        [("Projected Savings", results['savings']),
+         ("Inflation-Adjusted Savings", results['inflation_adjusted_savings'])],
+    )
+    _set_progress(key, 0.4)
+
+    retirement_chart = _render_chart(
+        key, "retirement", "Retirement Savings Balance", results['retirement_ages'],
+        [("Savings Balance", results['retirement_savings_balance'])],
+    )
+    _set_progress(key, 0.7)
+
+    recommendations = RECOMMENDATIONS_ON_TRACK if results['savings_last'] else RECOMMENDATIONS_SHORTFALL
+    summary = _summary_lines(inputs, results)
+    summary += ["", "Recommendations:"]
+    summary += [f"  - {item.replace('**', '')}" for item in recommendations]
+    summary += ["", f"Generated {datetime.now().strftime('%Y-%m-%d %H:%M')}"]
+
+    def save(tmp_path):
+        with PdfPages(tmp_path) as pdf:
+            _text_page(pdf, "Retirement Plan Summary", summary)
+            _chart_page(pdf, "Projections", [savings_chart, retirement_chart])
+
+    _atomic_save(report_path(key), save)
+    _set_progress(key, 1.0)
+    return report_path(key)
+
+
+# Queue a report build, or return straight away if this plan is already on disk.
+# Reports are keyed by the plan fingerprint, which doubles as the cache file name.
+def request_report(key, inputs, results):
+    with _lock:
+        if os.path.exists(report_path(key)):
+            _progress[key] = 1.0
+            return key
+        job = _jobs.get(key)
+        if job is None or (job.done() and job.exception() is not None):
+            _progress[key] = 0.0
+            _jobs[key] = _executor.submit(_build_report, key, inputs, results)
+    return key
+
+
+# Poll a report: returns (progress, pdf path or None, error message or None)
+def report_status(key):
+    with _lock:
+        job = _jobs.get(key)
+        progress = _progress.get(key, 0.0)
+
+    if job is not None and job.done():
+        error = job.exception()
+        if error is not None:
+            return progress, None, str(error)
+        with _lock:
+            _jobs.pop(key, None)
+
+    path = report_path(key)
+    if os.path.exists(path):
+        return 1.0, path, None
+    return progress, None, None
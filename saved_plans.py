@@ -0,0 +1,87 @@
+import json
+import time
+import zlib
+import pickle
+
+from auth_db import get_database
+from retirement_engine import ENGINE_VERSION
+
+
+# Saved plans live next to the accounts created by the login pages, on the shared connection
+# pool. Inputs are kept as JSON so they stay readable; outputs are a compressed pickle, plus
+# the headline numbers as columns so listings never unpack them.
+PLANS_SCHEMA = '''
+    CREATE TABLE IF NOT EXISTS plans (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        user_id INTEGER NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+        name TEXT NOT NULL,
+        engine_version TEXT NOT NULL,
+        fingerprint TEXT NOT NULL,
+        inputs TEXT NOT NULL,
+        outputs BLOB NOT NULL,
+        retirement_savings REAL,
+        savings_last INTEGER,
+        created_at REAL NOT NULL,
+        updated_at REAL NOT NULL,
+        UNIQUE (user_id, name)
+    );
+    CREATE INDEX IF NOT EXISTS idx_plans_user_updated ON plans(user_id, updated_at);
+'''
+
+
+def _database():
+    database = get_database()
+    database.init_schema(PLANS_SCHEMA)
+    return database
+
+
+# Save a plan under `name`, replacing the user's earlier plan of the same name
+def save_plan(user_id, name, fingerprint, inputs, outputs):
+    results = outputs['results']
+    payload = zlib.compress(pickle.dumps(outputs, protocol=pickle.HIGHEST_PROTOCOL))
+    now = time.time()
+    with _database().connection() as conn:
+        conn.execute('''
+            INSERT INTO plans (user_id, name, engine_version, fingerprint, inputs, outputs,
+                               retirement_savings, savings_last, created_at, updated_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT (user_id, name) DO UPDATE SET
+                engine_version = excluded.engine_version, fingerprint = excluded.fingerprint,
+                inputs = excluded.inputs, outputs = excluded.outputs,
+                retirement_savings = excluded.retirement_savings,
+                savings_last = excluded.savings_last, updated_at = excluded.updated_at
+        ''', (user_id, name, ENGINE_VERSION, fingerprint, json.dumps(inputs), payload,
+              float(results['retirement_savings']), int(bool(results['savings_last'])), now, now))
+
+
+# Most recently updated plans first, in one query that walks the (user_id, updated_at) index
+def list_plans(user_id, limit=50):
+    with _database().connection() as conn:
+        rows = conn.execute('''
+            SELECT id, name, engine_version, retirement_savings, savings_last, updated_at
+            FROM plans WHERE user_id = ? ORDER BY updated_at DESC LIMIT ?
+        ''', (user_id, limit)).fetchall()
+    return [
+        {'id': plan_id, 'name': name, 'current': version == ENGINE_VERSION,
+         'retirement_savings': savings, 'savings_last': bool(last), 'updated_at': updated_at}
+        for plan_id, name, version, savings, last, updated_at in rows
+    ]
+
+
+# Saved inputs and outputs of one of the user's plans. Outputs are None when the plan was
+# computed by another engine version, so the caller recomputes them from the inputs.
+def load_plan(user_id, plan_id):
+    with _database().connection() as conn:
+        row = conn.execute('''
+            SELECT engine_version, fingerprint, inputs, outputs FROM plans WHERE id = ? AND user_id = ?
+        ''', (plan_id, user_id)).fetchone()
+    if row is None:
+        return None
+    version, fingerprint, inputs, payload = row
+    outputs = pickle.loads(zlib.decompress(payload)) if version == ENGINE_VERSION else None
+    return {'fingerprint': fingerprint, 'inputs': json.loads(inputs), 'outputs': outputs}
+
+
+def delete_plan(user_id, plan_id):
+    with _database().connection() as conn:
+        conn.execute('DELETE FROM plans WHERE id = ? AND user_id = ?', (plan_id, user_id))
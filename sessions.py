@@ -0,0 +1,195 @@
+import time
+import hashlib
+import secrets
+import threading
+from collections import OrderedDict
+
+from auth_db import get_database
+
+# "Remember me" sessions. The client keeps a random token; the database keeps only its
+# SHA-256 (the token is already 256 random bits, so a slow KDF adds nothing) with the user and
+# an expiry. Validated tokens are cached in an LRU per process, so most page loads check a
+# session without touching SQLite. A cached entry is trusted for CACHE_SECONDS before it is
+# read again, which bounds how long a session revoked from another process stays usable here.
+# A client signing back in with a token older than ROTATE_INTERVAL swaps it for a new one
+# (refresh), so a copied token stops working within a day of its owner's next visit. The old
+# token stays valid for ROTATION_GRACE seconds, for other tabs still holding it and in case
+# the new token never reaches the browser.
+
+SESSION_LIFETIME = 30 * 24 * 3600
+ROTATE_INTERVAL = 24 * 3600
+ROTATION_GRACE = 120
+CACHE_SIZE = 10000
+CACHE_SECONDS = 300
+# Expired sessions are deleted every SWEEP_INTERVAL seconds, SWEEP_BATCH rows per statement
+# so a large backlog never holds the write lock for long
+SWEEP_INTERVAL = 600
+SWEEP_BATCH = 500
+
+SESSIONS_SCHEMA = '''
+    CREATE TABLE IF NOT EXISTS sessions (
+        token_hash TEXT PRIMARY KEY,
+        user_id INTEGER NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+        username TEXT NOT NULL,
+        created_at REAL NOT NULL,
+        expires_at REAL NOT NULL
+    );
+    CREATE INDEX IF NOT EXISTS idx_sessions_expires ON sessions(expires_at)
+'''
+
+_registry_lock = threading.Lock()
+_stores = {}
+
+
+def _hash(token):
+    return hashlib.sha256(token.encode()).hexdigest()
+
+
+class SessionStore:
+    def __init__(self, database):
+        self.database = database
+        self.database.init_schema(SESSIONS_SCHEMA)
+        self._lock = threading.Lock()
+        # token hash -> (session, expires_at, created_at, cached_at), in least recently used order
+        self._cache = OrderedDict()
+        self._stats = {'cache_hits': 0, 'cache_misses': 0, 'created': 0, 'rotated': 0, 'swept': 0}
+        threading.Thread(target=self._sweep_loop, daemon=True, name='session-sweep').start()
+
+    def _remember(self, token_hash, session, expires_at, created_at):
+        with self._lock:
+            self._cache[token_hash] = (session, expires_at, created_at, time.time())
+            self._cache.move_to_end(token_hash)
+            while len(self._cache) > CACHE_SIZE:
+                self._cache.popitem(last=False)
+
+    # Start a session for a user who has just logged in; returns the token for the client
+    def create(self, user_id, username, lifetime=SESSION_LIFETIME):
+        token = secrets.token_urlsafe(32)
+        token_hash = _hash(token)
+        now = time.time()
+        self.database.write('''
+            INSERT INTO sessions (token_hash, user_id, username, created_at, expires_at) VALUES (?, ?, ?, ?, ?)
+        ''', (token_hash, user_id, username, now, now + lifetime)).result()
+        self._remember(token_hash, {'user_id': user_id, 'username': username}, now + lifetime, now)
+        with self._lock:
+            self._stats['created'] += 1
+        return token
+
+    # (session, expires_at, created_at) of a live token, from the cache when it is fresh
+    def _lookup(self, token_hash, now):
+        with self._lock:
+            cached = self._cache.get(token_hash)
+            if cached is not None and now - cached[3] < CACHE_SECONDS:
+                self._cache.move_to_end(token_hash)
+                self._stats['cache_hits'] += 1
+                session, expires_at, created_at, _ = cached
+                return (session, expires_at, created_at) if expires_at > now else None
+            self._stats['cache_misses'] += 1
+
+        with self.database.connection() as conn:
+            row = conn.execute('''
+                SELECT user_id, username, expires_at, created_at FROM sessions WHERE token_hash = ? AND expires_at > ?
+            ''', (token_hash, now)).fetchone()
+        if row is None:
+            with self._lock:
+                self._cache.pop(token_hash, None)
+            return None
+        session = {'user_id': row[0], 'username': row[1]}
+        self._remember(token_hash, session, row[2], row[3])
+        return session, row[2], row[3]
+
+    # {'user_id', 'username'} of a live session, or None for an unknown or expired token
+    def validate(self, token):
+        found = self._lookup(_hash(token), time.time())
+        return found[0] if found else None
+
+    # Swap a live token for a new one with the same user and expiry, in one write so that only
+    # one of two clients presenting the same token gets a replacement. The old token is cut
+    # down to ROTATION_GRACE seconds. Returns (session, new token), or (None, None) for an
+    # unknown or expired token or one already replaced.
+    def rotate(self, token):
+        token_hash = _hash(token)
+        new_token = secrets.token_urlsafe(32)
+        now = time.time()
+        grace_until = now + ROTATION_GRACE
+
+        def swap(conn):
+            row = conn.execute('''
+                SELECT user_id, username, expires_at FROM sessions WHERE token_hash = ? AND expires_at > ?
+            ''', (token_hash, grace_until)).fetchone()
+            if row is not None:
+                conn.execute('UPDATE sessions SET expires_at = ? WHERE token_hash = ?', (grace_until, token_hash))
+                conn.execute('''
+                    INSERT INTO sessions (token_hash, user_id, username, created_at, expires_at) VALUES (?, ?, ?, ?, ?)
+                ''', (_hash(new_token), row[0], row[1], now, row[2]))
+            return row
+
+        row = self.database.submit(swap).result()
+        if row is None:
+            return None, None
+        session = {'user_id': row[0], 'username': row[1]}
+        with self._lock:
+            cached = self._cache.get(token_hash)
+            if cached is not None:
+                self._cache[token_hash] = (cached[0], min(cached[1], grace_until), cached[2], cached[3])
+            self._stats['rotated'] += 1
+        self._remember(_hash(new_token), session, row[2], now)
+        return session, new_token
+
+    # Sign a client back in: (session, None) for a live token, validated from the cache when
+    # possible; (session, new token) when the token was due for rotation; (None, None) for an
+    # unknown or expired token. A rotation another client won leaves this one on its old token
+    # for the rest of the grace period.
+    def refresh(self, token):
+        now = time.time()
+        found = self._lookup(_hash(token), now)
+        if found is None:
+            return None, None
+        session, expires_at, created_at = found
+        if now - created_at < ROTATE_INTERVAL or expires_at - now <= ROTATION_GRACE:
+            return session, None
+        rotated, new_token = self.rotate(token)
+        return (rotated, new_token) if rotated else (session, None)
+
+    def revoke(self, token):
+        token_hash = _hash(token)
+        with self._lock:
+            self._cache.pop(token_hash, None)
+        self.database.write('DELETE FROM sessions WHERE token_hash = ?', (token_hash,)).result()
+
+    # Delete expired sessions a batch at a time; returns how many were removed
+    def sweep(self):
+        now = time.time()
+        removed = 0
+        while True:
+            batch = self.database.submit(lambda conn: conn.execute('''
+                DELETE FROM sessions WHERE token_hash IN (
+                    SELECT token_hash FROM sessions WHERE expires_at <= ? LIMIT ?
+                )
+            ''', (now, SWEEP_BATCH)).rowcount).result()
+            removed += batch
+            if batch < SWEEP_BATCH:
+                break
+        with self._lock:
+            self._stats['swept'] += removed
+            for token_hash in [key for key, (_, expires_at, _, _) in self._cache.items() if expires_at <= now]:
+                del self._cache[token_hash]
+        return removed
+
+    def _sweep_loop(self):
+        while True:
+            self.sweep()
+            time.sleep(SWEEP_INTERVAL)
+
+    def metrics(self):
+        with self._lock:
+            return {**self._stats, 'cached': len(self._cache)}
+
+
+# One store per database for the whole process, shared by every session
+def get_session_store(database=None):
+    database = database or get_database()
+    with _registry_lock:
+        if database.path not in _stores:
+            _stores[database.path] = SessionStore(database)
+        return _stores[database.path]
@@ -0,0 +1,111 @@
+import numpy as np
+
+from retirement_engine import DEFAULT_VOLATILITY, draw_growth, roll_forward
+from mortality import MAX_PLANNING_AGE, survival_curve
+
+FULL_RETIREMENT_AGE = 67
+CLAIMING_AGES = np.arange(62, 71)
+
+
+# Share of the primary insurance amount paid when claiming at `claim_age`: reduced by 5/9 of
+# 1% a month for the first 36 months before full retirement age and 5/12 of 1% beyond that,
+# increased by 2/3 of 1% a month of delay up to age 70
+def benefit_factor(claim_age, fra=FULL_RETIREMENT_AGE):
+    months_early = np.clip((fra - np.asarray(claim_age)) * 12, 0, None)
+    months_late = np.clip((np.asarray(claim_age) - fra) * 12, 0, (70 - fra) * 12)
+    reduction = 5 / 900 * np.minimum(months_early, 36) + 5 / 1200 * np.maximum(months_early - 36, 0)
+    return 1 - reduction + 2 / 300 * months_late
+
+
+# Share of the spousal excess paid when the spouse claims at `claim_age`: reduced by 25/36 of
+# 1% a month for the first 36 months early and 5/12 of 1% beyond; no delayed credits
+def spousal_factor(claim_age, fra=FULL_RETIREMENT_AGE):
+    months_early = np.clip((fra - np.asarray(claim_age)) * 12, 0, None)
+    return 1 - 25 / 3600 * np.minimum(months_early, 36) - 5 / 1200 * np.maximum(months_early - 36, 0)
+
+
+# Probability of being alive at the end of each of the next n years, zero past the life table
+def _survival(age, sex, n_years):
+    survival = survival_curve(age, sex)[1:n_years + 1]
+    return np.pad(survival, (0, n_years - survival.size))
+
+
+# Real (today's dollars) household benefits per scenario and projection year. Index t is the
+# year ending when the primary earner turns current_age + t + 1. Returns the scenario claiming
+# ages as (primary, spouse) pairs; spouse ages are -1 for a single claimant.
+def benefit_schedules(current_age, n_years, pia, spouse_pia=None, spouse_age=None):
+    primary_ages = current_age + 1 + np.arange(n_years)
+    if spouse_pia is None:
+        claims = np.column_stack((CLAIMING_AGES, np.full(CLAIMING_AGES.size, -1)))
+    else:
+        claims = np.array([(a, b) for a in CLAIMING_AGES for b in CLAIMING_AGES])
+
+    primary_claim = claims[:, :1]
+    benefits = np.where(primary_ages >= primary_claim, pia * benefit_factor(primary_claim), 0.0)
+
+    if spouse_pia is not None:
+        spouse_ages = spouse_age + 1 + np.arange(n_years)
+        spouse_claim = claims[:, 1:]
+        own = np.where(spouse_ages >= spouse_claim, spouse_pia * benefit_factor(spouse_claim), 0.0)
+        # The spousal top-up starts once both have filed
+        both_filed = (spouse_ages >= spouse_claim) & (primary_ages >= primary_claim)
+        excess = max(0.5 * pia - spouse_pia, 0.0) * spousal_factor(spouse_claim)
+        benefits = benefits + own + np.where(both_filed, excess, 0.0)
+
+    return claims, benefits
+
+
+# Evaluate every claiming age (or every pair of ages for a couple) in one batched projection.
+# All scenarios share the same market paths, so differences come from the claiming decision
+# alone. Benefits replace the fixed Social Security input: they offset retirement withdrawals,
+# or are saved if they start before retirement. Benefits and retirement spending both rise
+# with inflation, so the projection compares them on the same basis; the pension stays fixed.
+# Success is projected to life expectancy. Lifetime real income is the survival-weighted sum
+# of real benefits to the end of the bundled life table, so mortality is counted only once.
+def evaluate_claiming_ages(inputs, pia, spouse_pia=None, spouse_age=None, n_paths=1000,
+                           volatility=DEFAULT_VOLATILITY, seed=0, sex='unisex', spouse_sex='unisex',
+                           contributions=None):
+    current_age = inputs['current_age']
+    years_to_retirement = max(inputs['retirement_age'] - current_age, 0)
+    n_years = max(inputs['life_expectancy'] - current_age, years_to_retirement)
+    youngest = current_age if spouse_pia is None else min(current_age, spouse_age)
+    n_income = max(MAX_PLANNING_AGE - youngest, n_years)
+    price_index = (1 + inputs['inflation_rate'] / 100) ** np.arange(n_years)
+
+    claims, real_benefits = benefit_schedules(current_age, n_income, pia, spouse_pia, spouse_age)
+    n_scenarios = claims.shape[0]
+
+    if contributions is None:
+        contributions = np.full(years_to_retirement, float(inputs['annual_contribution']))
+    spending = inputs['desired_income'] * price_index[years_to_retirement:] - inputs['pension_income']
+    base_flows = np.concatenate((contributions, -spending))
+    flows = base_flows + real_benefits[:, :n_years] * price_index
+
+    growth = draw_growth(np.random.default_rng(seed), inputs['annual_return'], volatility, n_paths, n_years)
+    _, depleted_at = roll_forward(float(inputs['current_savings']), np.tile(growth, (n_scenarios, 1)),
+                                  np.repeat(flows, n_paths, axis=0), floor_from=years_to_retirement)
+    success_rate = (depleted_at < 0).reshape(n_scenarios, n_paths).mean(axis=1)
+
+    survival = _survival(current_age, sex, n_income)
+    if spouse_pia is None:
+        lifetime_income = real_benefits @ survival
+    else:
+        # Split the household benefit so each part is weighted by its claimant's survival
+        primary = np.where(current_age + 1 + np.arange(n_income) >= claims[:, :1],
+                           pia * benefit_factor(claims[:, :1]), 0.0)
+        spouse_survival = _survival(spouse_age, spouse_sex, n_income)
+        lifetime_income = primary @ survival + (real_benefits - primary) @ spouse_survival
+
+    # Best by success probability (ties broken by income) and best by lifetime income
+    by_success = int(np.lexsort((-lifetime_income, -success_rate))[0])
+    by_income = int(np.argmax(lifetime_income))
+    scenarios = [
+        {'claim_age': int(a), 'spouse_claim_age': int(b) if b >= 0 else None,
+         'success_rate': float(rate), 'lifetime_income': float(income)}
+        for (a, b), rate, income in zip(claims, success_rate, lifetime_income)
+    ]
+    return {
+        'scenarios': scenarios,
+        'best_by_success': scenarios[by_success],
+        'best_by_income': scenarios[by_income],
+    }
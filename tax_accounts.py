@@ -0,0 +1,166 @@
+import os
+import numpy as np
+
+from retirement_engine import draw_growth, plan_flows, retirement_shortfall, roll_forward
+
+RMD_TABLE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "rmd_divisors.csv")
+RMD_START_AGE = 73
+
+# 2024 federal brackets for a single filer: (taxable income threshold, marginal rate).
+# Thresholds are indexed to inflation over the projection.
+FEDERAL_BRACKETS = [
+    (0, 0.10), (11600, 0.12), (47150, 0.22), (100525, 0.24),
+    (191950, 0.32), (243725, 0.35), (609350, 0.37),
+]
+STANDARD_DEDUCTION = 14600
+SOCIAL_SECURITY_TAXABLE_SHARE = 0.85
+
+ACCOUNT_TYPES = ('taxable', 'pretax', 'roth')
+WITHDRAWAL_ORDERS = {
+    'conventional': ('taxable', 'pretax', 'roth'),
+    'pretax_first': ('pretax', 'taxable', 'roth'),
+    'roth_first': ('roth', 'taxable', 'pretax'),
+}
+
+_rmd_divisors = None
+
+
+# Bracket table in gross-income terms: a 0% band up to the standard deduction, then the
+# brackets shifted by it. Returns thresholds, marginal rates, tax owed at each threshold and
+# after-tax income at each threshold (used to invert the tax function).
+def bracket_table(brackets=FEDERAL_BRACKETS, standard_deduction=STANDARD_DEDUCTION):
+    thresholds = np.array([0.0] + [standard_deduction + threshold for threshold, _ in brackets])
+    rates = np.array([0.0] + [rate for _, rate in brackets])
+    base_tax = np.concatenate(([0.0], np.cumsum(np.diff(thresholds) * rates[:-1])))
+    return thresholds, rates, base_tax, thresholds - base_tax
+
+
+# Tax on gross income, vectorized with a searchsorted bracket lookup. Brackets indexed by
+# `index` (the cumulative inflation factor) are the base brackets scaled up, so the tax is
+# the base tax on deflated income, scaled back.
+def income_tax(income, table, index=1.0):
+    thresholds, rates, base_tax, _ = table
+    real_income = np.maximum(income, 0) / index
+    i = np.searchsorted(thresholds, real_income, side='right') - 1
+    return (base_tax[i] + (real_income - thresholds[i]) * rates[i]) * index
+
+
+def after_tax_income(income, table, index=1.0):
+    return income - income_tax(income, table, index)
+
+
+# Inverse of after_tax_income: the gross income that leaves `net` after tax
+def gross_income(net, table, index=1.0):
+    thresholds, rates, _, after_tax = table
+    real_net = np.maximum(net, 0) / index
+    i = np.searchsorted(after_tax, real_net, side='right') - 1
+    return (thresholds[i] + (real_net - after_tax[i]) / (1 - rates[i])) * index
+
+
+# RMD divisors indexed by age, loaded once per process; ages before RMD_START_AGE get an
+# infinite divisor (no required distribution)
+def load_rmd_divisors():
+    global _rmd_divisors
+    if _rmd_divisors is None:
+        # Drop the comment block and the header row before parsing
+        with open(RMD_TABLE_PATH) as f:
+            rows = [line for line in f if not line.startswith('#')][1:]
+        data = np.loadtxt(rows, delimiter=',')
+        ages, divisors = data[:, 0].astype(int), data[:, 1]
+        table = np.full(ages.max() + 1, np.inf)
+        table[ages] = divisors
+        table[:RMD_START_AGE] = np.inf
+        _rmd_divisors = table
+    return _rmd_divisors
+
+
+# Project taxable, pre-tax and Roth buckets over paths x years of growth factors (the same
+# matrices run_monte_carlo draws; one row of constant growth gives the deterministic plan).
+# Contributions are split across buckets by `contribution_split`. In retirement each year:
+#   1. every bucket grows, and the RMD is taken from the pre-tax bucket
+#   2. the remaining need is drawn from the buckets in `order`, grossing pre-tax withdrawals
+#      up for the marginal tax they trigger
+#   3. any surplus (an RMD larger than the need) is reinvested in the taxable bucket
+# Taxable withdrawals are treated as return of basis. Pension income and the taxable share of
+# Social Security count as ordinary income.
+def project_accounts(inputs, accounts, growth, contributions=None, contribution_split=None,
+                     order='conventional', table=None):
+    if order not in WITHDRAWAL_ORDERS:
+        raise ValueError(f"Unknown withdrawal order {order!r}; expected one of {sorted(WITHDRAWAL_ORDERS)}")
+    table = bracket_table() if table is None else table
+    split = contribution_split or {'pretax': 1.0}
+    divisors = load_rmd_divisors()
+
+    years_to_retirement = max(inputs['retirement_age'] - inputs['current_age'], 0)
+    n_paths, n_years = growth.shape
+    inflation = 1 + inputs['inflation_rate'] / 100
+    shortfall = retirement_shortfall(inputs['desired_income'], inputs['inflation_rate'],
+                                     years_to_retirement, inputs['pension_income'],
+                                     inputs['social_security'])
+    fixed_income = inputs['pension_income'] + SOCIAL_SECURITY_TAXABLE_SHARE * inputs['social_security']
+    if contributions is None:
+        contributions = np.full(years_to_retirement, float(inputs['annual_contribution']))
+
+    # Accumulation: each bucket compounds its own share of the contributions
+    balances = {}
+    for kind in ACCOUNT_TYPES:
+        balances[kind] = np.empty((n_paths, n_years + 1))
+        roll_forward(float(accounts.get(kind, 0)), growth[:, :years_to_retirement],
+                     contributions * split.get(kind, 0.0),
+                     out=balances[kind][:, :years_to_retirement + 1])
+
+    taxes = np.zeros((n_paths, n_years))
+    depleted_at = np.full(n_paths, -1)
+
+    # Drawdown, vectorized across paths
+    for t in range(years_to_retirement, n_years):
+        age = inputs['current_age'] + t + 1
+        index = inflation ** (t + 1)
+        current = {kind: balances[kind][:, t] * growth[:, t] for kind in ACCOUNT_TYPES}
+
+        divisor = divisors[min(age, divisors.size - 1)]
+        pretax_draw = current['pretax'] / divisor
+        current['pretax'] -= pretax_draw
+        remaining = shortfall - (after_tax_income(fixed_income + pretax_draw, table, index) - fixed_income)
+
+        for kind in WITHDRAWAL_ORDERS[order]:
+            need = np.maximum(remaining, 0)
+            if kind == 'pretax':
+                income = fixed_income + pretax_draw
+                net_before = after_tax_income(income, table, index)
+                extra = np.clip(gross_income(net_before + need, table, index) - income, 0, current['pretax'])
+                pretax_draw += extra
+                current['pretax'] -= extra
+                remaining -= after_tax_income(income + extra, table, index) - net_before
+            else:
+                draw = np.minimum(need, current[kind])
+                current[kind] -= draw
+                remaining -= draw
+
+        current['taxable'] += np.maximum(-remaining, 0)
+        taxes[:, t] = income_tax(fixed_income + pretax_draw, table, index)
+        depleted_at[(remaining > 0.01) & (depleted_at < 0)] = t + 1
+        for kind in ACCOUNT_TYPES:
+            balances[kind][:, t + 1] = current[kind]
+
+    return {
+        'balances': balances,
+        'total_balance': sum(balances.values()),
+        'taxes': taxes,
+        'depleted_at': depleted_at,
+    }
+
+
+# Run project_accounts on growth drawn like run_monte_carlo's; volatility 0 with one path
+# gives the deterministic projection. The horizon is plan_flows', so a retirement after life
+# expectancy still runs to the retirement date.
+def simulate_accounts(inputs, accounts, n_paths=1, volatility=0.0, seed=None, **kwargs):
+    n_years = plan_flows(inputs, kwargs.get('contributions')).size
+    growth = draw_growth(np.random.default_rng(seed), inputs['annual_return'], volatility, n_paths, n_years)
+    projection = project_accounts(inputs, accounts, growth, **kwargs)
+
+    depleted_at = projection['depleted_at']
+    projection['ages'] = list(range(inputs['current_age'], inputs['current_age'] + n_years + 1))
+    projection['success_rate'] = float((depleted_at < 0).mean())
+    projection['lifetime_taxes'] = float(projection['taxes'].sum(axis=1).mean())
+    return projection
@@ -0,0 +1,21 @@
+import pytest
+
+from annuity_tables import plan_summary
+from retirement_engine import calculate_retirement, contribution_schedule
+
+PLAN = {
+    'current_savings': 50000, 'annual_contribution': 10000, 'annual_return': 7.0,
+    'inflation_rate': 2.5, 'desired_income': 60000, 'pension_income': 0, 'social_security': 15000,
+}
+
+
+# Table lookups agree with the year-by-year projection, including retirement before the
+# current age and after life expectancy, with a flat contribution or its schedule
+@pytest.mark.parametrize('ages', [(35, 65, 85), (68, 65, 85), (70, 50, 75), (35, 80, 75)])
+def test_plan_summary_matches_calculate_retirement(ages):
+    results = calculate_retirement(*ages, **PLAN)
+    schedule = contribution_schedule(ages[0], ages[1], PLAN['annual_contribution'])
+    for contributions in (None, schedule):
+        summary = plan_summary(*ages, **PLAN, contributions=contributions)
+        assert summary['retirement_savings'] == pytest.approx(results['retirement_savings'])
+        assert summary['savings_last'] == results['savings_last']
@@ -0,0 +1,107 @@
+import time
+import threading
+
+import auth_db
+from auth_db import Database, concurrency_check
+
+
+# In WAL mode readers keep reading the last committed snapshot while a writer holds its
+# transaction open, so none of them waits anywhere near as long as the writer holds it
+def test_readers_never_wait_for_writers(tmp_path):
+    result = concurrency_check(str(tmp_path / 'wal.db'), 'WAL', readers=4, seconds=1.0, hold=0.05)
+    assert result['writes'] > 0
+    assert result['errors'] == 0
+    assert result['max_wait'] < result['hold'] / 2
+
+
+# A reader always active keeps PASSIVE checkpoints from resetting the WAL; the size guard
+# truncates it anyway
+def test_wal_truncated_under_continuous_reads(tmp_path, monkeypatch):
+    monkeypatch.setattr(auth_db, 'CHECKPOINT_INTERVAL', 0.05)
+    monkeypatch.setattr(auth_db, 'WAL_TRUNCATE_BYTES', 256 * 1024)
+    database = Database(str(tmp_path / 'wal.db'))
+    database.init_schema('CREATE TABLE rows (id INTEGER PRIMARY KEY, value BLOB)')
+    stop = threading.Event()
+
+    def read():
+        while not stop.is_set():
+            with database.connection() as conn:
+                conn.execute('SELECT COUNT(*) FROM rows').fetchone()
+
+    readers = [threading.Thread(target=read) for _ in range(2)]
+    for reader in readers:
+        reader.start()
+    try:
+        for _ in range(400):
+            database.write('INSERT INTO rows (value) VALUES (?)', (b'x' * 4096,)).result()
+        deadline = time.time() + 5
+        # A truncation can come while inserts are still growing the WAL; wait for one after them
+        while ((database.metrics()['wal_truncations'] == 0 or database.wal_size() >= auth_db.WAL_TRUNCATE_BYTES)
+               and time.time() < deadline):
+            time.sleep(0.05)
+        assert database.metrics()['wal_truncations'] > 0
+        assert database.wal_size() < auth_db.WAL_TRUNCATE_BYTES
+    finally:
+        stop.set()
+        for reader in readers:
+            reader.join()
+        database.close()
+
+
+# A schema script's ADD COLUMN migrations can be run again, as each process does, once the
+# column exists
+def test_schema_migration_reruns(tmp_path):
+    path = str(tmp_path / 'schema.db')
+    script = '''
+        CREATE TABLE IF NOT EXISTS users (id INTEGER PRIMARY KEY, username TEXT);
+        ALTER TABLE users ADD COLUMN login_count INTEGER NOT NULL DEFAULT 0
+    '''
+    assert Database(path).init_schema(script)
+    database = Database(path)
+    assert database.init_schema(script)
+    with database.connection() as conn:
+        columns = [row[1] for row in conn.execute('PRAGMA table_info(users)')]
+    assert columns == ['id', 'username', 'login_count']
+
+
+# A process that only writes still gets a checkpoint thread
+def test_writer_starts_checkpointer(tmp_path):
+    database = Database(str(tmp_path / 'writes.db'))
+    database.write('CREATE TABLE rows (id INTEGER PRIMARY KEY)').result()
+    try:
+        assert database._checkpointer is not None and database._checkpointer.is_alive()
+    finally:
+        database.close()
+
+
+# Operations cancelled while queued never run and are not counted
+def test_cancelled_writes_not_counted(tmp_path):
+    database = Database(str(tmp_path / 'cancel.db'))
+    release = threading.Event()
+    try:
+        blocker = database.submit(lambda conn: release.wait(5))
+        time.sleep(0.05)
+        cancelled = database.submit(lambda conn: conn.execute('SELECT 1'))
+        assert cancelled.cancel()
+        release.set()
+        blocker.result()
+        database.submit(lambda conn: None).result()
+        assert database.writer().metrics()['operations'] == 2
+    finally:
+        database.close()
+
+
+# Rows a case-sensitive UNIQUE column allowed get a plain index rather than a failed start
+def test_unique_index_falls_back_on_duplicates(tmp_path, caplog):
+    path = str(tmp_path / 'users.db')
+    database = Database(path)
+    database.init_schema('CREATE TABLE users (id INTEGER PRIMARY KEY, username TEXT UNIQUE NOT NULL)')
+    database.write("INSERT INTO users (username) VALUES ('bob'), ('Bob')").result()
+    assert database.init_schema('''
+        -- Names differing only in case are the same name
+        CREATE UNIQUE INDEX IF NOT EXISTS idx_users_username_nocase ON users(username COLLATE NOCASE)
+    ''')
+    with database.connection() as conn:
+        index = conn.execute("SELECT sql FROM sqlite_master WHERE name = 'idx_users_username_nocase'").fetchone()
+    assert index is not None and 'UNIQUE' not in index[0]
+    assert 'violate a unique index' in caplog.text
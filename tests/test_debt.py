@@ -0,0 +1,19 @@
+from debt import PAYOFF_ORDERS, compare_payoff_strategies, default_minimum
+
+PLAN = {
+    'current_age': 35, 'retirement_age': 65, 'life_expectancy': 85, 'current_savings': 50000,
+    'annual_contribution': 10000, 'annual_return': 7.0, 'inflation_rate': 2.5,
+    'desired_income': 60000, 'pension_income': 0, 'social_security': 15000,
+}
+
+
+# A debt entered without a minimum payment is still repaid under every order
+def test_default_minimum_repays_every_order():
+    debts = [
+        {'name': 'Credit Card', 'balance': 8000, 'rate': 22.0, 'minimum': default_minimum(8000, 22.0)},
+        {'name': 'Auto Loan', 'balance': 15000, 'rate': 7.0, 'minimum': default_minimum(15000, 7.0)},
+    ]
+    budget = sum(debt['minimum'] for debt in debts)
+    results = compare_payoff_strategies(PLAN, debts, budget)
+    assert set(results) == set(PAYOFF_ORDERS)
+    assert all(outcome['debt_free_month'] > 0 for outcome in results.values())
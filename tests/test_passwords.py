@@ -0,0 +1,16 @@
+import hashlib
+
+import passwords
+from passwords import hash_password, verify_password
+
+
+def test_memory_budget_caps_cost(monkeypatch):
+    monkeypatch.setattr(passwords, 'MAX_HASH_MEMORY', passwords.HASH_WORKERS * 128 * passwords.BLOCK_SIZE * 2 ** 15)
+    assert passwords.calibrate(target=3600)['log_n'] == 15
+
+
+def test_legacy_hash_is_accepted_and_rehashed():
+    matches, rehash = verify_password('hunter2', hashlib.sha256(b'hunter2').hexdigest())
+    assert matches and rehash.startswith('scrypt$')
+    assert verify_password('hunter2', rehash) == (True, None)
+    assert verify_password('wrong', hash_password('hunter2')) == (False, None)
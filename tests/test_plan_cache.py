@@ -0,0 +1,22 @@
+import plan_cache
+
+
+# Hits only read the cache; their last_used times are written in batches
+def test_hits_batch_last_used(tmp_path, monkeypatch):
+    monkeypatch.setattr(plan_cache, 'CACHE_DB_PATH', str(tmp_path / 'plan_cache.db'))
+    monkeypatch.setattr(plan_cache, '_touched', {})
+    monkeypatch.setattr(plan_cache, '_last_touch_write', 0.0)
+    plan_cache.put('plan', {'savings': [1.0, 2.0]}).result()
+    assert plan_cache.cached('plan', lambda: None) == {'savings': [1.0, 2.0]}
+    assert plan_cache.get('missing') is None
+
+    database = plan_cache._database()
+    database.writer().submit(lambda conn: None).result()
+    with database.connection() as conn:
+        first = conn.execute("SELECT last_used FROM plan_cache WHERE key = 'plan'").fetchone()[0]
+    # Within TOUCH_INTERVAL of the last batch a hit is only remembered
+    plan_cache.get('plan')
+    database.writer().submit(lambda conn: None).result()
+    with database.connection() as conn:
+        assert conn.execute("SELECT last_used FROM plan_cache WHERE key = 'plan'").fetchone()[0] == first
+    assert 'plan' in plan_cache._touched
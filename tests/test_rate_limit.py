@@ -0,0 +1,84 @@
+import time
+
+import rate_limit
+from auth_db import Database
+from rate_limit import RateLimiter
+
+
+def _limiter(tmp_path):
+    return RateLimiter(Database(str(tmp_path / 'throttle.db')))
+
+
+def test_lockout_after_repeated_failures(tmp_path):
+    limiter = _limiter(tmp_path)
+    for _ in range(rate_limit.MAX_FAILURES):
+        limiter.record('alice', False)
+    allowed, message = limiter.check('alice', '10.0.0.1')
+    assert not allowed and 'failed attempts' in message
+
+
+def test_failure_counts_expire(tmp_path, monkeypatch):
+    limiter = _limiter(tmp_path)
+    for _ in range(rate_limit.MAX_FAILURES - 1):
+        limiter.record('alice', False)
+    later = time.time() + rate_limit.LOCKOUT_SECONDS + 1
+    monkeypatch.setattr(rate_limit.time, 'time', lambda: later)
+    limiter.record('alice', False)
+    assert limiter.check('alice', None)[0]
+    limiter.persist().result()
+    assert limiter.metrics()['failure_counts'] == 1
+
+    monkeypatch.setattr(rate_limit.time, 'time', lambda: later + rate_limit.LOCKOUT_SECONDS + 1)
+    limiter.persist().result()
+    assert limiter.metrics()['failure_counts'] == 0
+
+
+def test_failure_counts_capped(tmp_path, monkeypatch):
+    monkeypatch.setattr(rate_limit, 'MAX_LOCKOUTS', 10)
+    limiter = _limiter(tmp_path)
+    for i in range(25):
+        limiter.record(f'user{i}', False)
+    assert limiter.metrics()['failure_counts'] == 10
+
+
+# Clients without an address are throttled per username only, not as one shared client
+def test_unknown_clients_do_not_share_a_bucket(tmp_path):
+    limiter = _limiter(tmp_path)
+    burst = rate_limit.CLIENT_LIMIT[1]
+    for i in range(burst + 5):
+        assert limiter.check(f'user{i}', None)[0]
+
+
+# A lockout is written through when it is set, without waiting for the periodic save
+def test_lockout_survives_a_restart(tmp_path):
+    database = Database(str(tmp_path / 'throttle.db'))
+    limiter = RateLimiter(database)
+    for _ in range(rate_limit.MAX_FAILURES):
+        limiter.record('alice', False)
+    database.submit(lambda conn: None).result()
+    assert not RateLimiter(Database(str(tmp_path / 'throttle.db'))).check('alice', None)[0]
+
+
+# Processes sharing the tables only write the keys they changed, and pick up each other's
+# lockouts
+def test_processes_share_the_tables(tmp_path):
+    path = str(tmp_path / 'throttle.db')
+    first, second = RateLimiter(Database(path)), RateLimiter(Database(path))
+    first.record('alice', False)
+    first.check('alice', '10.0.0.1')
+    first.persist().result()
+    second.record('bob', False)
+    second.check('bob', '10.0.0.2')
+    second.persist().result()
+
+    with first.database.connection() as conn:
+        assert {row[0] for row in conn.execute('SELECT username FROM login_lockouts')} == {'alice', 'bob'}
+        assert {row[0] for row in conn.execute('SELECT key FROM login_buckets')} == {
+            'user:alice', 'client:10.0.0.1', 'user:bob', 'client:10.0.0.2'}
+
+    for _ in range(rate_limit.MAX_FAILURES):
+        second.record('carol', False)
+    second.database.submit(lambda conn: None).result()
+    assert first.check('carol', None)[0]
+    first._load_lockouts(time.time())
+    assert not first.check('carol', None)[0]
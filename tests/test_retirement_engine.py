@@ -0,0 +1,49 @@
+import numpy as np
+
+from retirement_engine import calculate_retirement, plan_flows, run_monte_carlo
+
+PLAN = {
+    'current_age': 35, 'retirement_age': 65, 'life_expectancy': 85, 'current_savings': 50000,
+    'annual_contribution': 10000, 'annual_return': 7.0, 'inflation_rate': 2.5,
+    'desired_income': 60000, 'pension_income': 0, 'social_security': 15000,
+}
+
+
+def test_retirement_after_life_expectancy():
+    inputs = {**PLAN, 'retirement_age': 80, 'life_expectancy': 75}
+    results = calculate_retirement(**inputs)
+    assert results['ages'][-1] == 80
+    assert results['retirement_savings_balance'] == [results['retirement_savings']]
+    assert results['savings_last']
+    assert plan_flows(inputs).size == 80 - 35
+
+    summary = run_monte_carlo(inputs, n_paths=200, seed=0)
+    assert len(summary['ages']) == plan_flows(inputs).size + 1
+
+
+def test_retirement_before_current_age():
+    inputs = {**PLAN, 'current_age': 70, 'retirement_age': 65}
+    results = calculate_retirement(**inputs)
+    assert results['savings'] == [PLAN['current_savings']]
+    assert results['retirement_savings'] == PLAN['current_savings']
+    run_monte_carlo(inputs, n_paths=200, seed=0)
+
+
+def test_monte_carlo_chunking_does_not_change_results():
+    reference = run_monte_carlo(PLAN, n_paths=3000, seed=1)
+    for chunks in ({'chunk_size': 100}, {'first_chunk': 500}, {'chunk_size': 7, 'first_chunk': 13}):
+        summary = run_monte_carlo(PLAN, n_paths=3000, seed=1, **chunks)
+        assert summary['success_rate'] == reference['success_rate'], chunks
+
+
+def test_project_plans_matches_calculate_retirement():
+    from benchmark_engine import random_plans
+    from retirement_engine import project_plans
+
+    plans = random_plans(300, seed=3)
+    batch = project_plans(plans)
+    for i in range(300):
+        results = calculate_retirement(**{key: values[i].item() for key, values in plans.items()})
+        assert np.isclose(batch['retirement_savings'][i], results['retirement_savings'])
+        assert batch['savings_last'][i] == results['savings_last']
+        assert batch['depletion_age'][i] == (results['depletion_age'] or -1)
@@ -0,0 +1,56 @@
+import time
+
+import sessions
+from auth_db import Database
+from sessions import ROTATE_INTERVAL, ROTATION_GRACE, SessionStore
+
+USERS = 'CREATE TABLE IF NOT EXISTS users (id INTEGER PRIMARY KEY, username TEXT UNIQUE NOT NULL)'
+
+
+def _store(tmp_path):
+    database = Database(str(tmp_path / 'sessions.db'))
+    database.init_schema(USERS)
+    database.write("INSERT INTO users (id, username) VALUES (1, 'alice')").result()
+    return SessionStore(database)
+
+
+def _later(monkeypatch, seconds):
+    now = time.time() + seconds
+    monkeypatch.setattr(sessions.time, 'time', lambda: now)
+
+
+def test_rotate_replaces_the_token(tmp_path, monkeypatch):
+    store = _store(tmp_path)
+    token = store.create(1, 'alice')
+    session, new_token = store.rotate(token)
+    assert session == {'user_id': 1, 'username': 'alice'}
+    assert store.validate(new_token) == session
+    # The old token keeps working for the grace period, but cannot be rotated again
+    assert store.validate(token) == session
+    assert store.rotate(token) == (None, None)
+    _later(monkeypatch, ROTATION_GRACE + 1)
+    assert store.validate(token) is None
+    assert store.validate(new_token) == session
+
+
+def test_refresh_rotates_only_when_due(tmp_path, monkeypatch):
+    store = _store(tmp_path)
+    token = store.create(1, 'alice')
+    assert store.refresh(token) == ({'user_id': 1, 'username': 'alice'}, None)
+    assert store.metrics()['cache_hits'] == 1 and store.metrics()['rotated'] == 0
+
+    _later(monkeypatch, ROTATE_INTERVAL + 1)
+    session, new_token = store.refresh(token)
+    assert session == {'user_id': 1, 'username': 'alice'} and new_token
+    # Another tab with the old token stays signed in on it
+    assert store.refresh(token) == (session, None)
+    assert store.refresh(new_token) == (session, None)
+    assert store.metrics()['rotated'] == 1
+
+
+def test_revoke(tmp_path):
+    store = _store(tmp_path)
+    token = store.create(1, 'alice')
+    store.revoke(token)
+    assert store.validate(token) is None
+    assert store.rotate(token) == (None, None)
@@ -0,0 +1,34 @@
+from social_security import evaluate_claiming_ages
+
+PLAN = {
+    'current_age': 55, 'retirement_age': 65, 'life_expectancy': 85, 'current_savings': 800000,
+    'annual_contribution': 20000, 'annual_return': 6.0, 'inflation_rate': 2.5,
+    'desired_income': 60000, 'pension_income': 0, 'social_security': 0,
+}
+
+
+def _incomes(results):
+    return {(s['claim_age'], s['spouse_claim_age']): s['lifetime_income'] for s in results['scenarios']}
+
+
+# Lifetime income is already survival-weighted, so the point-estimate life expectancy
+# must not cut it short
+def test_lifetime_income_ignores_life_expectancy():
+    short = evaluate_claiming_ages({**PLAN, 'life_expectancy': 75}, pia=24000, n_paths=50)
+    long = evaluate_claiming_ages({**PLAN, 'life_expectancy': 100}, pia=24000, n_paths=50)
+    assert _incomes(short) == _incomes(long)
+
+    couple = {'spouse_pia': 10000, 'spouse_age': 50, 'n_paths': 50}
+    short = evaluate_claiming_ages({**PLAN, 'life_expectancy': 75}, pia=24000, **couple)
+    long = evaluate_claiming_ages({**PLAN, 'life_expectancy': 100}, pia=24000, **couple)
+    assert _incomes(short) == _incomes(long)
+
+
+# Benefits a tenth short of spending leave a gap that grows with inflation, and a small
+# balance almost never covers it for a whole retirement
+def test_benefits_and_spending_share_a_basis():
+    inputs = {**PLAN, 'current_savings': 5000, 'annual_contribution': 0, 'desired_income': 20000,
+              'inflation_rate': 8.0, 'retirement_age': 62}
+    results = evaluate_claiming_ages(inputs, pia=0.9 * 20000 / 0.7, n_paths=50)
+    assert results['scenarios'][0]['claim_age'] == 62
+    assert results['scenarios'][0]['success_rate'] < 0.1
@@ -0,0 +1,28 @@
+import pytest
+
+from retirement_engine import calculate_retirement, contribution_schedule, plan_flows
+from tax_accounts import simulate_accounts
+
+PLAN = {
+    'current_age': 35, 'retirement_age': 65, 'life_expectancy': 85, 'current_savings': 50000,
+    'annual_contribution': 10000, 'annual_return': 7.0, 'inflation_rate': 2.5,
+    'desired_income': 60000, 'pension_income': 0, 'social_security': 15000,
+}
+ACCOUNTS = {'pretax': 30000, 'roth': 10000, 'taxable': 10000}
+SPLIT = {'pretax': 0.6, 'roth': 0.2, 'taxable': 0.2}
+
+
+# Retirement after life expectancy, retirement before the current age, and both: the
+# projection covers plan_flows' years and accumulates to calculate_retirement's total
+@pytest.mark.parametrize('ages', [(35, 80, 75), (68, 65, 85), (70, 50, 75)])
+def test_simulate_accounts_clamps_phases(ages):
+    inputs = {**PLAN, **dict(zip(('current_age', 'retirement_age', 'life_expectancy'), ages))}
+    contributions = contribution_schedule(inputs['current_age'], inputs['retirement_age'],
+                                          inputs['annual_contribution'])
+    results = calculate_retirement(**inputs)
+    for kwargs in ({}, {'contributions': contributions}):
+        projection = simulate_accounts(inputs, ACCOUNTS, contribution_split=SPLIT, **kwargs)
+        n_years = plan_flows(inputs).size
+        assert projection['ages'] == list(range(inputs['current_age'], inputs['current_age'] + n_years + 1))
+        years_to_retirement = max(inputs['retirement_age'] - inputs['current_age'], 0)
+        assert projection['total_balance'][0, years_to_retirement] == pytest.approx(results['retirement_savings'])
@@ -0,0 +1,47 @@
+import sqlite3
+
+import pytest
+
+from auth_db import Database
+from user_index import UserIndex
+
+SCHEMA = '''
+    CREATE TABLE IF NOT EXISTS users (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        username TEXT UNIQUE NOT NULL,
+        email TEXT UNIQUE NOT NULL
+    );
+    CREATE UNIQUE INDEX IF NOT EXISTS idx_users_username_nocase ON users(username COLLATE NOCASE);
+    CREATE UNIQUE INDEX IF NOT EXISTS idx_users_email_nocase ON users(email COLLATE NOCASE)
+'''
+
+
+def _insert(database, username, email):
+    database.write('INSERT INTO users (username, email) VALUES (?, ?)', (username, email)).result()
+
+
+def test_index_built_before_the_table_exists(tmp_path):
+    database = Database(str(tmp_path / 'users.db'))
+    index = UserIndex(database)
+    assert index.taken('username', 'bob') is None
+
+    database.init_schema(SCHEMA)
+    _insert(database, 'bob', 'bob@example.com')
+    assert index.taken('username', 'bob')
+    assert not index.taken('email', 'alice@example.com')
+
+
+# The index and the unique constraint agree on which names are the same
+@pytest.mark.parametrize('variant, taken', [('BOB', True), ('Bob', True), (' bob', False), ('böb', False)])
+def test_case_rule_matches_the_insert(tmp_path, variant, taken):
+    database = Database(str(tmp_path / 'users.db'))
+    database.init_schema(SCHEMA)
+    _insert(database, 'bob', 'bob@example.com')
+    index = UserIndex(database)
+    assert index.taken('username', variant) == taken
+    try:
+        _insert(database, variant, f'{len(variant)}-{taken}@example.com')
+        inserted = True
+    except sqlite3.IntegrityError:
+        inserted = False
+    assert inserted != taken
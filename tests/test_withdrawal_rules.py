@@ -0,0 +1,45 @@
+import numpy as np
+import pytest
+
+from withdrawal_rules import JIT_AVAILABLE, WITHDRAWAL_RULES, _drawdown_loop, _drawdown_numpy, drawdown
+
+
+def _paths(n_paths, n_years):
+    rng = np.random.default_rng(0)
+    start = rng.uniform(0, 2000000, n_paths)
+    growth = np.maximum(1 + rng.normal(0.07, 0.15, (n_paths, n_years)), 0)
+    return start, growth
+
+
+# The loop the JIT compiles, run as plain Python, against the NumPy kernel, so the two are
+# compared whether or not numba is installed
+@pytest.mark.parametrize('rule', WITHDRAWAL_RULES)
+def test_loop_matches_numpy(rule):
+    start, growth = _paths(200, 30)
+    results = []
+    for kernel in (_drawdown_numpy, _drawdown_loop):
+        out, withdrawals, depleted_at = np.empty((200, 31)), np.empty((200, 30)), np.empty(200, dtype=np.int64)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            kernel(start, growth, 45000.0, 1.025, WITHDRAWAL_RULES.index(rule), 1.2, 0.8, 0.9, 1.1,
+                   0.9, 1.2, out, withdrawals, depleted_at)
+        results.append((out, withdrawals, depleted_at))
+    assert (results[0][2] >= 0).any()
+    for expected, actual in zip(*results):
+        assert np.array_equal(expected, actual)
+
+
+@pytest.mark.skipif(not JIT_AVAILABLE, reason="numba is not installed")
+@pytest.mark.parametrize('rule', WITHDRAWAL_RULES)
+def test_jit_matches_numpy(rule):
+    start, growth = _paths(500, 30)
+    numpy_results = drawdown(start, growth, 45000, 2.5, rule, use_jit=False)
+    jit_results = drawdown(start, growth, 45000, 2.5, rule, use_jit=True)
+    for expected, actual in zip(numpy_results, jit_results):
+        assert np.array_equal(expected, actual)
+
+
+def test_jit_required_without_numba():
+    if JIT_AVAILABLE:
+        pytest.skip("numba is installed")
+    with pytest.raises(RuntimeError):
+        drawdown([1000000.0], np.ones((1, 5)), 40000, 2.5, use_jit=True)
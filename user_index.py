@@ -0,0 +1,207 @@
+import re
+import math
+import string
+import bisect
+import random
+import hashlib
+import threading
+
+from auth_db import get_database
+
+# In-memory index of the usernames and emails already in the users table, for telling a user
+# a name is taken while they fill in the registration form. Names are compared the way
+# SQLite's NOCASE collation compares them (ASCII letters case-folded), which is also how the
+# pages' unique indexes on the users table compare them, so "Bob" counts as taken once "bob"
+# exists and the INSERT agrees.
+#
+# Two tiers per column:
+#   - a Bloom filter over every name, built once per process from the users table. A name
+#     it has never seen is free, answered without touching storage.
+#   - an exact set of names known to be taken: those registered since the filter was built
+#     and those already confirmed. Anything else the filter matches (a real name or a false
+#     positive) is confirmed with one NOCASE lookup, served by those unique indexes.
+# An index built before the users table exists is rebuilt once the table appears.
+# Usernames are also kept as a sorted array, for suggesting free variants of a taken name.
+
+# Share of free names the filter wrongly reports as possibly taken
+FALSE_POSITIVE_RATE = 0.01
+# Names the filter is sized for at least; it is rebuilt at twice the size once full
+MIN_CAPACITY = 10000
+COLUMNS = ('username', 'email')
+# Suggestions offered for a taken username
+SUGGESTIONS = 5
+# Numeric suffixes tried in order before random ones
+SEQUENTIAL_SUFFIXES = 20
+
+_registry_lock = threading.Lock()
+_indexes = {}
+
+
+_ASCII_LOWER = str.maketrans(string.ascii_uppercase, string.ascii_lowercase)
+
+
+# NOCASE folding: only ASCII letters are lower-cased, and nothing is trimmed
+def normalise(value):
+    return value.translate(_ASCII_LOWER)
+
+
+class BloomFilter:
+    def __init__(self, capacity, false_positive_rate=FALSE_POSITIVE_RATE):
+        self.capacity = capacity
+        self.size = max(8, int(-capacity * math.log(false_positive_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+
+    # Bit positions by double hashing two 64-bit halves of one digest
+    def _positions(self, value):
+        digest = hashlib.blake2b(value.encode(), digest_size=16).digest()
+        first, second = int.from_bytes(digest[:8], 'little'), int.from_bytes(digest[8:], 'little') | 1
+        return [(first + i * second) % self.size for i in range(self.hashes)]
+
+    def add(self, value):
+        for position in self._positions(value):
+            self.bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def __contains__(self, value):
+        return all(self.bits[position >> 3] & (1 << (position & 7)) for position in self._positions(value))
+
+
+class UserIndex:
+    def __init__(self, database):
+        self.database = database
+        self._lock = threading.Lock()
+        self._stats = {'checks': 0, 'filter_negatives': 0, 'exact_hits': 0, 'lookups': 0, 'false_positives': 0}
+        self._load()
+
+    def _load(self):
+        with self.database.connection() as conn:
+            present = {row[1] for row in conn.execute('PRAGMA table_info(users)')}
+        # The login pages' users table has no email column
+        columns = tuple(column for column in COLUMNS if column in present)
+        if not columns:
+            with self._lock:
+                self.columns, self._filters, self._taken, self._usernames = (), {}, {}, []
+            return
+
+        with self.database.connection() as conn:
+            count = conn.execute('SELECT COUNT(*) FROM users').fetchone()[0]
+            filters = {column: BloomFilter(max(MIN_CAPACITY, 2 * count)) for column in columns}
+            usernames = []
+            for row in conn.execute(f"SELECT {', '.join(columns)} FROM users"):
+                for column, value in zip(columns, row):
+                    if value is not None:
+                        filters[column].add(normalise(value))
+                if row[0] is not None:
+                    usernames.append(normalise(row[0]))
+        usernames.sort()
+        with self._lock:
+            self.columns = columns
+            self._filters = filters
+            self._taken = {column: set() for column in columns}
+            self._usernames = usernames
+
+    # Whether `value` is already registered in `column`; None when the table has no such column
+    def taken(self, column, value):
+        if not self.columns:
+            self._load()
+        if column not in self.columns:
+            return None
+        raw, value = value, normalise(value)
+        with self._lock:
+            self._stats['checks'] += 1
+            if value in self._taken[column]:
+                self._stats['exact_hits'] += 1
+                return True
+            if value not in self._filters[column]:
+                self._stats['filter_negatives'] += 1
+                return False
+            self._stats['lookups'] += 1
+
+        with self.database.connection() as conn:
+            found = conn.execute(f'SELECT 1 FROM users WHERE {column} = ? COLLATE NOCASE LIMIT 1', (raw,)).fetchone()
+        with self._lock:
+            if found:
+                self._taken[column].add(value)
+            else:
+                self._stats['false_positives'] += 1
+        return found is not None
+
+    # Record a newly registered user; called after the insert has committed
+    def add(self, **values):
+        if not self.columns:
+            # The table did not exist when the index was built; loading it now picks this user up
+            self._load()
+            return
+        rebuild = False
+        with self._lock:
+            for column, value in values.items():
+                if column in self.columns and value is not None:
+                    self._filters[column].add(normalise(value))
+                    self._taken[column].add(normalise(value))
+                    rebuild = rebuild or self._filters[column].count > self._filters[column].capacity
+            if values.get('username') is not None:
+                username = normalise(values['username'])
+                position = bisect.bisect_left(self._usernames, username)
+                if position == len(self._usernames) or self._usernames[position] != username:
+                    self._usernames.insert(position, username)
+        if rebuild:
+            self._load()
+
+    def _has_username(self, username):
+        position = bisect.bisect_left(self._usernames, username)
+        return position < len(self._usernames) and self._usernames[position] == username
+
+    # Free variants of `username`: its stem (the name without a trailing number or separator)
+    # with a number appended directly or after an underscore, smallest numbers first, then
+    # random longer ones. Each candidate is checked against the sorted array of taken usernames.
+    def suggest(self, username, count=SUGGESTIONS):
+        if not self.columns:
+            self._load()
+        if 'username' not in self.columns:
+            return []
+        stem = re.sub(r'[_\d]+$', '', username.strip()) or username.strip()
+
+        def candidates():
+            for n in range(1, SEQUENTIAL_SUFFIXES + 1):
+                yield f'{stem}{n}'
+                yield f'{stem}_{n}'
+            # Longer numbers as shorter ones keep turning out taken
+            rng = random.Random(stem)
+            for attempt in range(10 * count):
+                digits = 3 + attempt // count
+                yield f'{stem}{rng.randrange(10 ** (digits - 1), 10 ** digits)}'
+
+        suggestions, chosen = [], set()
+        with self._lock:
+            for candidate in candidates():
+                name = normalise(candidate)
+                if name not in chosen and not self._has_username(name):
+                    suggestions.append(candidate)
+                    chosen.add(name)
+                    if len(suggestions) == count:
+                        break
+        return suggestions
+
+    def metrics(self):
+        with self._lock:
+            return dict(self._stats)
+
+
+# One index per database for the whole process, shared by every session; loaded on first use
+def get_user_index(database=None):
+    database = database or get_database()
+    with _registry_lock:
+        if database.path not in _indexes:
+            _indexes[database.path] = UserIndex(database)
+        return _indexes[database.path]
+
+
+# Keep a loaded index in step with a registration; a database nobody has indexed is skipped
+def record_user(database=None, **values):
+    database = database or get_database()
+    with _registry_lock:
+        index = _indexes.get(database.path)
+    if index is not None:
+        index.add(**values)
@@ -0,0 +1,164 @@
+import time
+import numpy as np
+
+# numba is optional: without it the drawdown runs on the NumPy implementation, which gives
+# identical results, only more slowly
+try:
+    from numba import njit
+except ImportError:
+    njit = None
+
+JIT_AVAILABLE = njit is not None
+
+# Path-dependent withdrawal rules. Each year's withdrawal depends on the balance the path
+# has reached, so the drawdown cannot be vectorized across years.
+#   guardrails    - last year's withdrawal raised by inflation, cut by `adjustment` when the
+#                   withdrawal rate climbs `band` above the initial rate and raised by
+#                   `adjustment` when it falls `band` below it
+#   floor_ceiling - the initial withdrawal rate applied to the current balance, kept between
+#                   `floor` and `ceiling` times the inflation-adjusted initial withdrawal
+WITHDRAWAL_RULES = ('guardrails', 'floor_ceiling')
+GUARDRAILS, FLOOR_CEILING = 0, 1
+
+
+# One path at a time, one year at a time; compiled with numba when it is installed. The
+# arithmetic mirrors _drawdown_numpy operation for operation so both give identical results.
+# Balances stay NumPy floats, so a withdrawal rate on an emptied path is inf (as in the
+# vectorized kernel and under numba's numpy error model) rather than a ZeroDivisionError
+# when the loop runs as plain Python.
+def _drawdown_loop(start, growth, initial_withdrawal, inflation, rule, upper, lower, cut, boost,
+                   floor, ceiling, out, withdrawals, depleted_at):
+    n_paths, n_years = growth.shape
+    for p in range(n_paths):
+        balance = np.float64(start[p])
+        initial_rate = initial_withdrawal / balance if balance > 0 else 0.0
+        withdrawal = initial_withdrawal
+        index = 1.0
+        out[p, 0] = balance
+        depleted_at[p] = -1
+        for t in range(n_years):
+            if rule == GUARDRAILS:
+                if t > 0:
+                    withdrawal = withdrawal * inflation
+                    rate = withdrawal / balance
+                    if rate > initial_rate * upper:
+                        withdrawal = withdrawal * cut
+                    elif rate < initial_rate * lower:
+                        withdrawal = withdrawal * boost
+            else:
+                if t > 0:
+                    index = index * inflation
+                target = initial_withdrawal * index
+                withdrawal = min(max(balance * initial_rate, target * floor), target * ceiling)
+            balance = balance * growth[p, t] - withdrawal
+            if balance < 0:
+                if depleted_at[p] < 0:
+                    depleted_at[p] = t + 1
+                balance = np.float64(0.0)
+            withdrawals[p, t] = withdrawal
+            out[p, t + 1] = balance
+
+
+_drawdown_jit = njit(cache=True, error_model='numpy')(_drawdown_loop) if JIT_AVAILABLE else None
+
+
+# The same rules vectorized across paths, with a loop over years
+def _drawdown_numpy(start, growth, initial_withdrawal, inflation, rule, upper, lower, cut, boost,
+                    floor, ceiling, out, withdrawals, depleted_at):
+    n_paths, n_years = growth.shape
+    balance = start.astype(np.float64)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        initial_rate = np.where(balance > 0, initial_withdrawal / balance, 0.0)
+    withdrawal = np.full(n_paths, initial_withdrawal)
+    index = 1.0
+    out[:, 0] = balance
+    depleted_at[:] = -1
+    for t in range(n_years):
+        if rule == GUARDRAILS:
+            if t > 0:
+                withdrawal = withdrawal * inflation
+                with np.errstate(divide='ignore', invalid='ignore'):
+                    rate = withdrawal / balance
+                withdrawal = np.where(rate > initial_rate * upper, withdrawal * cut,
+                                      np.where(rate < initial_rate * lower, withdrawal * boost, withdrawal))
+        else:
+            if t > 0:
+                index = index * inflation
+            target = initial_withdrawal * index
+            withdrawal = np.minimum(np.maximum(balance * initial_rate, target * floor), target * ceiling)
+        balance = balance * growth[:, t] - withdrawal
+        depleted_at[(balance < 0) & (depleted_at < 0)] = t + 1
+        balance = np.maximum(balance, 0.0)
+        withdrawals[:, t] = withdrawal
+        out[:, t + 1] = balance
+
+
+# Retirement drawdown under a path-dependent rule, from per-path balances at retirement over
+# paths x years of growth factors. `initial_withdrawal` is the first year's withdrawal and
+# `inflation_rate` (%) indexes later ones. Balances are written to `out` (paths x years + 1)
+# when given; the arithmetic is always float64. `use_jit` picks the kernel: None uses numba
+# when it is installed. Returns balances, withdrawals and the per-path balance index at which
+# savings first ran out (-1 if they never did), as roll_forward does.
+def drawdown(start, growth, initial_withdrawal, inflation_rate, rule='guardrails', band=0.2,
+             adjustment=0.1, floor=0.9, ceiling=1.2, out=None, use_jit=None):
+    if rule not in WITHDRAWAL_RULES:
+        raise ValueError(f"Unknown withdrawal rule {rule!r}; expected one of {WITHDRAWAL_RULES}")
+    if use_jit and not JIT_AVAILABLE:
+        raise RuntimeError("numba is not installed")
+    growth = np.atleast_2d(growth)
+    n_paths, n_years = growth.shape
+    start = np.broadcast_to(np.asarray(start, dtype=np.float64), (n_paths,))
+    if out is None:
+        out = np.empty((n_paths, n_years + 1))
+    withdrawals = np.empty((n_paths, n_years))
+    depleted_at = np.empty(n_paths, dtype=np.int64)
+
+    kernel = _drawdown_jit if (JIT_AVAILABLE if use_jit is None else use_jit) else _drawdown_numpy
+    kernel(np.ascontiguousarray(start), growth, float(initial_withdrawal), 1 + inflation_rate / 100,
+           WITHDRAWAL_RULES.index(rule), 1 + band, 1 - band, 1 - adjustment, 1 + adjustment,
+           float(floor), float(ceiling), out, withdrawals, depleted_at)
+    return out, withdrawals, depleted_at
+
+
+# Time the NumPy and JIT kernels on the same draws and check that they agree exactly. The
+# first JIT call (compilation, or loading numba's on-disk cache) is timed separately.
+def benchmark(n_paths=100000, n_years=30, repeat=5, seed=0):
+    rng = np.random.default_rng(seed)
+    growth = np.maximum(1 + rng.normal(0.07, 0.15, (n_paths, n_years)), 0)
+    start = rng.uniform(500000, 1500000, n_paths)
+    report = {'n_paths': n_paths, 'n_years': n_years, 'jit_available': JIT_AVAILABLE}
+
+    for rule in WITHDRAWAL_RULES:
+        timings = {}
+        kernels = (False, True) if JIT_AVAILABLE else (False,)
+        results = {}
+        for use_jit in kernels:
+            name = 'jit' if use_jit else 'numpy'
+            if use_jit:
+                first = time.perf_counter()
+                drawdown(start[:10], growth[:10], 45000, 2.5, rule, use_jit=True)
+                timings['jit_first_call'] = time.perf_counter() - first
+            best = np.inf
+            for _ in range(repeat):
+                begin = time.perf_counter()
+                results[name] = drawdown(start, growth, 45000, 2.5, rule, use_jit=use_jit)
+                best = min(best, time.perf_counter() - begin)
+            timings[name] = best
+        if JIT_AVAILABLE:
+            timings['speedup'] = timings['numpy'] / timings['jit']
+            timings['identical'] = all(np.array_equal(a, b) for a, b in zip(results['numpy'], results['jit']))
+        report[rule] = timings
+    return report
+
+
+if __name__ == "__main__":
+    report = benchmark()
+    print(f"{report['n_paths']:,} paths x {report['n_years']} years, numba "
+          f"{'available' if report['jit_available'] else 'not installed'}")
+    for rule in WITHDRAWAL_RULES:
+        timings = report[rule]
+        line = f"{rule:>14}: numpy {timings['numpy'] * 1000:8.1f} ms"
+        if 'jit' in timings:
+            line += (f", jit {timings['jit'] * 1000:8.1f} ms ({timings['speedup']:.1f}x, "
+                     f"first call {timings['jit_first_call']:.2f} s), identical: {timings['identical']}")
+        print(line)